@@ -4,14 +4,76 @@ Main file application
 from flask import Flask, render_template
 from config import Config
 from models import db
+from services import engine_profile
+from services.metrics import metrics
+from services.admission import admission
+from services.profiler import profiler
+from services.progress import progress_store
+from services.shards import shards
+from services.user_cache import user_cache
+from services.click_buffer import click_buffer
+from services.archive import user_archive
+from services.achievement_jobs import achievement_jobs
+from services import economy, achievement_service, schema
+from services.leaderboard import leaderboard
+from services.events import events
+from services.assets import assets
 from routes import register_routes
 
 # Создаем приложение
 app = Flask(__name__)
 app.config.from_object(Config)
 
-# Инициализируем базу данных
+# Инициализируем базу данных: пулы и прагмы SQLite, затем движки
+engine_profile.configure(app)
 db.init_app(app)
+engine_profile.init_app(app, db)
+
+# Шарды игроков по файлам SQLite (SHARD_COUNT > 1)
+shards.init_app(app)
+
+# Миграции схемы (flask db ...)
+schema.init_app(app)
+
+# Метрики запросов и SQL для /metrics
+metrics.init_app(app)
+
+# Контроль допуска: лимиты частоты и числа запросов (после метрик:
+# отказы тоже считаются)
+admission.init_app(app)
+
+# Профилирование запросов по выборке (выключено по умолчанию)
+profiler.init_app(app)
+
+# Кэш горячих пользователей (после метрик: счетчики попаданий)
+user_cache.init_app(app)
+
+# Режим хранения прогресса (строки или упакованная колонка)
+progress_store.init_app(app)
+
+# Буфер кликов с пакетной записью в базу
+click_buffer.init_app(app)
+
+# Архив неактивных игроков (фоновый проход и flask archive)
+user_archive.init_app(app)
+
+# CLI-команды сервиса экономики
+economy.init_app(app)
+
+# Кэш водяных знаков достижений
+achievement_service.init_app(app)
+
+# Проверка достижений в пуле потоков (ACHIEVEMENT_EVALUATION = 'async')
+achievement_jobs.init_app(app)
+
+# Таблица лидеров в памяти
+leaderboard.init_app(app)
+
+# Поток событий для клиентов (SSE)
+events.init_app(app)
+
+# Собранная статика (flask assets build) и asset_url в шаблонах
+assets.init_app(app)
 
 # Регистрируем все роуты
 register_routes(app)
@@ -20,11 +82,18 @@ register_routes(app)
 # HTML страница
 @app.route('/')
 def index():
+    # Собранная страница отдается готовым файлом, без рендеринга и сжатия
+    if assets.has_index:
+        response = assets.send('index.html')
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     return render_template('index.html')
 
-# Создание таблиц при запуске
-with app.app_context():
-    db.create_all()
+# Создание и обновление схемы по миграциям при запуске
+# (в ASGI-режиме - при старте цикла событий, см. services.asgi_bridge)
+if app.config['SCHEMA_AUTO_UPGRADE'] and not app.config['ASYNC_DATABASE']:
+    with app.app_context():
+        schema.upgrade_schema()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,15 @@
+"""
+Точка входа ASGI: blueprint'ы в цикле событий, база через aiosqlite
+
+    uvicorn asgi:application --workers 4
+
+Потоковый режим (python app.py, WSGI-серверы) по-прежнему использует app.
+"""
+import os
+
+os.environ.setdefault('ASYNC_DATABASE', '1')
+
+from app import app
+from services.asgi_bridge import AsgiBridge
+
+application = AsgiBridge(app)
@@ -0,0 +1,4 @@
+"""
+Бенчмарки бэкенда. Запуск из каталога backend:
+    python -m benchmarks.<имя_модуля> --help
+"""
@@ -0,0 +1,239 @@
+"""
+Потоковый (WSGI) и ASGI-режим: сколько подключений держит одно ядро
+
+Для каждого числа одновременных подключений из --connections
+поднимает сервер в отдельном процессе на свежей базе:
+
+    threaded - Werkzeug, поток на подключение, драйвер sqlite3
+    asgi     - uvicorn с asgi:application, цикл событий, aiosqlite
+
+Каждое подключение - игрок: загрузка состояния, затем клики и опрос
+состояния с If-None-Match без пауз (uvicorn держит keep-alive, Werkzeug
+закрывает подключение после ответа, и http.client переподключается).
+По завершении печатаются пропускная способность, задержки p50/p99,
+процессорное время сервера, запросы на секунду процессора (сколько
+нагрузки держит одно ядро) и пиковое число потоков сервера.
+
+    python -m benchmarks.asgi_bench --connections 16 64 256 --duration 20
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.load_test import percentile
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = ('threaded', 'asgi')
+
+
+def serve(mode, port):
+    """Запустить сервер режима mode (в процессе бенчмарка-потомка)"""
+    import logging
+
+    sys.path.insert(0, BACKEND)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    if mode == 'asgi':
+        import uvicorn
+        uvicorn.run('asgi:application', host='127.0.0.1', port=port,
+                    lifespan='on', log_level='warning', access_log=False)
+        return
+
+    from werkzeug.serving import make_server
+    from app import app
+
+    make_server('127.0.0.1', port, app, threaded=True).serve_forever()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(port, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'server exited with code {process.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('server did not start')
+
+
+def server_cpu_seconds(pid):
+    """Процессорное время процесса (user + system) из /proc"""
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def server_threads(pid):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('Threads:'):
+                return int(line.split()[1])
+    return 0
+
+
+class Player(threading.Thread):
+    """Игрок на одном HTTP-подключении"""
+
+    def __init__(self, port, deadline, barrier):
+        super().__init__(daemon=True)
+        self.port = port
+        self.deadline = deadline
+        self.barrier = barrier
+        self.latencies = []
+        self.errors = 0
+
+    def _request(self, conn, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+
+        start = time.perf_counter()
+        conn.request(method, path, body=payload, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        self.latencies.append(time.perf_counter() - start)
+        if response.status >= 500:
+            self.errors += 1
+
+        cookie = response.getheader('Set-Cookie')
+        if cookie:
+            self.cookie = cookie.split(';', 1)[0]
+        return response
+
+    def run(self):
+        self.cookie = None
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        try:
+            etag = self._request(conn, 'GET', '/api/user/state').getheader('ETag')
+            self.barrier.wait()
+            while time.monotonic() < self.deadline:
+                self._request(conn, 'POST', '/api/user/click', {'clickPower': 5})
+                response = self._request(conn, 'GET', '/api/user/state',
+                                         headers={'If-None-Match': etag or ''})
+                etag = response.getheader('ETag') or etag
+        except (OSError, http.client.HTTPException):
+            self.errors += 1
+        finally:
+            conn.close()
+
+
+def measure(mode, connections, duration):
+    """
+        Один прогон: сервер режима mode и connections игроков
+        Returns:
+            dict: Строка отчета
+    """
+    port = free_port()
+    env = dict(os.environ)
+    env['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'asgi_bench.db')
+    env['ASYNC_DATABASE'] = '1' if mode == 'asgi' else '0'
+    env.setdefault('ADMISSION_CONTROL', '0')
+    env['PYTHONPATH'] = BACKEND + os.pathsep + env.get('PYTHONPATH', '')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.asgi_bench', 'serve', '--mode', mode, '--port', str(port)],
+        cwd=BACKEND, env=env,
+    )
+    try:
+        wait_ready(port, process)
+        # Все игроки создаются до замера, затем стартуют одновременно
+        barrier = threading.Barrier(connections + 1)
+        players = [Player(port, float('inf'), barrier) for _ in range(connections)]
+        for player in players:
+            player.start()
+        barrier.wait()
+
+        cpu_before = server_cpu_seconds(process.pid)
+        started = time.perf_counter()
+        deadline = time.monotonic() + duration
+        for player in players:
+            player.deadline = deadline
+        for player in players:
+            player.latencies = []
+
+        peak_threads = 0
+        while any(player.is_alive() for player in players):
+            peak_threads = max(peak_threads, server_threads(process.pid))
+            time.sleep(0.2)
+        elapsed = time.perf_counter() - started
+        cpu = server_cpu_seconds(process.pid) - cpu_before
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    latencies = sorted(latency for player in players for latency in player.latencies)
+    requests = len(latencies)
+    return {
+        'mode': mode,
+        'connections': connections,
+        'requests': requests,
+        'errors': sum(player.errors for player in players),
+        'rps': round(requests / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'server_cpu_s': round(cpu, 2),
+        'rps_per_core': round(requests / cpu, 1) if cpu else 0,
+        'peak_threads': peak_threads,
+    }
+
+
+def print_table(rows):
+    columns = ('mode', 'connections', 'requests', 'errors', 'rps', 'p50_ms',
+               'p99_ms', 'server_cpu_s', 'rps_per_core', 'peak_threads')
+    print(' '.join(f'{name:>12}' for name in columns))
+    for row in rows:
+        print(' '.join(f'{row[name]!s:>12}' for name in columns))
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        parser = argparse.ArgumentParser()
+        parser.add_argument('command')
+        parser.add_argument('--mode', choices=MODES, required=True)
+        parser.add_argument('--port', type=int, required=True)
+        args = parser.parse_args()
+        serve(args.mode, args.port)
+        return
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--connections', type=int, nargs='+', default=[16, 64, 256])
+    parser.add_argument('--duration', type=float, default=20, help='секунд на прогон')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    parser.add_argument('--output', help='JSON-файл для результата')
+    args = parser.parse_args()
+
+    rows = []
+    for connections in args.connections:
+        for mode in args.modes:
+            print(f'== {mode}, {connections} connections', flush=True)
+            rows.append(measure(mode, connections, args.duration))
+    print()
+    print_table(rows)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+        print(f'saved to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
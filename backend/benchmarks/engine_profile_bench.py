@@ -0,0 +1,47 @@
+"""
+Сравнение профиля движка SQLite с настройками по умолчанию
+
+Запускает нагрузочный тест дважды на свежих базах: сначала с
+SQLITE_ENGINE_PROFILE=false (как было: журнал DELETE, без пулов и
+прагм), затем с профилем, и печатает разницу по endpoint'ам.
+
+    python -m benchmarks.engine_profile_bench --players 300 --concurrency 16
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--players', type=int, default=300)
+    parser.add_argument('--duration', type=float, default=60)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--mode', choices=('client', 'server'), default='server')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    baseline = os.path.join(workdir, 'default.json')
+    common = [
+        sys.executable, '-m', 'benchmarks.load_test',
+        '--players', str(args.players), '--duration', str(args.duration),
+        '--concurrency', str(args.concurrency), '--mode', args.mode,
+    ]
+
+    print('== default engine settings')
+    subprocess.run(common + [
+        '--database', 'sqlite:///' + os.path.join(workdir, 'default.db'),
+        '--config', 'SQLITE_ENGINE_PROFILE=false', '--output', baseline,
+    ], check=True)
+
+    print('\n== SQLite engine profile')
+    subprocess.run(common + [
+        '--database', 'sqlite:///' + os.path.join(workdir, 'profile.db'),
+        '--output', os.path.join(workdir, 'profile.json'), '--compare', baseline,
+    ], check=True)
+
+
+if __name__ == '__main__':
+    main()
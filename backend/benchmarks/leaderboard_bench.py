@@ -0,0 +1,72 @@
+"""
+Бенчмарк индекса таблицы лидеров
+
+Строит индекс на N игроков (по умолчанию 1 000 000), затем измеряет
+обновления счета, запросы места игрока и выборки топа.
+
+    python -m benchmarks.leaderboard_bench --users 1000000 --ops 100000
+"""
+import argparse
+import random
+import time
+
+from services.leaderboard import RankedSkipList
+
+
+def _timed(label, ops, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    per_op = elapsed / ops * 1e6 if ops else 0
+    print(f'{label:<28} {elapsed:8.3f} s  {per_op:8.2f} us/op')
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=1_000_000)
+    parser.add_argument('--ops', type=int, default=100_000)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+    scores = {user_id: rng.randint(0, 10_000_000) for user_id in range(1, args.users + 1)}
+    index = None
+
+    def build():
+        nonlocal index
+        keys = sorted((-score, user_id) for user_id, score in scores.items())
+        index = RankedSkipList.from_sorted(keys)
+
+    print(f'users={args.users} ops={args.ops}')
+    _timed('build (sort + from_sorted)', args.users, build)
+
+    user_ids = [rng.randint(1, args.users) for _ in range(args.ops)]
+
+    def updates():
+        for user_id in user_ids:
+            old = scores[user_id]
+            new = old + rng.randint(1, 1000)
+            index.remove((-old, user_id))
+            index.insert((-new, user_id))
+            scores[user_id] = new
+
+    def ranks():
+        for user_id in user_ids:
+            index.index((-scores[user_id], user_id))
+
+    def tops():
+        for _ in range(args.ops):
+            index.slice(0, args.top)
+
+    _timed('update score (remove+insert)', args.ops, updates)
+    _timed('rank of user', args.ops, ranks)
+    _timed(f'top {args.top}', args.ops, tops)
+
+    assert len(index) == args.users
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,501 @@
+"""
+Нагрузочный тест: N игроков, которые ведут себя как game.js
+
+Каждый игрок загружает /api/user/state, раз в 5 секунд отправляет
+накопленные клики, раз в 30 секунд опрашивает состояние с If-None-Match
+и покупает улучшения и скины, когда хватает очков. Время виртуальное:
+при --speed 0 (по умолчанию) события выполняются без пауз в порядке
+расписания, при --speed 1 - в реальном времени.
+
+Для каждого endpoint считаются пропускная способность, задержки
+p50/p95/p99 и SQL-запросы на запрос. Результат пишется в JSON, который
+можно сравнить с прошлым прогоном через --compare. С --batch клики
+и покупки уходят одним пакетом /api/user/actions, как в game.js.
+
+    python -m benchmarks.load_test --players 1000 --duration 120 --output after.json
+    python -m benchmarks.load_test --mode server --compare before.json
+    python -m benchmarks.load_test --batch --compare before.json
+"""
+import argparse
+import heapq
+import http.client
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+# Интервалы из game.js, в секундах
+CLICK_FLUSH_INTERVAL = 5
+STATE_SYNC_INTERVAL = 30
+
+
+def percentile(sorted_values, fraction):
+    """Перцентиль по ближайшему рангу"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+class QueryCounter:
+    """
+    Счетчик SQL-запросов: внутри запроса - на поток, вне запросов -
+    общий счетчик фоновых задач (запись буфера кликов и т.п.)
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.background = 0
+
+    def start(self):
+        self._local.count = 0
+
+    def stop(self):
+        count = getattr(self._local, 'count', None)
+        self._local.count = None
+        return count or 0
+
+    def on_execute(self, *args, **kwargs):
+        if getattr(self._local, 'count', None) is not None:
+            self._local.count += 1
+        else:
+            with self._lock:
+                self.background += 1
+
+
+class Stats:
+    """Задержки, ошибки и SQL-запросы по endpoint"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints = {}
+
+    def record(self, endpoint, latency, ok, queries):
+        with self._lock:
+            entry = self.endpoints.setdefault(
+                endpoint, {'latencies': [], 'errors': 0, 'queries': 0}
+            )
+            entry['latencies'].append(latency)
+            entry['queries'] += queries
+            if not ok:
+                entry['errors'] += 1
+
+    def summary(self, elapsed):
+        result = {}
+        for endpoint, entry in sorted(self.endpoints.items()):
+            latencies = sorted(entry['latencies'])
+            count = len(latencies)
+            result[endpoint] = {
+                'count': count,
+                'errors': entry['errors'],
+                'throughput_rps': round(count / elapsed, 2) if elapsed else 0,
+                'mean_ms': round(sum(latencies) / count * 1000, 3) if count else 0,
+                'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+                'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+                'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+                'queries_per_request': round(entry['queries'] / count, 3) if count else 0,
+            }
+        return result
+
+
+def instrument(app, db, counter):
+    """
+        Подключить к приложению подсчет SQL-запросов.
+        Число запросов и имя endpoint возвращаются в заголовках ответа,
+        поэтому одинаково работают тестовый клиент и живой сервер.
+    """
+    from flask import request
+    from sqlalchemy import event
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', counter.on_execute)
+
+    @app.before_request
+    def _bench_start():
+        counter.start()
+
+    @app.after_request
+    def _bench_finish(response):
+        response.headers['X-Bench-Queries'] = str(counter.stop())
+        response.headers['X-Bench-Endpoint'] = request.endpoint or request.path
+        return response
+
+
+class TestClientTransport:
+    """Запросы через app.test_client(): свой клиент (и cookie) у игрока"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def session(self):
+        return self.app.test_client()
+
+    def request(self, client, method, path, body=None, headers=None):
+        response = client.open(path, method=method, json=body, headers=headers or {})
+        data = response.get_json(silent=True) if response.status_code != 304 else None
+        return response.status_code, response.headers, data
+
+
+class _HttpSession:
+    def __init__(self):
+        self.cookie = None
+
+
+class ServerTransport:
+    """Запросы к локальному Werkzeug-серверу по HTTP"""
+
+    def __init__(self, app, threads=True):
+        from werkzeug.serving import make_server
+
+        # Журнал каждого запроса искажает замер и засоряет вывод
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        self.server = make_server('127.0.0.1', 0, app, threaded=threads)
+        self.port = self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+
+    def session(self):
+        return _HttpSession()
+
+    def request(self, session, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        if session.cookie:
+            headers['Cookie'] = session.cookie
+
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+        try:
+            conn.request(method, path, body=payload, headers=headers)
+            response = conn.getresponse()
+            raw = response.read()
+            response_headers = {k: v for k, v in response.getheaders()}
+        finally:
+            conn.close()
+
+        cookie = response_headers.get('Set-Cookie')
+        if cookie:
+            session.cookie = cookie.split(';', 1)[0]
+        data = None
+        if raw and response.status != 304:
+            try:
+                data = json.loads(raw)
+            except ValueError:
+                pass
+        return response.status, response_headers, data
+
+
+class Player:
+    """
+    Игрок с поведением game.js. Счет и цены берет из ответов сервера.
+    """
+
+    def __init__(self, player_id, rng, transport, stats, args, catalog):
+        self.player_id = player_id
+        self.rng = rng
+        self.transport = transport
+        self.stats = stats
+        self.args = args
+        self.session = transport.session()
+
+        self.etag = None
+        self.score = 0
+        self.catalog = catalog
+        self.costs = {t['name']: t['baseCost'] for t in catalog.upgrades}
+        self.skins = {t['id']: t['base_cost'] for t in catalog.skins if t['base_cost'] > 0}
+
+        # Первый запрос - загрузка страницы, клики разнесены по времени
+        self.next_state = 0.0
+        self.next_click = rng.uniform(0, CLICK_FLUSH_INTERVAL)
+
+    def next_time(self):
+        return min(self.next_state, self.next_click)
+
+    def _call(self, method, path, body=None, headers=None):
+        start = time.perf_counter()
+        try:
+            status, response_headers, data = self.transport.request(
+                self.session, method, path, body, headers
+            )
+        except Exception:
+            self.stats.record(f'{method} {path}', time.perf_counter() - start, False, 0)
+            return None, {}, None
+        latency = time.perf_counter() - start
+
+        endpoint = response_headers.get('X-Bench-Endpoint') or path
+        queries = int(response_headers.get('X-Bench-Queries') or 0)
+        # 4xx - ожидаемые отказы (например, не хватило очков), ошибки - 5xx
+        self.stats.record(endpoint, latency, status < 500, queries)
+        return status, response_headers, data
+
+    def step(self):
+        """Выполнить ближайшее по расписанию действие"""
+        if self.next_state <= self.next_click:
+            self.sync_state()
+            self.next_state += STATE_SYNC_INTERVAL
+        else:
+            self.flush_clicks()
+            self.next_click += CLICK_FLUSH_INTERVAL
+
+    def sync_state(self):
+        headers = {'If-None-Match': self.etag} if self.etag else {}
+        status, response_headers, data = self._call('GET', '/api/user/state', headers=headers)
+        if status == 200 and data:
+            self.etag = response_headers.get('ETag')
+            self.score = data['score']
+            for upgrade in data['upgrades']:
+                name = self.catalog.upgrades.by_id[upgrade['upgrade_id']]['name']
+                self.costs[name] = upgrade['current_cost']
+            for skin_id in data['skins']:
+                self.skins.pop(skin_id, None)
+
+    def flush_clicks(self):
+        clicks = max(1, int(self.rng.gauss(self.args.click_rate, 1) * CLICK_FLUSH_INTERVAL))
+        if self.args.batch:
+            self.send_actions(clicks)
+            return
+        status, _, data = self._call('POST', '/api/user/click', {'clickPower': clicks})
+        if status == 200 and data:
+            self.score = data['score']
+        self.shop()
+
+    def shop(self):
+        """Купить самое дешевое доступное улучшение и иногда скин"""
+        name, cost = min(self.costs.items(), key=lambda item: item[1])
+        if self.score >= cost:
+            status, _, data = self._call('POST', '/api/upgrades/buy', {'name': name})
+            if status == 200 and data:
+                self.score = data['score']
+                self.costs[name] = data['upgrade']['current_cost']
+
+        affordable = [skin_id for skin_id, cost in self.skins.items() if cost <= self.score]
+        if affordable and self.rng.random() < self.args.skin_chance:
+            skin_id = self.rng.choice(affordable)
+            status, _, data = self._call('POST', '/api/skins/buy', {'skin_id': skin_id})
+            if status == 200 and data:
+                self.score = data['score']
+                self.skins.pop(skin_id, None)
+                self._call('POST', '/api/skins/activate', {'skin_id': skin_id})
+
+    def send_actions(self, clicks):
+        """Клики и покупки одним запросом /api/user/actions"""
+        self.score += clicks
+        actions = [{'type': 'click', 'clickPower': clicks}]
+
+        name, cost = min(self.costs.items(), key=lambda item: item[1])
+        if self.score >= cost:
+            actions.append({'type': 'buy_upgrade', 'name': name})
+
+        affordable = [skin_id for skin_id, cost in self.skins.items() if cost <= self.score]
+        if affordable and self.rng.random() < self.args.skin_chance:
+            skin_id = self.rng.choice(affordable)
+            actions.append({'type': 'buy_skin', 'skin_id': skin_id})
+            actions.append({'type': 'activate_skin', 'skin_id': skin_id})
+
+        status, _, data = self._call('POST', '/api/user/actions', {'actions': actions})
+        if status != 200 or not data:
+            return
+        for action, result in zip(actions, data['results']):
+            if not result['success']:
+                continue
+            if action['type'] == 'buy_upgrade':
+                self.costs[action['name']] = result['upgrade']['current_cost']
+            elif action['type'] == 'buy_skin':
+                self.skins.pop(action['skin_id'], None)
+        self.score = data['state']['score']
+
+
+def run(players, args):
+    """
+        Выполнить расписание игроков в args.concurrency потоков
+        Returns:
+            float: Время прогона в секундах
+    """
+    queue = [(player.next_time(), player.player_id, player) for player in players]
+    heapq.heapify(queue)
+    lock = threading.Lock()
+    start = time.perf_counter()
+
+    def worker():
+        while True:
+            with lock:
+                if not queue:
+                    return
+                at, player_id, player = heapq.heappop(queue)
+            if at > args.duration:
+                continue
+            if args.speed > 0:
+                delay = start + at / args.speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            player.step()
+            with lock:
+                heapq.heappush(queue, (player.next_time(), player_id, player))
+
+    threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline):
+    """Напечатать изменения p50/p95/p99 и запросов относительно baseline"""
+    print(f"\ncompare with {baseline['meta'].get('revision')} ({baseline['meta'].get('timestamp')})")
+    for endpoint, now in current['endpoints'].items():
+        before = baseline['endpoints'].get(endpoint)
+        if not before:
+            print(f'{endpoint:<32} new')
+            continue
+        parts = []
+        for key in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request'):
+            old, new = before.get(key, 0), now[key]
+            change = f'{(new - old) / old * 100:+.1f}%' if old else 'n/a'
+            parts.append(f'{key}={new} ({change})')
+        print(f'{endpoint:<32} ' + '  '.join(parts))
+
+
+def print_report(result):
+    meta = result['meta']
+    print(
+        f"players={meta['players']} duration={meta['duration']}s mode={meta['mode']} "
+        f"concurrency={meta['concurrency']} elapsed={meta['elapsed_s']}s"
+    )
+    print(f"{'endpoint':<32} {'count':>7} {'err':>5} {'rps':>9} {'p50':>8} {'p95':>8} {'p99':>8} {'sql/req':>8}")
+    for endpoint, row in result['endpoints'].items():
+        print(
+            f"{endpoint:<32} {row['count']:>7} {row['errors']:>5} {row['throughput_rps']:>9} "
+            f"{row['p50_ms']:>8} {row['p95_ms']:>8} {row['p99_ms']:>8} {row['queries_per_request']:>8}"
+        )
+    totals = result['totals']
+    print(
+        f"total: {totals['requests']} requests, {totals['throughput_rps']} req/s, "
+        f"{totals['background_queries']} background queries"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--players', type=int, default=1000)
+    parser.add_argument('--duration', type=float, default=60, help='виртуальные секунды игры')
+    parser.add_argument('--mode', choices=('client', 'server'), default='client')
+    parser.add_argument('--concurrency', type=int, default=8, help='потоки-клиенты')
+    parser.add_argument('--speed', type=float, default=0,
+                        help='виртуальных секунд за секунду (0 - без пауз)')
+    parser.add_argument('--click-rate', type=float, default=4, help='кликов в секунду')
+    parser.add_argument('--skin-chance', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--batch', action='store_true',
+                        help='клики и покупки пакетом /api/user/actions')
+    parser.add_argument('--database', help='URL базы (по умолчанию временный SQLite-файл)')
+    parser.add_argument('--config', action='append', default=[], metavar='KEY=VALUE',
+                        help='переопределить настройку Config (значение - JSON или строка)')
+    parser.add_argument('--output', help='JSON-файл для результата')
+    parser.add_argument('--compare', help='JSON прошлого прогона для сравнения')
+    args = parser.parse_args()
+
+    # Базу нужно выбрать до импорта приложения: оно создает таблицы при импорте
+    database = args.database or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'load_test.db')
+    os.environ['DATABASE_URL'] = database
+
+    # Прогон измеряет сервер, а не лимиты частоты (ADMISSION_CONTROL=1 - с ними)
+    os.environ.setdefault('ADMISSION_CONTROL', '0')
+    import config
+    overrides = {}
+    for item in args.config:
+        key, _, value = item.partition('=')
+        try:
+            overrides[key] = json.loads(value)
+        except ValueError:
+            overrides[key] = value
+        setattr(config.Config, key, overrides[key])
+
+    from app import app
+    from models import db
+    from services.click_buffer import click_buffer
+    from services.catalog import catalog
+
+    counter = QueryCounter()
+    instrument(app, db, counter)
+    stats = Stats()
+
+    if args.mode == 'server':
+        transport = ServerTransport(app)
+    else:
+        transport = TestClientTransport(app)
+
+    rng = random.Random(args.seed)
+    players = [
+        Player(i, random.Random(rng.random()), transport, stats, args, catalog)
+        for i in range(args.players)
+    ]
+
+    elapsed = run(players, args)
+    click_buffer.flush()
+    if args.mode == 'server':
+        transport.close()
+
+    endpoints = stats.summary(elapsed)
+    requests_total = sum(row['count'] for row in endpoints.values())
+    result = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'database': database.split(':', 1)[0],
+            'players': args.players,
+            'duration': args.duration,
+            'mode': args.mode,
+            'concurrency': args.concurrency,
+            'speed': args.speed,
+            'seed': args.seed,
+            'batch': args.batch,
+            'config': overrides,
+            'elapsed_s': round(elapsed, 3),
+        },
+        'endpoints': endpoints,
+        'totals': {
+            'requests': requests_total,
+            'errors': sum(row['errors'] for row in endpoints.values()),
+            'throughput_rps': round(requests_total / elapsed, 2) if elapsed else 0,
+            'background_queries': counter.background,
+        },
+    }
+
+    print_report(result)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f'saved to {args.output}')
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(result, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
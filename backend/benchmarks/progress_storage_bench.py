@@ -0,0 +1,49 @@
+"""
+Сравнение реляционного и упакованного хранения прогресса
+
+Запускает нагрузочный тест дважды на свежих базах: сначала с
+PROGRESS_STORAGE=relational (строки upgrades/achievements/skins), затем
+с PROGRESS_STORAGE=packed (одна колонка users.progress), и печатает
+разницу по endpoint'ам - задержки и SQL-запросы на запрос.
+
+    python -m benchmarks.progress_storage_bench --players 300 --concurrency 16
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--players', type=int, default=300)
+    parser.add_argument('--duration', type=float, default=60)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--mode', choices=('client', 'server'), default='server')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    baseline = os.path.join(workdir, 'relational.json')
+    common = [
+        sys.executable, '-m', 'benchmarks.load_test',
+        '--players', str(args.players), '--duration', str(args.duration),
+        '--concurrency', str(args.concurrency), '--mode', args.mode,
+    ]
+
+    print('== relational progress storage')
+    subprocess.run(common + [
+        '--database', 'sqlite:///' + os.path.join(workdir, 'relational.db'),
+        '--config', 'PROGRESS_STORAGE=relational', '--output', baseline,
+    ], check=True)
+
+    print('\n== packed progress storage')
+    subprocess.run(common + [
+        '--database', 'sqlite:///' + os.path.join(workdir, 'packed.db'),
+        '--config', 'PROGRESS_STORAGE=packed',
+        '--output', os.path.join(workdir, 'packed.json'), '--compare', baseline,
+    ], check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+"""
+Стресс-тест списаний: нет ли потерянных обновлений счета
+
+Запускает --workers процессов приложения (как воркеры gunicorn, у
+каждого свой буфер кликов) на одной базе SQLite. Все они играют за
+одного пользователя: кликают, покупают улучшения и скины. После
+остановки сверяется журнал подтвержденных операций с базой:
+
+    score      == клики - цены успешных покупок
+    уровни     == сумма купленных уровней по каждому улучшению
+    per_second == доход по уровням
+    скины      == каждый куплен не больше одного раза
+
+Часы в воркерах остановлены, чтобы автопроизводство не мешало точной
+сверке счета. Код выхода 1, если сверка не сошлась.
+
+    python -m benchmarks.score_stress --workers 16 --operations 300
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FROZEN_NOW = datetime(2026, 1, 1, 12, 0, 0)
+
+
+class FrozenDatetime(datetime):
+    """datetime.now() всегда возвращает FROZEN_NOW"""
+
+    @classmethod
+    def now(cls, tz=None):
+        return FROZEN_NOW
+
+
+def load_app(database, overrides):
+    """Импортировать приложение для базы database"""
+    os.environ['DATABASE_URL'] = database
+    if BACKEND not in sys.path:
+        sys.path.insert(0, BACKEND)
+
+    # Параллельные запросы одного игрока не должны упираться в лимиты частоты
+    os.environ.setdefault('ADMISSION_CONTROL', '0')
+    import config
+    for key, value in overrides.items():
+        setattr(config.Config, key, value)
+
+    import models
+    from services import wallet
+    models.datetime = FrozenDatetime
+    wallet.datetime = FrozenDatetime
+
+    from app import app
+    return app
+
+
+def worker(index, database, cookie, args, overrides, results):
+    app = load_app(database, overrides)
+    from services.catalog import catalog
+    from services.click_buffer import click_buffer
+
+    rng = random.Random(args.seed * 1000 + index)
+    client = app.test_client()
+    client.set_cookie('session', cookie)
+
+    log = {'clicks': 0, 'spent': 0, 'levels': Counter(), 'skins': Counter(),
+           'conflicts': 0, 'errors': 0, 'rejected': 0}
+    upgrades = [t['name'] for t in catalog.upgrades][:3]
+    skins = [t['id'] for t in catalog.skins if t['base_cost'] > 0]
+
+    for _ in range(args.operations):
+        roll = rng.random()
+        if roll < 0.6:
+            power = rng.randint(1, 50)
+            response = client.post('/api/user/click', json={'clickPower': power})
+            if response.status_code == 200:
+                log['clicks'] += power
+        elif roll < 0.95:
+            name = rng.choice(upgrades)
+            quantity = rng.randint(1, 3)
+            response = client.post('/api/upgrades/buy', json={'name': name, 'quantity': quantity})
+            if response.status_code == 200:
+                data = response.get_json()
+                log['spent'] += data['total_cost']
+                log['levels'][name] += data['quantity']
+        else:
+            skin_id = rng.choice(skins)
+            response = client.post('/api/skins/buy', json={'skin_id': skin_id})
+            if response.status_code == 200:
+                log['spent'] += catalog.skins.by_id[skin_id]['base_cost']
+                log['skins'][skin_id] += 1
+
+        if response.status_code == 409:
+            log['conflicts'] += 1
+        elif response.status_code >= 500:
+            log['errors'] += 1
+        elif response.status_code == 400:
+            log['rejected'] += 1
+
+    # Дописываем буфер кликов до выхода процесса
+    click_buffer.shutdown()
+    results.put(log)
+
+
+def run(workers, operations, seed=42, flush_interval=0.05, progress_storage='relational'):
+    """
+        Запустить воркеры на новой базе и сверить журнал с базой
+        Returns:
+            tuple: (проверки {имя: (в базе, ожидается)}, итог журнала, секунд)
+    """
+    args = argparse.Namespace(operations=operations, seed=seed)
+    database = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'stress.db')
+    overrides = {
+        'CLICK_FLUSH_INTERVAL': flush_interval,
+        'PROGRESS_STORAGE': progress_storage,
+        'METRICS_ENABLED': False,
+    }
+
+    ctx = multiprocessing.get_context('spawn')
+    app = load_app(database, overrides)
+    client = app.test_client()
+    user_id = client.get('/api/user/state').get_json()['user_id']
+    cookie = client.get_cookie('session').value
+
+    results = ctx.Queue()
+    processes = [
+        ctx.Process(target=worker, args=(i, database, cookie, args, overrides, results))
+        for i in range(workers)
+    ]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    logs = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+
+    total = {'clicks': 0, 'spent': 0, 'levels': Counter(), 'skins': Counter(),
+             'conflicts': 0, 'errors': 0, 'rejected': 0}
+    for log in logs:
+        for key, value in log.items():
+            total[key] += value
+
+    from models import db, User
+    from services.catalog import catalog
+    from services.progress import progress_store
+    with app.app_context():
+        user = db.session.get(User, user_id)
+        levels = {u.name: u.level for u in progress_store.upgrades(user)}
+        owned = {s.template['id'] for s in progress_store.skins(user)}
+        score, per_second = user.score, user.per_second
+
+    expected_per_second = sum(
+        catalog.upgrades.by_name[name]['baseProduction'] * level for name, level in levels.items()
+    )
+    checks = {
+        'score': (score, total['clicks'] - total['spent']),
+        'levels': (levels, {name: n for name, n in total['levels'].items() if n}),
+        'per_second': (per_second, expected_per_second),
+        'skins': (owned, set(total['skins'])),
+        'skins bought once': (max(total['skins'].values(), default=0) <= 1, True),
+    }
+    return checks, total, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--operations', type=int, default=300, help='запросов на воркер')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--flush-interval', type=float, default=0.05,
+                        help='CLICK_FLUSH_INTERVAL воркеров')
+    parser.add_argument('--progress-storage', choices=('relational', 'packed'), default='relational')
+    args = parser.parse_args()
+
+    checks, total, elapsed = run(
+        args.workers, args.operations, args.seed, args.flush_interval, args.progress_storage
+    )
+
+    print(
+        f"workers={args.workers} operations={args.workers * args.operations} "
+        f"elapsed={elapsed:.1f}s conflicts(409)={total['conflicts']} "
+        f"rejected(400)={total['rejected']} errors(5xx)={total['errors']}"
+    )
+    failed = False
+    for name, (actual, expected) in checks.items():
+        ok = actual == expected
+        failed |= not ok
+        print(f"[{'ok' if ok else 'FAIL'}] {name}: db={actual} expected={expected}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""
+Размер и время сборки ответа /api/user/state: полный снимок и дельта
+
+Создает игрока с купленными улучшениями, скинами и достижениями и для
+каждого сценария опроса --iterations раз запрашивает состояние:
+
+    full        - без since, как раньше (полный снимок)
+    score_only  - since = текущая версия: изменились только счет и доход
+    one_upgrade - since = версия до покупки одного уровня улучшения
+
+Печатает размер тела ответа, время запроса (p50/p99, тестовый клиент
+Flask), время сборки ответа без маршрутизации (чтение прогресса из
+базы и to_dict) и время json.dumps готового ответа.
+
+    python -m benchmarks.state_payload_bench --iterations 2000
+    python -m benchmarks.state_payload_bench --config PROGRESS_STORAGE=packed
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+
+from benchmarks.load_test import percentile
+
+
+def setup_player(client, catalog, quantity):
+    """
+        Игрок поздней стадии игры: все улучшения, скины и достижения
+        Returns:
+            int: Версия состояния после покупок
+    """
+    client.get('/api/user/state')
+    actions = [{'type': 'click', 'clickPower': 10 ** 12}]
+    actions += [
+        {'type': 'buy_upgrade', 'name': t['name'], 'quantity': quantity}
+        for t in catalog.upgrades
+    ]
+    actions += [
+        {'type': 'buy_skin', 'skin_id': t['id']}
+        for t in catalog.skins if t['base_cost'] > 0
+    ]
+    client.post('/api/user/actions', json={'actions': actions})
+    return client.get('/api/user/state').get_json()['version']
+
+
+def measure(client, app, url, since, iterations):
+    """
+        Один сценарий
+        Returns:
+            dict: Строка отчета
+    """
+    from models import db
+    from services.state_service import build_sync, current_score
+    from services.user_service import get_current_user
+
+    latencies = []
+    body = b''
+    for _ in range(iterations):
+        start = time.perf_counter()
+        response = client.get(url)
+        latencies.append(time.perf_counter() - start)
+        body = response.data
+
+    # Сборка и сериализация без маршрутизации и cookie
+    build, serialize = [], []
+    with app.test_request_context(url, headers={'Cookie': client_cookie(client)}):
+        user = get_current_user()
+        score = current_score(user)
+        for _ in range(iterations):
+            # Прогресс читается заново, как в отдельном запросе
+            db.session.expire_all()
+            user.state_version  # Строка users - до замера
+            start = time.perf_counter()
+            state = build_sync(user, score, since)
+            built = time.perf_counter()
+            json.dumps(state)
+            build.append(built - start)
+            serialize.append(time.perf_counter() - built)
+
+    latencies.sort()
+    build.sort()
+    serialize.sort()
+    return {
+        'bytes': len(body),
+        'delta': bool(json.loads(body).get('delta')),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'build_us': round(percentile(build, 0.50) * 1e6, 1),
+        'json_us': round(percentile(serialize, 0.50) * 1e6, 1),
+    }
+
+
+def client_cookie(client):
+    return '; '.join(
+        f'{cookie.key}={cookie.value}' for cookie in client._cookies.values()
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=1000)
+    parser.add_argument('--quantity', type=int, default=50, help='уровней каждого улучшения')
+    parser.add_argument('--config', action='append', default=[], metavar='KEY=VALUE',
+                        help='переопределить настройку Config (значение - JSON или строка)')
+    parser.add_argument('--output', help='JSON-файл для результата')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'state_payload.db')
+    logging.getLogger('alembic').setLevel(logging.WARNING)
+
+    # Прогон измеряет сервер, а не лимиты частоты (ADMISSION_CONTROL=1 - с ними)
+    os.environ.setdefault('ADMISSION_CONTROL', '0')
+    import config
+    for item in args.config:
+        key, _, value = item.partition('=')
+        try:
+            value = json.loads(value)
+        except ValueError:
+            pass
+        setattr(config.Config, key, value)
+
+    from app import app
+    from services.catalog import catalog
+
+    client = app.test_client()
+    version = setup_player(client, catalog, args.quantity)
+    # Еще один уровень первого улучшения: дельта из одного элемента
+    client.post('/api/user/actions', json={'actions': [
+        {'type': 'buy_upgrade', 'name': catalog.upgrades.items[0]['name']}
+    ]})
+    latest = client.get('/api/user/state').get_json()['version']
+
+    scenarios = {
+        'full': ('/api/user/state', None),
+        'score_only': (f'/api/user/state?since={latest}', latest),
+        'one_upgrade': (f'/api/user/state?since={version}', version),
+    }
+    rows = {}
+    for name, (url, since) in scenarios.items():
+        rows[name] = measure(client, app, url, since, args.iterations)
+
+    columns = ('bytes', 'delta', 'p50_ms', 'p99_ms', 'build_us', 'json_us')
+    print(f"{'scenario':<12} " + ' '.join(f'{name:>12}' for name in columns))
+    for name, row in rows.items():
+        print(f'{name:<12} ' + ' '.join(f'{row[column]!s:>12}' for column in columns))
+    full = rows['full']
+    for name, row in rows.items():
+        if name != 'full':
+            print(f"{name}: {row['bytes'] / full['bytes']:.1%} of full payload, "
+                  f"build x{full['build_us'] / max(row['build_us'], 0.1):.1f}, "
+                  f"json x{full['json_us'] / max(row['json_us'], 0.1):.1f} faster")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+        print(f'saved to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -9,8 +9,155 @@ class Config:
 
     # База данных
     basedir = os.path.abspath(os.path.dirname(__file__))
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(basedir, 'clicker_game.db')
+    # DATABASE_URL позволяет подменить базу (например, для бенчмарков)
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or (
+        'sqlite:///' + os.path.join(basedir, 'clicker_game.db')
+    )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Асинхронные движки (aiosqlite) для ASGI-режима: asgi.py включает сам
+    ASYNC_DATABASE = os.environ.get('ASYNC_DATABASE', '0') == '1'
+
+    # Профиль SQLite: WAL, busy_timeout, прагмы и пулы соединений
+    # (False - настройки движка по умолчанию)
+    SQLITE_ENGINE_PROFILE = True
+    SQLITE_JOURNAL_MODE = 'WAL'
+    # Сколько миллисекунд ждать освобождения блокировки записи
+    SQLITE_BUSY_TIMEOUT = 5000
+    # NORMAL в режиме WAL не теряет целостность, только последние коммиты при сбое ОС
+    SQLITE_SYNCHRONOUS = 'NORMAL'
+    SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+    # Свободные страницы возвращаются файлу архивацией (services.archive)
+    SQLITE_AUTO_VACUUM = 'INCREMENTAL'
+    SQLITE_POOL_SIZE = 10
+    SQLITE_MAX_OVERFLOW = 10
+    SQLITE_POOL_TIMEOUT = 30
+    # Пул только для чтения для endpoint'ов с @read_only (0 - не использовать)
+    SQLITE_READ_POOL_SIZE = 10
+
+    # Шарды игроков: файлы <имя>-shard<N>.db рядом с основной базой
+    # (1 - без шардирования, перенос корзин - flask shards rebalance)
+    SHARD_COUNT = int(os.environ.get('SHARD_COUNT', '1'))
+    # Корзин в карте шардов: единица переноса между шардами
+    SHARD_BUCKETS = 1024
+
+    # Обновлять схему до последней миграции при запуске
+    # (SCHEMA_AUTO_UPGRADE=0 - например, для flask db downgrade)
+    SCHEMA_AUTO_UPGRADE = os.environ.get('SCHEMA_AUTO_UPGRADE', '1') != '0'
 
     # Секретный ключ для сессий
     SECRET_KEY = "supersecretkey"
+
+    # Буфер кликов: интервал пакетной записи в секундах (0 - писать сразу)
+    CLICK_FLUSH_INTERVAL = 1.0
+    # Досрочная запись, когда в буфере столько пользователей
+    CLICK_BUFFER_MAX_USERS = 1000
+
+    # Дельта состояния (?since=N): при отставании клиента больше чем
+    # на столько версий отдается полный снимок
+    STATE_DELTA_MAX_GAP = 50
+
+    # Сколько действий принимает один пакет /api/user/actions
+    ACTIONS_MAX_BATCH = 200
+
+    # Хранение прогресса: 'relational' - строки upgrades/achievements/skins,
+    # 'packed' - одна колонка users.progress (flask progress-storage pack|unpack)
+    PROGRESS_STORAGE = os.environ.get('PROGRESS_STORAGE', 'relational')
+
+    # Архив неактивных игроков: игрок без активности столько дней
+    # переносится в user_archive и восстанавливается при возвращении
+    ARCHIVE_INACTIVE_DAYS = 30
+    # Интервал фонового прохода в секундах (0 - только flask archive run)
+    ARCHIVE_INTERVAL = 3600.0
+    # users.last_seen игрока пишется не чаще раза в столько секунд,
+    # накопленные отметки - пакетом раз в ARCHIVE_SEEN_FLUSH_INTERVAL
+    ARCHIVE_SEEN_INTERVAL = 3600.0
+    ARCHIVE_SEEN_FLUSH_INTERVAL = 60.0
+    # Игроков в одной транзакции и пакетов на шард за проход
+    ARCHIVE_BATCH_SIZE = 500
+    ARCHIVE_MAX_BATCHES = 20
+    # Страниц для incremental_vacuum после прохода (0 - все свободные)
+    ARCHIVE_VACUUM_PAGES = 0
+
+    # Кэш горячих пользователей get_current_user (0 - выключен)
+    USER_CACHE_SIZE = 10_000
+    # Сколько секунд снимок пользователя считается свежим
+    USER_CACHE_TTL = 30.0
+    # Файл штампов для согласованности между процессами
+    # (None - рядом с файлом SQLite; для базы в памяти - только внутри процесса)
+    USER_CACHE_STAMP_FILE = os.environ.get('USER_CACHE_STAMP_FILE')
+    USER_CACHE_STAMP_SLOTS = 65536
+
+    # Сколько пользователей держать в кэше водяных знаков достижений
+    ACHIEVEMENT_WATERMARK_CACHE_SIZE = 100_000
+    # Проверка достижений: 'sync' - в самом запросе, 'async' - пулом
+    # фоновых потоков (новые достижения приходят со следующим ответом)
+    ACHIEVEMENT_EVALUATION = os.environ.get('ACHIEVEMENT_EVALUATION', 'sync')
+    ACHIEVEMENT_WORKERS = 2
+    # Игроков в очереди; сверх этого проверка идет в самом запросе
+    ACHIEVEMENT_QUEUE_SIZE = 10_000
+    # Игроков в одной транзакции потока
+    ACHIEVEMENT_BATCH_SIZE = 100
+
+    # Максимальный размер выборки /api/leaderboard/top
+    LEADERBOARD_MAX_N = 100
+    # Перестройка рейтинга из базы (записи других процессов), секунд;
+    # 0 - только сигналы своего процесса (включать при нескольких процессах)
+    LEADERBOARD_REFRESH_INTERVAL = float(os.environ.get('LEADERBOARD_REFRESH_INTERVAL', '0'))
+    # Сколько запрос ждет первой постройки рейтинга до ответа 503, секунд
+    LEADERBOARD_READY_TIMEOUT = 5.0
+
+    # Поток событий /api/user/stream: размер очереди на подключение
+    # (при переполнении медленный клиент отключается)
+    SSE_QUEUE_SIZE = 100
+    # Интервал heartbeat-комментариев в секундах
+    SSE_HEARTBEAT_INTERVAL = 15.0
+    # Время жизни одного подключения, после него клиент переподключается
+    SSE_MAX_LIFETIME = 300.0
+    # Одновременных подключений на пользователя
+    SSE_MAX_STREAMS_PER_USER = 3
+
+    # Контроль допуска (services.admission): отказ 429/503 с Retry-After
+    # до обработки запроса (ADMISSION_CONTROL=0 - выключить, например
+    # для нагрузочных прогонов). Скорость 0 выключает свое ограничение
+    ADMISSION_CONTROL = os.environ.get('ADMISSION_CONTROL', '1') != '0'
+    # Запросов в обработке одновременно, сверх - 503
+    ADMISSION_MAX_IN_FLIGHT = 64
+    # Общее ведро токенов процесса, запросов в секунду (подбирается под сервер)
+    ADMISSION_GLOBAL_RATE = 0
+    ADMISSION_GLOBAL_BURST = 0
+    # Ведро игрока (или адреса без сессии), сверх - 429
+    ADMISSION_USER_RATE = 20
+    ADMISSION_USER_BURST = 60
+    # Сколько ведер игроков держать в памяти
+    ADMISSION_MAX_TRACKED_USERS = 100_000
+    # Endpoint'ы и blueprint'ы без ограничений
+    ADMISSION_EXEMPT = ('metrics', 'assets', 'user.stream_user_events')
+    # Допустимая частота кликов: clickPower пачки не больше, чем можно
+    # накликать за прошедшее время (запас - две минуты кликов офлайн)
+    CLICK_MAX_RATE = 30
+    CLICK_MAX_BURST = 3600
+    # Предел clickPower одной пачки - действует и без контроля допуска
+    CLICK_MAX_POWER = 100_000
+
+    # Сборка статики (flask assets build): файлы с хэшем в имени,
+    # варианты gzip/brotli и index.html; без сборки отдается static/
+    ASSETS_DIR = os.environ.get('ASSETS_DIR') or os.path.join(basedir, 'dist')
+
+    # Метрики запросов и SQL на /metrics
+    METRICS_ENABLED = True
+
+    # Профилирование запросов (services.profiler): доля запросов каждого
+    # endpoint, которые выполняются под сэмплирующим профилировщиком
+    # (0 и без токена - выключено, без накладных расходов)
+    PROFILER_SAMPLE_RATE = float(os.environ.get('PROFILER_SAMPLE_RATE', '0'))
+    # Доли для endpoint'ов или blueprint'ов: {'upgrade.buy_upgrade': 0.05, 'user': 0.01}
+    PROFILER_ENDPOINT_RATES = {}
+    # Запрос с заголовком "X-Profile: <токен>" профилируется всегда (None - нельзя)
+    PROFILER_TOKEN = os.environ.get('PROFILER_TOKEN')
+    # Интервал снятия стеков в секундах
+    PROFILER_INTERVAL = 0.001
+    # Каталог файлов профилей и сколько последних профилей хранить
+    PROFILER_DIR = os.environ.get('PROFILER_DIR') or os.path.join(basedir, 'profiles')
+    PROFILER_MAX_PROFILES = 200
+    # SQL-запросов в одном профиле (остальные только считаются)
+    PROFILER_MAX_STATEMENTS = 500
@@ -0,0 +1,52 @@
+"""per_second, state_version and active_skin on users
+
+Revision ID: 0001a
+Revises: 0001
+Create Date: 2026-10-18 12:15:00
+
+Доход в секунду хранится в users.per_second, а не считается по
+улучшениям на каждом запросе; state_version - версия состояния
+игрока, active_skin - имя выбранного скина. Доход существующих
+игроков заполняется по их улучшениям (level * base_production),
+пока эти колонки еще есть в upgrades (их удаляет 0003).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001a'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def columns():
+    return [
+        sa.Column('per_second', sa.Integer(), nullable=True),
+        sa.Column('state_version', sa.Integer(), nullable=True),
+        sa.Column('active_skin', sa.String(length=100), nullable=True),
+    ]
+
+
+def upgrade():
+    # Базы, созданные db.create_all() новее ревизии 0001, эти колонки уже имеют
+    existing = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('users')}
+    with op.batch_alter_table('users') as batch_op:
+        for column in columns():
+            if column.name not in existing:
+                batch_op.add_column(column)
+
+    op.execute("""
+        UPDATE users SET per_second = (
+            SELECT COALESCE(SUM(upgrades.level * upgrades.base_production), 0)
+            FROM upgrades WHERE upgrades.user_id = users.user_id
+        )
+        WHERE per_second IS NULL
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('users') as batch_op:
+        for column in reversed(columns()):
+            batch_op.drop_column(column.name)
@@ -0,0 +1,135 @@
+"""sparse progress rows
+
+Revision ID: 0001b
+Revises: 0001a
+Create Date: 2026-10-18 12:20:00
+
+Базовая версия создавала каждому игроку строки всех достижений
+(is_unlocked = 0 до разблокировки) и всех скинов (acquired_at IS NULL
+до покупки), а выбранный скин отмечала is_active. Теперь строка есть
+только у полученного достижения, купленного скина и улучшения с
+уровнем больше нуля; бесплатный скин есть у всех без строки, выбранный
+скин хранится в users.active_skin. Описание, иконка, цена и цвета
+берутся из каталога по имени, поэтому эти колонки удаляются.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001b'
+down_revision = '0001a'
+branch_labels = None
+depends_on = None
+
+
+# таблица -> колонки базовой схемы, которых нет в моделях
+DROPPED = {
+    'achievements': ('description', 'icon', 'is_unlocked'),
+    'skins': ('description', 'base_cost', 'is_active', 'colors'),
+}
+
+
+def upgrade():
+    from services.catalog import catalog
+
+    inspector = sa.inspect(op.get_bind())
+    existing = {
+        table: {column['name'] for column in inspector.get_columns(table)}
+        for table in DROPPED
+    }
+
+    # Базы, созданные db.create_all() новее ревизии 0001, уже разреженные
+    if 'is_active' in existing['skins']:
+        op.execute(sa.text("""
+            UPDATE users SET active_skin = COALESCE((
+                SELECT skins.name FROM skins
+                WHERE skins.user_id = users.user_id
+                  AND skins.is_active AND skins.acquired_at IS NOT NULL
+                ORDER BY skins.skin_id LIMIT 1
+            ), :default_skin)
+            WHERE active_skin IS NULL
+        """).bindparams(default_skin=catalog.default_skin))
+    if 'base_cost' in existing['skins']:
+        op.execute('DELETE FROM skins WHERE acquired_at IS NULL OR base_cost = 0')
+    if 'is_unlocked' in existing['achievements']:
+        op.execute('DELETE FROM achievements WHERE NOT COALESCE(is_unlocked, 0)')
+    op.execute('DELETE FROM upgrades WHERE COALESCE(level, 0) = 0')
+    op.execute(sa.text(
+        'UPDATE users SET active_skin = :default_skin WHERE active_skin IS NULL'
+    ).bindparams(default_skin=catalog.default_skin))
+
+    for table, dropped in DROPPED.items():
+        with op.batch_alter_table(table) as batch_op:
+            for name in dropped:
+                if name in existing[table]:
+                    batch_op.drop_column(name)
+
+
+def downgrade():
+    from services.catalog import catalog
+
+    with op.batch_alter_table('achievements') as batch_op:
+        batch_op.add_column(sa.Column('description', sa.String(length=255), nullable=True))
+        batch_op.add_column(sa.Column('icon', sa.String(length=255), nullable=True))
+        batch_op.add_column(sa.Column('is_unlocked', sa.Boolean(), nullable=True))
+    with op.batch_alter_table('skins') as batch_op:
+        batch_op.add_column(sa.Column('description', sa.String(length=255), nullable=True))
+        batch_op.add_column(sa.Column('base_cost', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('is_active', sa.Boolean(), nullable=True))
+        batch_op.add_column(sa.Column('colors', sa.JSON(), nullable=False, server_default='{}'))
+
+    # Базовая версия ждет строки всех достижений и скинов у каждого игрока
+    op.execute('UPDATE achievements SET is_unlocked = 1')
+    for template in catalog.achievements:
+        op.execute(sa.text("""
+            INSERT INTO achievements (name, is_unlocked, user_id)
+            SELECT :name, 0, users.user_id FROM users
+            WHERE NOT EXISTS (
+                SELECT 1 FROM achievements
+                WHERE achievements.user_id = users.user_id AND achievements.name = :name
+            )
+        """).bindparams(name=template['name']))
+    for template in catalog.skins:
+        # Бесплатный скин у базовой версии куплен при создании игрока
+        acquired_at = 'users.created_at' if template['base_cost'] == 0 else 'NULL'
+        op.execute(sa.text(f"""
+            INSERT INTO skins (name, acquired_at, user_id)
+            SELECT :name, {acquired_at}, users.user_id FROM users
+            WHERE NOT EXISTS (
+                SELECT 1 FROM skins
+                WHERE skins.user_id = users.user_id AND skins.name = :name
+            )
+        """).bindparams(name=template['name']))
+    op.execute("""
+        UPDATE skins SET is_active = (
+            skins.name = (SELECT users.active_skin FROM users WHERE users.user_id = skins.user_id)
+        )
+    """)
+
+    achievements = sa.table(
+        'achievements',
+        sa.column('name', sa.String), sa.column('description', sa.String),
+        sa.column('icon', sa.String),
+    )
+    for template in catalog.achievements:
+        op.execute(
+            achievements.update()
+            .where(achievements.c.name == template['name'])
+            .values(description=template['description'], icon=template['icon'])
+        )
+    skins = sa.table(
+        'skins',
+        sa.column('name', sa.String), sa.column('description', sa.String),
+        sa.column('base_cost', sa.Integer), sa.column('colors', sa.JSON),
+    )
+    for template in catalog.skins:
+        op.execute(
+            skins.update()
+            .where(skins.c.name == template['name'])
+            .values(
+                description=template['description'],
+                base_cost=template['base_cost'],
+                colors=dict(template['colors']),
+            )
+        )
@@ -0,0 +1,50 @@
+"""unique (user_id, name) indexes
+
+Revision ID: 0002
+Revises: 0001b
+Create Date: 2026-10-18 12:30:00
+
+Все выборки на горячем пути фильтруют по user_id (и имени), поэтому
+составной уникальный индекс заменяет полный просмотр таблицы и заодно
+не дает создать дубль улучшения, достижения или скина при гонке.
+Перед созданием индекса дубли, если они есть, удаляются.
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001b'
+branch_labels = None
+depends_on = None
+
+
+# таблица -> (первичный ключ, порядок выбора оставляемой строки)
+TABLES = {
+    'achievements': ('achievement_id', 'achievement_id'),
+    'upgrades': ('upgrade_id', 'level DESC, upgrade_id'),
+    'skins': ('skin_id', 'skin_id'),
+}
+
+
+def upgrade():
+    for table, (pk, keep_order) in TABLES.items():
+        op.execute(f"""
+            DELETE FROM {table} WHERE {pk} NOT IN (
+                SELECT {pk} FROM (
+                    SELECT {pk}, ROW_NUMBER() OVER (
+                        PARTITION BY user_id, name ORDER BY {keep_order}
+                    ) AS position
+                    FROM {table}
+                ) WHERE position = 1
+            )
+        """)
+        op.create_index(
+            f'ix_{table}_user_id_name', table, ['user_id', 'name'],
+            unique=True, if_not_exists=True
+        )
+
+
+def downgrade():
+    for table in reversed(list(TABLES)):
+        op.drop_index(f'ix_{table}_user_id_name', table_name=table)
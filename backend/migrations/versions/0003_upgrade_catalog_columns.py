@@ -0,0 +1,55 @@
+"""drop catalog columns from upgrades
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 13:00:00
+
+Описание, цена, производство и рост цены улучшения берутся из каталога
+по имени, поэтому в строке пользователя остаются только имя и уровень.
+При откате колонки восстанавливаются из каталога.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('upgrades') as batch_op:
+        batch_op.drop_column('description')
+        batch_op.drop_column('base_cost')
+        batch_op.drop_column('base_production')
+        batch_op.drop_column('cost_multiplier')
+
+
+def downgrade():
+    from services.catalog import catalog
+
+    with op.batch_alter_table('upgrades') as batch_op:
+        batch_op.add_column(sa.Column('description', sa.String(length=255), nullable=True))
+        batch_op.add_column(sa.Column('base_cost', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('base_production', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('cost_multiplier', sa.Float(), nullable=True))
+
+    upgrades = sa.table(
+        'upgrades',
+        sa.column('name', sa.String), sa.column('description', sa.String),
+        sa.column('base_cost', sa.Integer), sa.column('base_production', sa.Integer),
+        sa.column('cost_multiplier', sa.Float),
+    )
+    for template in catalog.upgrades:
+        op.execute(
+            upgrades.update()
+            .where(upgrades.c.name == template['name'])
+            .values(
+                description=template['description'],
+                base_cost=template['baseCost'],
+                base_production=template['baseProduction'],
+                cost_multiplier=template['costMultiplier'],
+            )
+        )
@@ -0,0 +1,32 @@
+"""packed progress column on users
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 14:00:00
+
+Колонка users.progress хранит уровни улучшений, достижения и скины
+в упакованном виде (PROGRESS_STORAGE = 'packed'). Существующие
+пользователи остаются в строках и переводятся командой
+flask progress-storage pack или при первом обращении.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.add_column(sa.Column('progress', sa.LargeBinary(), nullable=True))
+
+
+def downgrade():
+    # Перед откатом упакованный прогресс нужно вернуть в строки:
+    # flask progress-storage unpack
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('progress')
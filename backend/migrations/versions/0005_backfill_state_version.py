@@ -0,0 +1,28 @@
+"""backfill users.state_version
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 15:00:00
+
+users.state_version стала версией оптимистичной блокировки: каждый
+UPDATE пользователя сравнивает ее со значением, прочитанным запросом.
+Строки без версии получают 0.
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('UPDATE users SET state_version = 0 WHERE state_version IS NULL')
+    op.execute('UPDATE users SET per_second = 0 WHERE per_second IS NULL')
+    op.execute('UPDATE users SET score = 0 WHERE score IS NULL')
+
+
+def downgrade():
+    pass
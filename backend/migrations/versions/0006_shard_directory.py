@@ -0,0 +1,37 @@
+"""shard directory tables
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 16:00:00
+
+Карта корзин пользователей по шардам и общий счетчик user_id
+(SHARD_COUNT > 1, services.shards). Таблицы создаются в каждом файле,
+но используются только в основном.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'shard_buckets',
+        sa.Column('bucket', sa.Integer(), primary_key=True),
+        sa.Column('shard', sa.Integer(), nullable=False),
+    )
+    op.create_table(
+        'id_sequences',
+        sa.Column('name', sa.String(length=50), primary_key=True),
+        sa.Column('value', sa.Integer(), nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_table('id_sequences')
+    op.drop_table('shard_buckets')
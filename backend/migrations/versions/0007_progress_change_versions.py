@@ -0,0 +1,37 @@
+"""change versions on progress rows
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 18:00:00
+
+Строки upgrades, achievements и skins запоминают state_version
+пользователя, при которой они изменились последний раз: по ней
+/api/user/state?since=N отдает только изменения после версии N.
+Существующие строки получают 0 - клиент, который знает версию,
+уже получил их полным снимком.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+TABLES = ('upgrades', 'achievements', 'skins')
+
+
+def upgrade():
+    for table in TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column(
+                'changed_version', sa.Integer(), nullable=False, server_default='0'
+            ))
+
+
+def downgrade():
+    for table in TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('changed_version')
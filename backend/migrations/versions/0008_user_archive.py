@@ -0,0 +1,39 @@
+"""user archive table
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 19:00:00
+
+Архив игроков, которые давно не заходили (services.archive): строка на
+игрока, прогресс упакован. Таблица есть в каждом файле шарда.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'user_archive',
+        sa.Column('user_id', sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column('username', sa.String(length=36), nullable=False),
+        sa.Column('score', sa.Integer(), nullable=False),
+        sa.Column('per_second', sa.Integer(), nullable=False),
+        sa.Column('state_version', sa.Integer(), nullable=False),
+        sa.Column('active_skin', sa.String(length=100), nullable=True),
+        sa.Column('last_update', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('progress', sa.LargeBinary(), nullable=False),
+        sa.Column('archived_at', sa.DateTime(timezone=True), nullable=False),
+    )
+
+
+def downgrade():
+    # Игроки, оставшиеся в архиве, удаляются вместе с таблицей
+    op.drop_table('user_archive')
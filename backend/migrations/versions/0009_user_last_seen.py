@@ -0,0 +1,31 @@
+"""users.last_seen
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18 21:00:00
+
+Время последнего запроса игрока (services.archive записывает его не
+чаще раза в ARCHIVE_SEEN_INTERVAL): по нему, а не по last_update,
+архивируются неактивные игроки. Существующие игроки получают
+last_update или время создания.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.add_column(sa.Column('last_seen', sa.DateTime(timezone=True), nullable=True))
+    op.execute('UPDATE users SET last_seen = COALESCE(last_update, created_at)')
+
+
+def downgrade():
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('last_seen')
@@ -1,11 +1,21 @@
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import JSON
 import uuid
 from datetime import datetime
 from sqlalchemy.sql import func
+from services.pricing import bulk_cost, level_cost, max_affordable
+from services.catalog import catalog
+from services.engine_profile import Database, RoutingSession
 
 
-db = SQLAlchemy()
+db = Database(session_options={'class_': RoutingSession})
+
+
+def production_since(per_second, last_update):
+    """Очки автопроизводства, накопленные с момента last_update"""
+    per_second = per_second or 0
+    if per_second > 0 and last_update:
+        time_passed = (datetime.now() - last_update).total_seconds()
+        return int(per_second * time_passed)
+    return 0
 
 
 class User(db.Model):
@@ -14,7 +24,12 @@ class User(db.Model):
     user_id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(36), unique=True, nullable=False)
     score = db.Column(db.Integer, default=0)
+    per_second = db.Column(db.Integer, default=0)  # Доход в секунду, меняется при покупке улучшений
+    state_version = db.Column(db.Integer, default=0)  # Растет при изменении улучшений, достижений, скинов и дохода
+    active_skin = db.Column(db.String(100), default=catalog.default_skin)  # Имя выбранного скина из каталога
     last_update = db.Column(db.DateTime(timezone=True), default=datetime.now())
+    last_seen = db.Column(db.DateTime(timezone=True), nullable=True)  # Последний запрос (пишется с задержкой, services.archive)
+    progress = db.Column(db.LargeBinary, nullable=True)  # Упакованный прогресс (PROGRESS_STORAGE = 'packed')
     created_at = db.Column(db.DateTime(timezone=True), server_default=func.now())
     
     # Relationships 
@@ -22,70 +37,94 @@ class User(db.Model):
     upgrades = db.relationship('Upgrade', backref='user', lazy=True, cascade="all, delete-orphan")
     skins = db.relationship('Skin', backref='user', lazy=True, cascade="all, delete-orphan")
 
+    # Каждый UPDATE пользователя через ORM проверяет state_version
+    # (оптимистичная блокировка, StaleDataError при конфликте); значение
+    # меняют touch() и списания services.wallet
+    __mapper_args__ = {
+        'version_id_col': state_version,
+        'version_id_generator': False,
+    }
+
     def __init__(self):
         self.username = str(uuid.uuid4())
+        self.per_second = 0
+        self.state_version = 0
+        self.active_skin = catalog.default_skin
         self.last_update = datetime.now()
+        self.last_seen = self.last_update
 
-    def apply_auto_production(self, per_second):
-        """Применить автопроизводство за прошедшее время"""
-        if per_second > 0 and self.last_update:
-            time_passed = (datetime.now() - self.last_update).total_seconds()
-            earned = int(per_second * time_passed)
-            self.score += earned
-        self.last_update = datetime.now()
-        return self.score
+    def accrued_production(self):
+        """Очки автопроизводства, накопленные с last_update (без записи)"""
+        return production_since(self.per_second, self.last_update)
+
+    def activate_skin(self, name):
+        """Выбрать скин"""
+        if self.active_skin != name:
+            self.active_skin = name
+            self.touch()
+
+    def touch(self):
+        """Отметить изменение улучшений, достижений или скинов (для ETag)"""
+        self.state_version = (self.state_version or 0) + 1
 
     def __repr__(self):
         return f'<User: {self.username}, Score: {self.score}>'
 
 
 class Achievement(db.Model):
+    """
+    Полученное достижение. Строка появляется только при разблокировке,
+    название, описание и иконка берутся из каталога
+    """
     __tablename__ = 'achievements'
+    __table_args__ = (
+        db.Index('ix_achievements_user_id_name', 'user_id', 'name', unique=True),
+    )
 
     achievement_id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
-    description = db.Column(db.String(255))
-    icon = db.Column(db.String(255))  # Эмодзи: '🏆', '⭐', '🎯'
-    is_unlocked = db.Column(db.Boolean, default=False)
-    achieved_at = db.Column(db.DateTime(timezone=True), nullable=True)  # NULL пока не получено
+    name = db.Column(db.String(100), nullable=False)  # Имя шаблона в каталоге
+    achieved_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    changed_version = db.Column(db.Integer, nullable=False, default=0)  # state_version пользователя при изменении
     
     # Foreign Key
     user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), nullable=False)
 
     def unlock(self):
         """Метод для разблокировки достижения"""
-        if not self.is_unlocked:
-            self.is_unlocked = True
+        if self.achieved_at is None:
             self.achieved_at = datetime.now()
+            self.user.touch()
+
+    @property
+    def template(self):
+        return catalog.achievements.by_name[self.name]
 
     def to_dict(self):
+        """JSON полученного достижения: id шаблона каталога и время"""
         return {
-            'achievement_id': self.achievement_id,
-            'name': self.name,
-            'description': self.description,
-            'icon': self.icon,
-            'is_unlocked': self.is_unlocked,
+            'achievement_id': self.template['id'],
             'achieved_at': self.achieved_at.isoformat() if self.achieved_at else None
         }
 
     def __repr__(self):
-        status = "Unlocked" if self.is_unlocked else "Locked"
-        return f'<Achievement: {self.name} ({status})>'
+        return f'<Achievement: {self.name} (Unlocked)>'
 
 
 class Upgrade(db.Model):
+    """
+    Уровень улучшения пользователя. Название, цена, производство и рост
+    цены берутся из каталога по имени
+    """
     __tablename__ = 'upgrades'
+    __table_args__ = (
+        db.Index('ix_upgrades_user_id_name', 'user_id', 'name', unique=True),
+    )
 
     upgrade_id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
-    description = db.Column(db.String(255))
-    base_cost = db.Column(db.Integer, nullable=False)  # Начальная цена
-    base_production = db.Column(db.Integer, nullable=False)  # Производство за 1 уровень
-    
+    name = db.Column(db.String(100), nullable=False)  # Имя шаблона в каталоге
     level = db.Column(db.Integer, default=0)  # Количество купленных улучшений
-    cost_multiplier = db.Column(db.Float, default=1.15)  # Коэффициент роста цены (15%)
-    
     purchased_at = db.Column(db.DateTime(timezone=True), nullable=True)  # Время первой покупки
+    changed_version = db.Column(db.Integer, nullable=False, default=0)  # state_version пользователя при изменении
     # Foreign Key
     user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), nullable=False)
 
@@ -94,41 +133,70 @@ class Upgrade(db.Model):
         super().__init__(**kwargs)
         if self.level is None:
             self.level = 0
-        if self.cost_multiplier is None:
-            self.cost_multiplier = 1.15
+
+    @property
+    def template(self):
+        return catalog.upgrades.by_name[self.name]
+
+    @property
+    def base_cost(self):
+        """Начальная цена"""
+        return self.template['baseCost']
+
+    @property
+    def base_production(self):
+        """Производство за 1 уровень"""
+        return self.template['baseProduction']
+
+    @property
+    def cost_multiplier(self):
+        """Коэффициент роста цены"""
+        return self.template['costMultiplier']
 
     @property
     def current_cost(self):
         """Текущая цена улучшения на основе уровня"""
-        return int(self.base_cost * (self.cost_multiplier ** self.level))
+        return level_cost(self.base_cost, self.cost_multiplier, self.level)
     
     @property
     def current_production(self):
         """Текущая производительность"""
         return self.base_production * self.level
 
-    def purchase(self, user):
-        """Покупка улучшения"""
-        cost = self.current_cost
-        if user.score >= cost:
-            user.score -= cost
-            self.level += 1
-            if self.purchased_at is None:
-                self.purchased_at = datetime.now()
-            return True
-        return False
+    def cost_for(self, quantity):
+        """Точная цена следующих quantity уровней"""
+        return bulk_cost(self.base_cost, self.cost_multiplier, self.level, quantity)
+
+    def max_affordable(self, budget):
+        """Сколько уровней можно купить на budget"""
+        quantity, _ = max_affordable(self.base_cost, self.cost_multiplier, self.level, budget)
+        return quantity
+
+    def purchase(self, wallet, quantity=1):
+        """
+            Покупка одного или нескольких уровней улучшения
+            Args:
+                wallet: services.wallet.Wallet пользователя
+                quantity: Количество уровней
+        """
+        if quantity < 1 or quantity > self.max_affordable(wallet.budget):
+            return False
+
+        # Цена и доход списываются и прибавляются одним условным UPDATE
+        if not wallet.charge(self.cost_for(quantity), per_second=self.base_production * quantity):
+            return False
+
+        self.level += quantity
+        if self.purchased_at is None:
+            self.purchased_at = datetime.now()
+        return True
 
     def to_dict(self):
+        """JSON уровня улучшения: id шаблона каталога, уровень и цена"""
         return {
-            'upgrade_id': self.upgrade_id,
-            'name': self.name,
-            'description': self.description,
-            'base_cost': self.base_cost,
-            'current_cost': self.current_cost,
-            'base_production': self.base_production,
-            'current_production': self.current_production,
+            'upgrade_id': self.template['id'],
             'level': self.level,
-            'purchased_at': self.purchased_at.isoformat() if self.purchased_at else None
+            'current_cost': self.current_cost,
         }
 
     def __repr__(self):
@@ -136,46 +204,95 @@ class Upgrade(db.Model):
 
 
 class Skin(db.Model):
+    """
+    Купленный скин. Строка появляется только при покупке, стандартный
+    скин есть у всех без строки. Описание, цена и цвета - в каталоге
+    """
     __tablename__ = 'skins'
+    __table_args__ = (
+        db.Index('ix_skins_user_id_name', 'user_id', 'name', unique=True),
+    )
 
     skin_id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
-    description = db.Column(db.String(255))
-    base_cost = db.Column(db.Integer, nullable=False)
-    is_active = db.Column(db.Boolean, default=False)
-    colors = db.Column(JSON, nullable=False)
-    acquired_at = db.Column(db.DateTime(timezone=True), nullable=True)  # NULL пока не куплен
+    name = db.Column(db.String(100), nullable=False)  # Имя шаблона в каталоге
+    acquired_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    changed_version = db.Column(db.Integer, nullable=False, default=0)  # state_version пользователя при изменении
     
     # Foreign Key
     user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), nullable=False)
 
-    def activate(self):
-        """Активировать этот скин и деактивировать остальные"""
-        # Деактивировать все скины пользователя
-        Skin.query.filter_by(user_id=self.user_id).update({'is_active': False})
-        self.is_active = True
+    @property
+    def template(self):
+        return catalog.skins.by_name[self.name]
 
-    def purchase(self, user):
-        """Покупка скина"""
-        if user.score >= self.base_cost:
-            user.score -= self.base_cost
-            self.acquired_at = datetime.now()
-            return True
-        return False
+    def purchase(self, wallet):
+        """
+            Покупка скина
+            Args:
+                wallet: services.wallet.Wallet пользователя
+        """
+        if not wallet.charge(self.template['base_cost']):
+            return False
+        self.acquired_at = datetime.now()
+        return True
 
     def to_dict(self):
-        """Преобразование объекта Skin в словарь для JSON-сериализации"""
+        """JSON купленного скина: id шаблона каталога и время покупки"""
         return {
-            'skin_id': self.skin_id,
-            'name': self.name,
-            'description': self.description,
-            'base_cost': self.base_cost,
-            'is_active': self.is_active,
-            'is_owned': self.acquired_at is not None,
-            'colors': self.colors,
+            'skin_id': self.template['id'],
             'acquired_at': self.acquired_at.isoformat() if self.acquired_at else None,
         }
 
     def __repr__(self):
-        status = "Active" if self.is_active else "Inactive"
-        return f'<Skin: {self.name} ({status})>'
\ No newline at end of file
+        return f'<Skin: {self.name}>'
+
+
+class ShardBucket(db.Model):
+    """
+    Корзина пользователей (user_id % SHARD_BUCKETS) и шард, в котором
+    она хранится. Таблица читается только из основного файла базы
+    """
+    __tablename__ = 'shard_buckets'
+
+    bucket = db.Column(db.Integer, primary_key=True)
+    shard = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f'<ShardBucket: {self.bucket} -> {self.shard}>'
+
+
+class IdSequence(db.Model):
+    """
+    Счетчик идентификаторов, общий для всех шардов (в основном файле):
+    автоинкремент каждого файла SQLite выдавал бы одинаковые user_id
+    """
+    __tablename__ = 'id_sequences'
+
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f'<IdSequence: {self.name} = {self.value}>'
+
+
+class ArchivedUser(db.Model):
+    """
+    Игрок, который давно не заходил (services.archive): строка users и
+    прогресс в упакованном виде (формат users.progress) одной строкой без
+    вторичных индексов. При возвращении игрока строка переносится обратно
+    """
+    __tablename__ = 'user_archive'
+
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    username = db.Column(db.String(36), nullable=False)
+    score = db.Column(db.Integer, nullable=False, default=0)
+    per_second = db.Column(db.Integer, nullable=False, default=0)
+    state_version = db.Column(db.Integer, nullable=False, default=0)
+    active_skin = db.Column(db.String(100), nullable=True)
+    last_update = db.Column(db.DateTime(timezone=True), nullable=True)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    progress = db.Column(db.LargeBinary, nullable=False)
+    archived_at = db.Column(db.DateTime(timezone=True), nullable=False)
+
+    def __repr__(self):
+        return f'<ArchivedUser: {self.user_id}>'
@@ -5,6 +5,10 @@ from routes.user_routes import user_bp
 from routes.skin_routes import skin_bp
 from routes.upgrade_routes import upgrade_bp
 from routes.achievement_routes import achievement_bp
+from routes.leaderboard_routes import leaderboard_bp
+from routes.metrics_routes import metrics_bp
+from routes.catalog_routes import catalog_bp
+from routes.asset_routes import asset_bp
 
 
 def register_routes(app):
@@ -16,4 +20,8 @@ def register_routes(app):
     app.register_blueprint(user_bp)
     app.register_blueprint(skin_bp)
     app.register_blueprint(upgrade_bp)
-    app.register_blueprint(achievement_bp)
\ No newline at end of file
+    app.register_blueprint(achievement_bp)
+    app.register_blueprint(leaderboard_bp)
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(catalog_bp)
+    app.register_blueprint(asset_bp)
\ No newline at end of file
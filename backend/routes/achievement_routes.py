@@ -1,24 +1,31 @@
 """
 API endpoints для работы с достижениями
 """
-from flask import Blueprint, jsonify
-from models import Achievement
+from flask import Blueprint
 from services.user_service import get_current_user
+from services.engine_profile import read_only
+from services.progress import progress_store
+from services.state_service import achievement_list, achievements_etag, conditional_json
 
 achievement_bp = Blueprint('achievement', __name__, url_prefix='/api/achievements')
 
 
 @achievement_bp.route('/')
+@read_only
 def get_achievements():
     """
         Получить все достижения пользователя
         GET: /api/achievements/
+        Headers: If-None-Match - ETag предыдущего ответа
         Returns:
-            JSON с достижениями пользователя
+            JSON с достижениями пользователя или 304, если они не изменились
     """
     user = get_current_user()
-    achievements = Achievement.query.filter_by(user_id=user.user_id).all()
 
-    return jsonify({
-        'achievements': [a.to_dict() for a in achievements]
-    })
\ No newline at end of file
+    def build():
+        achievements = progress_store.achievements(user)
+        return {
+            'achievements': achievement_list(achievements)
+        }
+
+    return conditional_json(achievements_etag(user), build)
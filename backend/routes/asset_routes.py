@@ -0,0 +1,29 @@
+"""
+Собранная статика (flask assets build)
+"""
+from flask import Blueprint, jsonify
+from routes.catalog_routes import IMMUTABLE_MAX_AGE
+from services.assets import assets
+
+asset_bp = Blueprint('assets', __name__)
+
+
+@asset_bp.route('/assets/<path:filename>')
+def get_asset(filename):
+    """
+        Файл сборки с хэшем содержимого в имени
+        GET: /assets/js/game.<hash>.js
+        Headers: Accept-Encoding - br и gzip отдаются из готовых файлов
+        Returns:
+            Файл с Content-Encoding лучшего доступного варианта,
+            кэшируется как immutable: новое содержимое - новое имя
+    """
+    if filename not in assets.hashed:
+        return jsonify({
+            'success': False,
+            'error': 'Asset not found'
+        }), 404
+
+    response = assets.send(filename)
+    response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    return response
@@ -0,0 +1,33 @@
+"""
+API endpoint каталога игры
+"""
+from flask import Blueprint, current_app, request
+from services.catalog import catalog
+
+catalog_bp = Blueprint('catalog', __name__, url_prefix='/api/catalog')
+
+# Год: ответ с версией в URL не меняется никогда
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+@catalog_bp.route('/')
+def get_catalog():
+    """
+        Каталог улучшений, достижений и скинов
+        GET: /api/catalog/?v=<catalog_version>
+        Headers: If-None-Match - ETag (версия каталога)
+        Returns:
+            JSON каталога. С актуальной версией в ?v= ответ кэшируется
+            как immutable, без нее - сверяется по ETag
+    """
+    if catalog.version in request.if_none_match:
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(catalog.body, mimetype='application/json')
+
+    response.set_etag(catalog.version)
+    if request.args.get('v') == catalog.version:
+        response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
@@ -0,0 +1,74 @@
+"""
+API endpoints таблицы лидеров
+"""
+from flask import Blueprint, current_app, jsonify, request
+from services.user_service import get_current_user
+from services.leaderboard import leaderboard
+from services.engine_profile import read_only
+
+leaderboard_bp = Blueprint('leaderboard', __name__, url_prefix='/api/leaderboard')
+
+
+def _not_ready():
+    """Ответ, пока фоновый поток строит рейтинг после старта процесса"""
+    return jsonify({
+        'success': False,
+        'error': 'Leaderboard is loading, try again later'
+    }), 503, {'Retry-After': '1'}
+
+
+@leaderboard_bp.route('/top')
+@read_only
+def get_top():
+    """
+        Лучшие игроки
+        GET: /api/leaderboard/top?n=10
+        Returns:
+            JSON со списком мест, игроков и очков; 503 - рейтинг
+            еще строится
+    """
+    if not leaderboard.wait_ready():
+        return _not_ready()
+
+    max_n = current_app.config.get('LEADERBOARD_MAX_N', 100)
+    n = request.args.get('n', 10, type=int)
+    n = max(1, min(n, max_n))
+
+    return jsonify({
+        'top': [
+            {'rank': rank, 'user_id': user_id, 'score': score}
+            for rank, user_id, score in leaderboard.top(n)
+        ],
+        'total': len(leaderboard)
+    })
+
+
+@leaderboard_bp.route('/me')
+@read_only
+def get_my_rank():
+    """
+        Место текущего игрока
+        GET: /api/leaderboard/me
+        Returns:
+            JSON с местом и очками игрока (по записанному в базу счету);
+            503 - рейтинг еще строится
+    """
+    if not leaderboard.wait_ready():
+        return _not_ready()
+
+    user = get_current_user()
+    position = leaderboard.rank(user.user_id)
+
+    if position is None:
+        return jsonify({
+            'success': False,
+            'error': 'User is not ranked yet'
+        }), 404
+
+    rank, score = position
+    return jsonify({
+        'user_id': user.user_id,
+        'rank': rank,
+        'score': score,
+        'total': len(leaderboard)
+    })
@@ -0,0 +1,24 @@
+"""
+Endpoint метрик для Prometheus
+"""
+from flask import Blueprint, Response, jsonify
+from services.metrics import metrics
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@metrics_bp.route('/metrics')
+def get_metrics():
+    """
+        Метрики запросов и базы данных
+        GET: /metrics
+        Returns:
+            Текст в формате Prometheus exposition
+    """
+    if not metrics.enabled:
+        return jsonify({
+            'success': False,
+            'error': 'Metrics are disabled'
+        }), 404
+
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
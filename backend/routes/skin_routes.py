@@ -2,63 +2,41 @@
 """
 API endpoints для работы со скинами
 """
-from flask import Blueprint, jsonify, request
-from models import db, Skin
+from flask import Blueprint, jsonify
+from models import db
 from services.user_service import get_current_user
-from models import Upgrade
+from services import actions
+from services.actions import ActionError
+from services.wallet import Wallet, retry_conflicts
 
 skin_bp = Blueprint('skin', __name__, url_prefix='/api/skins')
 
-def get_per_second(user_id):
-    """Расчет дохода в секунду"""
-    upgrades = Upgrade.query.filter_by(user_id=user_id).all()
-    return sum(u.current_production for u in upgrades)
-
 
 @skin_bp.route('/buy', methods=['POST'])
+@retry_conflicts
 def buy_skin():
     """
         Купить скин
         POST: /api/skins/buy
-        Body: {"name": "Красный скин"}
+        Body: {"skin_id": 2}
 
         Returns:
             JSON с обновленным скином и счетом пользователя
     """
     user = get_current_user()
-    data = request.get_json()
-
-    # ← ПРИМЕНЯЕМ АВТОПРОИЗВОДСТВО
-    per_second = get_per_second(user.user_id)
-    user.apply_auto_production(per_second)
-
-    skin_id = data.get('skin_id')
-    skin = Skin.query.get(skin_id)
+    try:
+        data = actions.json_object()
+    except ActionError as error:
+        return error.response()
 
-    # Проверяем, что скин существует и принадлежит пользователю
-    if not skin or skin.user_id != user.user_id:
-        return jsonify({
-            'success': False,
-            'error': 'Skin not found'
-        }), 404
-    
-    # Проверяем, не куплен ли уже
-    if skin.acquired_at:
-        return jsonify({
-            'success': False,
-            'error': 'Skin already acquired'
-        }), 400
-    
-    # Пытаемся купить скин
-    success = skin.purchase(user)
+    # Автопроизводство и клики из буфера записываются вместе со списанием
+    with Wallet(user) as wallet:
+        try:
+            skin = actions.buy_skin(user, wallet, data.get('skin_id'))
+        except ActionError as error:
+            return error.response()
 
-    if not success:
-        return jsonify({
-            'success': False,
-            'error': 'Not enough score to purchase skin'
-        }), 400
-    
-    db.session.commit()
+        db.session.commit()
 
     return jsonify({
         'success': True,
@@ -68,6 +46,7 @@ def buy_skin():
 
 
 @skin_bp.route('/activate', methods=['POST'])
+@retry_conflicts
 def activate_skin():
     """
         Активировать скин
@@ -75,33 +54,21 @@ def activate_skin():
         Body: {"skin_id": 1}
 
         Returns:
-            JSON с активированным скином
+            JSON с id активированного скина
     """
     user = get_current_user()
-    data = request.get_json()
-
-    skin_id = data.get('skin_id')
-    skin = Skin.query.get(skin_id)
-
-    # Проверяем, что скин существует и принадлежит пользователю
-    if not skin or skin.user_id != user.user_id:
-        return jsonify({
-            'success': False,
-            'error': 'Скин не найден'
-        }), 404
-    
-    # Проверяем, куплен ли скин
-    if not skin.acquired_at:
-        return jsonify({
-            'success': False,
-            'error': 'Skin not acquired'
-        }), 400
-    
-    # Активируем скин
-    skin.activate()
+    try:
+        data = actions.json_object()
+    except ActionError as error:
+        return error.response()
+
+    try:
+        skin_id = actions.activate_skin(user, data.get('skin_id'))
+    except ActionError as error:
+        return error.response()
     db.session.commit()
 
     return jsonify({
         'success': True,
-        'skin': skin.to_dict()
+        'active_skin': skin_id
     })
\ No newline at end of file
@@ -1,62 +1,49 @@
 """
 API endpoints для работы с пользователем
 """
-from flask import Blueprint, jsonify, request
-from models import db, Upgrade, Achievement, Skin
+from flask import Blueprint, Response, current_app, jsonify, request
+from models import db
 from services.user_service import get_current_user
-from services.achievement_service import check_and_unlock_achievements
-from datetime import datetime
+from services.actions import (
+    ActionError, admit_clicks, apply_actions, check_clicks, json_object, validate_actions
+)
+from services.economy import get_per_second
+from services.achievement_jobs import achievement_jobs
+from services.click_buffer import click_buffer
+from services.events import events
+from services.engine_profile import read_only
+from services.state_service import build_sync, conditional_json, current_score, state_etag
+from services.wallet import Wallet, retry_conflicts
 
 user_bp = Blueprint('user', __name__, url_prefix='/api/user')
 
 
-def get_per_second(user_id):
-    """Вспомогательная функция для расчета дохода в секунду"""
-    upgrades = Upgrade.query.filter_by(user_id=user_id).all()
-    return sum(u.current_production for u in upgrades)
-
-
 @user_bp.route('/state')
+@read_only
 def get_user_state():
     """
         Получить текущее состояние пользователя
-        GET: /api/user/state
+        GET: /api/user/state?since=12
+            since - версия состояния, которая уже есть у клиента
+            (поле version прошлого ответа)
+        Headers: If-None-Match - ETag предыдущего ответа
         Returns:
             JSON с данными пользователя, улучшениями, достижениями и скинами
+            (с since - только изменения, поле delta) или 304, если
+            состояние не изменилось
     """
     user = get_current_user()
 
-    # Доход в секунду
-    per_second = get_per_second(user.user_id)
-    
-    # Применяем автопроизводство
-    user.apply_auto_production(per_second)
-    db.session.commit()
-
-    upgrades = Upgrade.query.filter_by(user_id=user.user_id).all()
-    achievement = Achievement.query.filter_by(user_id=user.user_id).all()
-    skins = Skin.query.filter_by(user_id=user.user_id).all()
-    active_skin = Skin.query.filter_by(user_id=user.user_id, is_active=True).first()
-    
-    total_production = sum(u.current_production for u in upgrades)
-
-    if total_production > 0 and hasattr(user, 'last_update'):
-        time_passed = (datetime.now() - user.last_update).total_seconds()
-        earned = int(total_production * time_passed)
-        user.score += earned
-        user.last_update = datetime.now()
-        db.session.commit()
+    # Автопроизводство и клики из буфера учитываем без записи в базу:
+    # они будут применены при следующей покупке или сбросе буфера
+    score = current_score(user)
 
-    return jsonify({
-        'user_id': user.user_id,
-        'username': user.username,
-        'score': user.score,
-        'per_second': total_production,
-        'upgrades': [u.to_dict() for u in upgrades],
-        'achievements': [a.to_dict() for a in achievement],
-        'skins': [s.to_dict() for s in skins],
-        'active_skin': active_skin.to_dict() if active_skin else None
-    })
+    since = request.args.get('since', type=int)
+
+    return conditional_json(
+        state_etag(user, score),
+        lambda: build_sync(user, score, since)
+    )
 
 
 @user_bp.route('/click', methods=['POST'])
@@ -65,27 +52,128 @@ def handle_click():
         Обработка клика по кнопке
         POST: /api/user/click
         Body: {"clickPower": 1}
+            clickPower - число кликов пачки (целое больше нуля)
         Returns:
-            JSON с обновленным счетом и разблокированными достижениями
+            JSON с обновленным счетом и разблокированными достижениями;
+            400 - неверный clickPower, 429 - кликов больше допустимой
+            частоты (Retry-After)
     """
     user = get_current_user()
-    data = request.get_json()
-
-    # Применяем автопроизводство перед кликом
-    per_second = get_per_second(user.user_id)
-    user.apply_auto_production(per_second)
+    try:
+        data = json_object()
+    except ActionError as error:
+        return error.response()
 
     click_power = data.get('clickPower', 1)
-    user.score += click_power
 
-    db.session.commit()
+    # Пачка кликов не больше, чем можно накликать
+    try:
+        check_clicks(user, click_power)
+    except ActionError as error:
+        return error.response()
+
+    # Клики копятся в буфере и попадают в базу пакетно,
+    # поэтому здесь ничего не коммитим
+    click_buffer.add(user.user_id, click_power)
 
-    # Проверяем достижения
-    unlocked_achievements = check_and_unlock_achievements(user)
+    # Счет с учетом еще не записанных кликов и накопленного автопроизводства
+    score = current_score(user)
+    per_second = get_per_second(user)
+
+    # Проверяем достижения (в режиме async - ставим в очередь)
+    unlocked_achievements = achievement_jobs.evaluate(user, score=score)
 
     return jsonify({
         'success': True,
-        'score': user.score,
+        'score': score,
         'per_second': per_second,
         'unlocked_achievements': unlocked_achievements
-    })
\ No newline at end of file
+    })
+
+
+@user_bp.route('/actions', methods=['POST'])
+def handle_actions():
+    """
+        Пакет действий игрока одним запросом и одной транзакцией
+        POST: /api/user/actions
+        Body: {"actions": [
+            {"type": "click", "clickPower": 37},
+            {"type": "buy_upgrade", "name": "Курсор", "quantity": 1},
+            {"type": "buy_skin", "skin_id": 2},
+            {"type": "activate_skin", "skin_id": 2}
+        ], "since": 12}
+            Действия выполняются по порядку; клики пакета доступны
+            для покупок после них. Отказ одного действия не отменяет
+            остальные. since - версия состояния клиента, как в /state
+        Returns:
+            JSON с результатом каждого действия, разблокированными
+            достижениями и состоянием пользователя после пакета;
+            429 с Retry-After - кликов пакета больше допустимой
+            частоты (не выполнено ни одно действие)
+    """
+    user = get_current_user()
+    try:
+        data = json_object()
+    except ActionError as error:
+        return error.response()
+
+    try:
+        validate_actions(data.get('actions'), current_app.config.get('ACTIONS_MAX_BATCH', 200))
+    except ActionError as error:
+        return error.response()
+
+    since = data.get('since')
+    if isinstance(since, bool) or not isinstance(since, int):
+        since = None
+
+    # Клики пакета списываются из ведра кликов один раз, до повторов
+    # при конфликте версий
+    try:
+        rejected = admit_clicks(user, data['actions'])
+    except ActionError as error:
+        return error.response()
+    return _apply_actions(data['actions'], rejected, since)
+
+
+@retry_conflicts
+def _apply_actions(actions, rejected, since):
+    """Выполнить пакет одной транзакцией (повторяется при конфликте)"""
+    user = get_current_user()
+
+    # Автопроизводство, клики и покупки - одна транзакция
+    with Wallet(user) as wallet:
+        results = apply_actions(user, wallet, actions, rejected)
+        # Порог, пересеченный кликами до покупок пакета, тоже засчитывается
+        unlocked_achievements = achievement_jobs.evaluate(
+            user, score=wallet.peak, commit=False
+        )
+        db.session.commit()
+
+    return jsonify({
+        'success': True,
+        'results': results,
+        'unlocked_achievements': unlocked_achievements,
+        'state': build_sync(user, current_score(user), since)
+    })
+
+
+@user_bp.route('/stream')
+def stream_user_events():
+    """
+        Поток событий пользователя (Server-Sent Events)
+        GET: /api/user/stream
+        Events:
+            score - {"score": ...} после записи счета в базу
+            per_second - {"per_second": ...} при изменении дохода
+            achievement - JSON разблокированного достижения
+        Returns:
+            text/event-stream; пустые комментарии служат heartbeat
+    """
+    user = get_current_user()
+    subscription = events.subscribe(user.user_id)
+
+    response = Response(events.stream(subscription), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Отключаем буферизацию ответа в nginx
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
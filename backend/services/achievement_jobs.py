@@ -0,0 +1,393 @@
+"""
+Проверка достижений вне запроса (ACHIEVEMENT_EVALUATION = 'async')
+
+В синхронном режиме evaluate просто вызывает
+check_and_unlock_achievements, как раньше. В асинхронном запрос только
+ставит игрока в очередь, а проверку и коммит разблокировок выполняет
+пул из ACHIEVEMENT_WORKERS фоновых потоков:
+
+- очередь - словарь user_id -> задание: серия кликов одного игрока
+  сливается в одно задание с наибольшим счетом серии;
+- если водяные знаки игрока уже в памяти и не пересечены, задание не
+  ставится вовсе (achievement_service.needs_check);
+- поток забирает до ACHIEVEMENT_BATCH_SIZE игроков и коммитит их
+  разблокировки одной транзакцией на шард; одного игрока одновременно
+  проверяет только один поток;
+- разблокированные достижения отдаются в unlocked_achievements
+  следующего ответа игроку (и сразу - в поток SSE через
+  achievements_unlocked);
+- при ACHIEVEMENT_QUEUE_SIZE игроков в очереди новый игрок
+  проверяется в самом запросе (backpressure), счетчики - в /metrics.
+
+Задания из транзакции запроса (commit=False) ставятся в очередь только
+после ее коммита, чтобы поток видел записанную покупку. В ASGI-режиме
+потоки выполняют проверку в цикле событий (runner задает
+services.asgi_bridge). Очередь и выдача - в памяти процесса.
+"""
+import atexit
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+
+from models import db, User
+from services.achievement_service import check_and_unlock_achievements, needs_check, watermarks
+from services.shards import shards
+from services.user_cache import user_cache
+from services.wallet import CONFLICTS
+
+_JOBS_KEY = 'achievement_jobs'
+_DELIVERED_KEY = 'achievement_delivered'
+
+
+class AchievementJobs:
+    """
+    Очередь проверок достижений с пулом фоновых потоков
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.asynchronous = False
+        self.workers = 2
+        self.queue_size = 10_000
+        self.batch_size = 100
+
+        self._pending = OrderedDict()  # user_id -> [счет, время постановки]
+        self._running = set()  # user_id, которых сейчас проверяет поток
+        self._delivered = OrderedDict()  # user_id -> достижения для ответа
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._threads = []
+        # Как потоки обращаются к базе (по умолчанию - напрямую)
+        self.runner = None
+
+        # Счетчики для /metrics
+        self.enqueued = 0
+        self.coalesced = 0
+        self.skipped = 0
+        self.overflow = 0
+        self.batches = 0
+        self.unlocked = 0
+        self.failed = 0
+        self.last_lag = 0.0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+            Подключить очередь к приложению
+            Args:
+                app: Flask application
+        """
+        self.app = app
+        self.workers = app.config.get('ACHIEVEMENT_WORKERS', 2)
+        self.queue_size = app.config.get('ACHIEVEMENT_QUEUE_SIZE', 10_000)
+        self.batch_size = app.config.get('ACHIEVEMENT_BATCH_SIZE', 100)
+        self.asynchronous = (
+            app.config.get('ACHIEVEMENT_EVALUATION', 'sync') == 'async' and self.workers > 0
+        )
+        app.extensions['achievement_jobs'] = self
+        if not self.asynchronous:
+            return
+
+        from services.metrics import metrics
+        metrics.add_collector(self.collect)
+
+        # Остаток очереди проверяем при остановке процесса
+        atexit.register(self.shutdown)
+
+    # Запрос
+
+    def evaluate(self, user, score=None, commit=True):
+        """
+            Проверить достижения пользователя (синхронно или поставить
+            в очередь)
+            Args:
+                user: Пользователь
+                score: Счет для проверки, как в check_and_unlock_achievements
+                commit: False - вызов внутри транзакции запроса
+            Returns:
+                list: Достижения для ответа: разблокированные сейчас
+                    (синхронный режим) или потоком после прошлого ответа
+        """
+        if not self.asynchronous:
+            return check_and_unlock_achievements(user, score=score, commit=commit)
+
+        if score is None:
+            score = user.score
+        if not needs_check(user, score):
+            # Водяные знаки в памяти не пересечены: ставить нечего
+            self.skipped += 1
+            return self._take_for_response(user.user_id, commit)
+        if not commit:
+            # Транзакция еще может откатиться (retry_conflicts)
+            jobs = db.session.info.setdefault(_JOBS_KEY, {})
+            jobs[user.user_id] = max(score, jobs.get(user.user_id, score))
+            return self._take_for_response(user.user_id, commit)
+
+        if not self.submit(user.user_id, score):
+            # Очередь заполнена: проверяем в самом запросе
+            with self._cond:
+                self.overflow += 1
+            return self.take_delivered(user.user_id) + check_and_unlock_achievements(user, score=score)
+        return self.take_delivered(user.user_id)
+
+    def submit(self, user_id, score, force=False):
+        """
+            Поставить проверку в очередь (или слить с ожидающей)
+            Returns:
+                bool: False - очередь заполнена
+        """
+        with self._cond:
+            job = self._pending.get(user_id)
+            if job is not None:
+                job[0] = max(job[0], score)
+                self.coalesced += 1
+                return True
+            if len(self._pending) >= self.queue_size and not force:
+                return False
+            self._pending[user_id] = [score, time.monotonic()]
+            self.enqueued += 1
+            self._cond.notify()
+        self._ensure_workers()
+        return True
+
+    def take_delivered(self, user_id):
+        """Забрать достижения, разблокированные потоком для этого игрока"""
+        with self._cond:
+            return self._delivered.pop(user_id, [])
+
+    def _take_for_response(self, user_id, commit):
+        delivered = self.take_delivered(user_id)
+        if delivered and not commit:
+            # При откате транзакции вернутся в выдачу (_after_rollback)
+            db.session.info.setdefault(_DELIVERED_KEY, {})[user_id] = delivered
+        return delivered
+
+    def _deliver(self, user_id, achievements):
+        with self._cond:
+            self._delivered.setdefault(user_id, []).extend(achievements)
+            self._delivered.move_to_end(user_id)
+            # Не дождавшиеся ответа игроки видят достижения в /state и SSE
+            while len(self._delivered) > self.queue_size:
+                self._delivered.popitem(last=False)
+
+    def _after_commit(self, session):
+        session.info.pop(_DELIVERED_KEY, None)
+        jobs = session.info.pop(_JOBS_KEY, None)
+        for user_id, score in (jobs or {}).items():
+            # Покупка уже записана: задание не теряем и при полной очереди
+            self.submit(user_id, score, force=True)
+
+    def _after_rollback(self, session):
+        session.info.pop(_JOBS_KEY, None)
+        for user_id, achievements in session.info.pop(_DELIVERED_KEY, {}).items():
+            self._deliver(user_id, achievements)
+
+    # Пул потоков
+
+    def _ensure_workers(self):
+        """Запустить потоки пула при первом задании"""
+        if len(self._threads) >= self.workers:
+            return
+        with self._cond:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(
+                    target=self._run, name=f'achievement-worker-{len(self._threads)}', daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def _take_batch(self):
+        """Игроки для одной транзакции (под self._cond)"""
+        batch = {}
+        for user_id in list(self._pending):
+            if user_id in self._running:
+                continue
+            batch[user_id] = self._pending.pop(user_id)
+            if len(batch) >= self.batch_size:
+                break
+        self._running.update(batch)
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                batch = self._take_batch()
+                while not batch and not self._stopped:
+                    self._cond.wait()
+                    batch = self._take_batch()
+                if not batch:
+                    return
+            try:
+                if self.runner is not None:
+                    self.runner(lambda: self.process(batch))
+                else:
+                    self.process(batch)
+            except Exception:
+                with self._cond:
+                    self.failed += len(batch)
+                if self.app is not None:
+                    self.app.logger.exception('Achievement evaluation failed')
+            finally:
+                with self._cond:
+                    self._running.difference_update(batch)
+                    self._cond.notify_all()
+
+    def process(self, batch):
+        """
+            Проверить достижения пакета игроков, коммит - на шард
+            Args:
+                batch: {user_id: [счет, время постановки]}
+            Returns:
+                int: Разблокировано достижений
+        """
+        now = time.monotonic()
+        self.last_lag = max((now - enqueued for _, enqueued in batch.values()), default=0.0)
+
+        groups = {}
+        for user_id, (score, _) in batch.items():
+            groups.setdefault(shards.shard_for(user_id), {})[user_id] = score
+
+        unlocked = failed = 0
+        with self.app.app_context():
+            try:
+                for shard, scores in groups.items():
+                    with shards.using(shard):
+                        shard_unlocked, shard_failed = self._process_shard(scores)
+                    unlocked += shard_unlocked
+                    failed += shard_failed
+            finally:
+                db.session.remove()
+        with self._cond:
+            self.batches += 1
+            self.unlocked += unlocked
+            self.failed += failed
+        return unlocked
+
+    def _process_shard(self, scores):
+        """
+            Проверка игроков одного шарда одной транзакцией
+            Returns:
+                tuple: (разблокировано достижений, игроков не проверено)
+        """
+        results = {}
+        failed = 0
+        try:
+            for user_id, score in scores.items():
+                results[user_id] = self._check(user_id, score)
+            db.session.commit()
+        except CONFLICTS:
+            # Игрока изменил параллельный запрос: проверяем пакет по одному
+            db.session.rollback()
+            results = {}
+            for user_id, score in scores.items():
+                try:
+                    results[user_id] = self._check(user_id, score)
+                    db.session.commit()
+                except CONFLICTS:
+                    db.session.rollback()
+                    # Проверим снова при следующем изменении счета
+                    watermarks.forget(user_id)
+                    user_cache.forget(user_id)
+                    failed += 1
+
+        for user_id, achievements in results.items():
+            if achievements:
+                self._deliver(user_id, achievements)
+        return sum(len(achievements) for achievements in results.values()), failed
+
+    @staticmethod
+    def _check(user_id, score):
+        user = db.session.get(User, user_id)
+        if user is None:
+            return []  # Удален или в архиве
+        return check_and_unlock_achievements(user, score=max(score, user.score or 0), commit=False)
+
+    def depth(self):
+        """Игроков в очереди"""
+        with self._cond:
+            return len(self._pending)
+
+    def drain(self, timeout=None):
+        """
+            Дождаться, пока потоки проверят всю очередь
+            Returns:
+                bool: False - не успели за timeout секунд
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._pending or self._running:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stop(self):
+        """Остановить потоки пула (очередь остается)"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+        with self._cond:
+            self._stopped = False
+
+    def flush(self):
+        """
+            Проверить остаток очереди в текущем потоке
+            Returns:
+                int: Разблокировано достижений
+        """
+        with self._cond:
+            batch, self._pending = dict(self._pending), OrderedDict()
+        if not batch or self.app is None:
+            return 0
+        return self.process(batch)
+
+    def shutdown(self):
+        """Остановить потоки и проверить остаток очереди"""
+        self.stop()
+        self.flush()
+
+    def collect(self):
+        return [
+            ('webgame_achievement_queue_depth', 'gauge',
+             'Players waiting for achievement evaluation.', self.depth()),
+            ('webgame_achievement_jobs_enqueued_total', 'counter',
+             'Achievement evaluation jobs enqueued.', self.enqueued),
+            ('webgame_achievement_jobs_coalesced_total', 'counter',
+             'Score changes merged into an already queued job.', self.coalesced),
+            ('webgame_achievement_jobs_skipped_total', 'counter',
+             'Score changes that crossed no achievement watermark.', self.skipped),
+            ('webgame_achievement_jobs_overflow_total', 'counter',
+             'Evaluations run inside the request because the queue was full.', self.overflow),
+            ('webgame_achievement_jobs_failed_total', 'counter',
+             'Evaluations dropped after a conflict or an error.', self.failed),
+            ('webgame_achievement_batches_total', 'counter',
+             'Worker transactions with achievement unlocks.', self.batches),
+            ('webgame_achievement_unlocked_async_total', 'counter',
+             'Achievements unlocked by the worker pool.', self.unlocked),
+            ('webgame_achievement_queue_lag_seconds', 'gauge',
+             'Oldest job wait in the last worker batch.', round(self.last_lag, 6)),
+        ]
+
+
+achievement_jobs = AchievementJobs()
+
+
+@event.listens_for(db.session, 'after_commit')
+def _submit_committed_jobs(session):
+    if achievement_jobs.asynchronous:
+        achievement_jobs._after_commit(session)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _drop_rolled_back_jobs(session):
+    if achievement_jobs.asynchronous:
+        achievement_jobs._after_rollback(session)
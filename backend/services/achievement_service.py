@@ -1,53 +1,206 @@
 """
 Сервис для проверки и разблокировки достижений
+
+Условия достижений описаны данными в каталоге (метрика,
+порог, сравнение). Правила сгруппированы по метрике и отсортированы по
+порогу. Для каждого пользователя в памяти хранится "водяной знак" -
+ближайшее незаблокированное правило по каждой метрике. Пока значения
+метрик его не пересекают, проверка стоит O(1) и не обращается к базе.
 """
-from models import Achievement, Upgrade, db
+import operator
+import threading
+from collections import OrderedDict, namedtuple
+
+from models import db
+from services.catalog import catalog
+from services.progress import progress_store
+from services.signals import record_unlocked
+from services.wallet import CONFLICTS
+from services.user_service import forget_current_user
+
+# Допустимые сравнения: оба монотонны, поэтому порядок по порогу работает
+COMPARATORS = {
+    '>=': operator.ge,
+    '>': operator.gt,
+}
+
+# Значения метрик пользователя; score передается отдельно,
+# потому что может включать клики, еще не записанные в базу
+METRICS = {
+    'score': lambda user, score: score,
+    'per_second': lambda user, score: user.per_second or 0,
+}
+
+
+class AchievementRule(namedtuple('AchievementRule', 'name metric threshold comparator')):
+    """Условие разблокировки одного достижения"""
+
+    __slots__ = ()
+
+    def matches(self, value):
+        return COMPARATORS[self.comparator](value, self.threshold)
+
+
+def build_rules(templates):
+    """
+        Построить индекс правил из шаблонов достижений
+        Returns:
+            dict: метрика -> список правил по возрастанию порога
+    """
+    index = {}
+    for template in templates:
+        if template['metric'] not in METRICS:
+            raise ValueError(f"Unknown achievement metric: {template['metric']}")
+        if template['comparator'] not in COMPARATORS:
+            raise ValueError(f"Unknown achievement comparator: {template['comparator']}")
+
+        rule = AchievementRule(
+            template['name'], template['metric'],
+            template['threshold'], template['comparator']
+        )
+        index.setdefault(rule.metric, []).append(rule)
+
+    for rules in index.values():
+        # При равных порогах '>=' срабатывает раньше '>'
+        rules.sort(key=lambda r: (r.threshold, r.comparator == '>'))
+    return index
+
+
+RULES = build_rules(catalog.achievements)
+
+
+class WatermarkCache:
+    """
+    Ограниченный LRU-кэш водяных знаков: user_id -> {метрика: правило или None}
+    """
+
+    def __init__(self, max_size=100_000):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            marks = self._data.get(user_id)
+            if marks is not None:
+                self._data.move_to_end(user_id)
+            return marks
+
+    def put(self, user_id, marks):
+        with self._lock:
+            self._data[user_id] = marks
+            self._data.move_to_end(user_id)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def forget(self, user_id):
+        with self._lock:
+            self._data.pop(user_id, None)
+
+
+watermarks = WatermarkCache()
 
-def check_and_unlock_achievements(user):
+
+def init_app(app):
+    """
+        Настройка размера кэша водяных знаков
+        Args:
+            app: Flask application
+    """
+    watermarks.max_size = app.config.get('ACHIEVEMENT_WATERMARK_CACHE_SIZE', 100_000)
+
+
+def _load_watermarks(user):
+    """Посчитать водяные знаки пользователя по разблокированным достижениям"""
+    unlocked = progress_store.unlocked_names(user)
+    marks = {
+        metric: next((r for r in rules if r.name not in unlocked), None)
+        for metric, rules in RULES.items()
+    }
+    watermarks.put(user.user_id, marks)
+    return marks
+
+
+def _crossed(marks, values):
+    return any(rule is not None and rule.matches(values[metric])
+               for metric, rule in marks.items())
+
+
+def needs_check(user, score):
+    """
+        Нужна ли полная проверка достижений: водяные знаки пользователя
+        не загружены или один из них пересечен. Не обращается к базе
+        Returns:
+            bool: False - новых достижений точно нет
+    """
+    marks = watermarks.get(user.user_id)
+    if marks is None:
+        return True
+    return _crossed(marks, {metric: value(user, score) for metric, value in METRICS.items()})
+
+
+def check_and_unlock_achievements(user, score=None, commit=True):
     """
         Проверить и разблокировать достижения для пользователя
 
+        Args:
+            user: Пользователь
+            score: Счет для проверки, если он отличается от user.score
+                (например, с учетом кликов, еще не записанных в базу)
+            commit: Закоммитить разблокировку сразу; False - коммит
+                остается вызывающему коду (одна транзакция с покупкой)
+
         Returns:
             list: Список разблокированных достижений (в формате словаря dict)
     """
-    # Получаем незаблокированные достижения
-    archievements = Achievement.query.filter_by(
-        user_id = user.user_id,
-        is_unlocked = False
-    ).all()
+    if score is None:
+        score = user.score
+
+    values = {metric: value(user, score) for metric, value in METRICS.items()}
 
-    if not archievements:
+    marks = watermarks.get(user.user_id)
+    if marks is None:
+        marks = _load_watermarks(user)
+
+    # Быстрый путь: ни один водяной знак не пересечен
+    if not _crossed(marks, values):
         return []
-    
-    # Получаем статистику пользователя
-    upgrades = Upgrade.query.filter_by(user_id=user.user_id).all()
-    total_production = sum(u.current_production for u in upgrades)
-    has_upgrades = any(u.level > 0 for u in upgrades)
+
+    achievements = progress_store.unlocked_names(user)
 
     unlocked = []
+    for metric, rules in RULES.items():
+        for rule in rules:
+            if not rule.matches(values[metric]):
+                break
 
-    for achievement in archievements:
-        should_unlock = False
-
-        # Логика разблокировки достижений
-        if achievement.name == 'Первый клик' and user.score >= 1:
-            should_unlock = True
-        elif achievement.name == 'Сотня кликов' and user.score >= 100:
-            should_unlock = True
-        elif achievement.name == 'Первое улучшение' and has_upgrades:
-            should_unlock = True
-        elif achievement.name == 'Тысяча очков' and user.score >= 1000:
-            should_unlock = True
-        elif achievement.name == 'Автоматизация' and total_production >= 10:
-            should_unlock = True
-        elif achievement.name == 'Миллионер' and user.score >= 1_000_000:
-            should_unlock = True
-
-        if should_unlock:
-            achievement.unlock()
+            if rule.name in achievements:
+                continue
+
+            # Строка (или бит) достижения появляется только при разблокировке
+            achievement = progress_store.add_achievement(user, rule.name)
+            achievements.add(rule.name)
             unlocked.append(achievement.to_dict())
-    
-    if unlocked:
-        db.session.commit()
 
-    return unlocked
\ No newline at end of file
+    # Водяные знаки пересчитаются из базы при следующей проверке
+    watermarks.forget(user.user_id)
+
+    if not unlocked:
+        return []
+
+    for achievement in unlocked:
+        record_unlocked(user.user_id, achievement)
+
+    if not commit:
+        db.session.flush()
+        return unlocked
+
+    try:
+        db.session.commit()
+    except CONFLICTS:
+        # Пользователя изменил параллельный запрос (или то же достижение
+        # уже записано) - проверим снова при следующем обращении
+        db.session.rollback()
+        forget_current_user()
+        return []
+    return unlocked
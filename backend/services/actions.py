@@ -0,0 +1,301 @@
+"""
+Действия игрока: клики, покупка улучшений и скинов, выбор скина
+
+Одни и те же функции выполняют отдельные endpoint'ы (/api/upgrades/buy,
+/api/skins/buy, /api/skins/activate) и пакет /api/user/actions. Функции
+не коммитят: автопроизводство (Wallet), проверка достижений и коммит -
+один раз на запрос. Отказ - ActionError с текстом и HTTP-статусом.
+"""
+import math
+
+from flask import current_app, jsonify, request
+
+from models import Skin
+from services.admission import admission
+from services.catalog import catalog
+from services.pricing import MAX_QUANTITY
+from services.progress import progress_store
+from services.state_service import active_skin
+
+
+class ActionError(Exception):
+    """
+    Действие не выполнено (не хватает очков, нет в каталоге и т.п.)
+    """
+
+    def __init__(self, message, status=400, retry_after=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.retry_after = retry_after  # Секунды до повтора (429)
+
+    def response(self):
+        """Ответ отдельного endpoint'а"""
+        if self.retry_after is not None:
+            return admission.reject(self.status, self.message, self.retry_after)
+        return jsonify({
+            'success': False,
+            'error': self.message
+        }), self.status
+
+
+def _positive_int(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0
+
+
+def json_object():
+    """
+        Тело запроса - JSON-объект
+        Raises:
+            ActionError: 400 (null, список, число и т.п.)
+    """
+    data = request.get_json()
+    if not isinstance(data, dict):
+        raise ActionError('Request body must be a JSON object')
+    return data
+
+
+def _upgrade_name(name):
+    """Имя улучшения из запроса: строка"""
+    if not isinstance(name, str):
+        raise ActionError('Invalid upgrade name')
+    return name
+
+
+def _skin_template(skin_id, not_found='Skin not found'):
+    """
+        Шаблон скина каталога по id из запроса
+        Raises:
+            ActionError: 400 - id не целое число, 404 - нет в каталоге
+    """
+    if isinstance(skin_id, bool) or not isinstance(skin_id, int):
+        raise ActionError('Invalid skin_id')
+    template = catalog.skins.by_id.get(skin_id)
+    if not template:
+        raise ActionError(not_found, 404)
+    return template
+
+
+def check_click_power(click_power):
+    """
+        Проверить clickPower: целое больше нуля и не больше CLICK_MAX_POWER
+        Raises:
+            ActionError: 400
+    """
+    if not _positive_int(click_power):
+        raise ActionError('Invalid clickPower')
+    if click_power > current_app.config.get('CLICK_MAX_POWER', 100_000):
+        raise ActionError('Too many clicks in one batch')
+
+
+def take_clicks(user, clicks):
+    """
+        Списать клики из ведра кликов игрока (services.admission):
+        их не больше, чем можно накликать
+        Raises:
+            ActionError: 400 или 429 с Retry-After
+    """
+    wait = admission.take_clicks(user.user_id, clicks)
+    if wait == math.inf:
+        # Больше CLICK_MAX_BURST: повтор не поможет
+        raise ActionError('Too many clicks in one batch')
+    if wait:
+        raise ActionError('Too many clicks', 429, retry_after=wait)
+
+
+def check_clicks(user, click_power):
+    """
+        Проверить пачку кликов /api/user/click и списать ее из ведра
+        Raises:
+            ActionError: 400 или 429 с Retry-After
+    """
+    check_click_power(click_power)
+    take_clicks(user, click_power)
+
+
+def admit_clicks(user, actions):
+    """
+        Списать клики пакета из ведра кликов одним разом, до выполнения
+        пакета: повтор пакета при конфликте (retry_conflicts) не должен
+        списывать их снова
+        Returns:
+            dict: Индекс действия -> ActionError для отклоненных кликов
+        Raises:
+            ActionError: 429 с Retry-After - кликов больше допустимой
+                частоты, пакет нужно повторить целиком позже
+    """
+    rejected = {}
+    admitted = []
+    for index, action in enumerate(actions):
+        if action['type'] != 'click':
+            continue
+        try:
+            check_click_power(action.get('clickPower', 1))
+        except ActionError as error:
+            rejected[index] = error
+        else:
+            admitted.append(index)
+
+    if admitted:
+        try:
+            take_clicks(user, sum(actions[index].get('clickPower', 1) for index in admitted))
+        except ActionError as error:
+            if error.retry_after is not None:
+                # Покупки пакета рассчитаны на эти клики: откладывается весь пакет
+                raise
+            rejected.update((index, error) for index in admitted)
+    return rejected
+
+
+def click(user, wallet, click_power=1):
+    """
+        Клики, отправленные пакетом: сразу доступны для покупок
+        в этом же пакете (ведро кликов проверяет admit_clicks)
+        Returns:
+            dict: Результат действия
+    """
+    check_click_power(click_power)
+    wallet.add_clicks(click_power)
+    return {'success': True}
+
+
+def buy_upgrade(user, wallet, name, quantity=1):
+    """
+        Купить улучшение
+        Args:
+            name: Имя улучшения в каталоге
+            quantity: Количество уровней или "max" - сколько хватает очков
+        Returns:
+            tuple: (улучшение, купленное количество)
+    """
+    if quantity != 'max' and not (_positive_int(quantity) and quantity <= MAX_QUANTITY):
+        raise ActionError('Invalid quantity')
+    name = _upgrade_name(name)
+
+    # Находим улучшение пользователя
+    upgrade = progress_store.find_upgrade(user, name)
+
+    # Если улучшения нет, создаем новое
+    if not upgrade:
+        if name not in catalog.upgrades.by_name:
+            raise ActionError('Upgrade not found', 404)
+        upgrade = progress_store.new_upgrade(user, name)
+
+    if quantity == 'max':
+        quantity = upgrade.max_affordable(wallet.budget)
+
+    # Проверяем, хватает ли очков
+    if not (quantity > 0 and upgrade.purchase(wallet, quantity)):
+        raise ActionError('Not enough score to purchase upgrade')
+
+    progress_store.save_upgrade(user, upgrade)
+    return upgrade, quantity
+
+
+def buy_skin(user, wallet, skin_id):
+    """
+        Купить скин
+        Returns:
+            Skin: Купленный скин
+    """
+    # Проверяем, что скин есть в каталоге
+    template = _skin_template(skin_id)
+
+    # Проверяем, не куплен ли уже
+    if progress_store.owns_skin(user, template['name']):
+        raise ActionError('Skin already acquired')
+
+    # Пытаемся купить скин: строка появляется только после покупки
+    skin = Skin(name=template['name'])
+    if not skin.purchase(wallet):
+        raise ActionError('Not enough score to purchase skin')
+
+    progress_store.add_skin(user, skin)
+    return skin
+
+
+def activate_skin(user, skin_id):
+    """
+        Выбрать купленный скин
+        Returns:
+            int: id активного скина
+    """
+    # Проверяем, что скин есть в каталоге
+    template = _skin_template(skin_id, 'Скин не найден')
+
+    # Проверяем, куплен ли скин
+    if not progress_store.owns_skin(user, template['name']):
+        raise ActionError('Skin not acquired')
+
+    user.activate_skin(template['name'])
+    return active_skin(user)
+
+
+# Пакет /api/user/actions: тип действия -> функция(user, wallet, action)
+
+def _click_action(user, wallet, action):
+    return click(user, wallet, action.get('clickPower', 1))
+
+
+def _buy_upgrade_action(user, wallet, action):
+    spent = wallet.spent
+    upgrade, quantity = buy_upgrade(user, wallet, action.get('name'), action.get('quantity', 1))
+    return {
+        'success': True,
+        'upgrade': upgrade.to_dict(),
+        'quantity': quantity,
+        'total_cost': wallet.spent - spent,
+    }
+
+
+def _buy_skin_action(user, wallet, action):
+    skin = buy_skin(user, wallet, action.get('skin_id'))
+    return {'success': True, 'skin': skin.to_dict()}
+
+
+def _activate_skin_action(user, wallet, action):
+    return {'success': True, 'active_skin': activate_skin(user, action.get('skin_id'))}
+
+
+ACTIONS = {
+    'click': _click_action,
+    'buy_upgrade': _buy_upgrade_action,
+    'buy_skin': _buy_skin_action,
+    'activate_skin': _activate_skin_action,
+}
+
+
+def validate_actions(actions, max_actions):
+    """
+        Проверить тело пакета до выполнения
+        Raises:
+            ActionError: Пакет нельзя выполнить целиком
+    """
+    if not isinstance(actions, list) or not actions:
+        raise ActionError('actions must be a non-empty list')
+    if len(actions) > max_actions:
+        raise ActionError(f'Too many actions (max {max_actions})', 413)
+    for action in actions:
+        if not isinstance(action, dict) or action.get('type') not in ACTIONS:
+            raise ActionError(f'Unknown action: {action!r}'[:200])
+
+
+def apply_actions(user, wallet, actions, rejected=None):
+    """
+        Выполнить действия по порядку. Отказ одного действия не
+        отменяет остальные: он попадает в его результат
+        Args:
+            rejected: Отказы, известные до выполнения (admit_clicks)
+        Returns:
+            list: Результаты действий в том же порядке
+    """
+    rejected = rejected or {}
+    results = []
+    for index, action in enumerate(actions):
+        try:
+            if index in rejected:
+                raise rejected[index]
+            results.append(ACTIONS[action['type']](user, wallet, action))
+        except ActionError as error:
+            results.append({'success': False, 'error': error.message})
+    return results
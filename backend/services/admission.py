@@ -0,0 +1,233 @@
+"""
+Контроль допуска запросов (admission control) и сброс нагрузки
+
+Перед обработчиками blueprint'ов каждый запрос проходит три проверки,
+все в памяти процесса и без обращения к базе:
+
+    1. запросов в обработке не больше ADMISSION_MAX_IN_FLIGHT -> 503
+    2. ведро игрока ADMISSION_USER_RATE/BURST                 -> 429
+    3. общее ведро токенов ADMISSION_GLOBAL_RATE/BURST       -> 503
+
+Отказ - сразу JSON {'success': False, 'error': ...} с заголовком
+Retry-After, до загрузки пользователя и SQL. Игрок определяется по
+user_id в cookie-сессии, запрос без сессии - по адресу клиента.
+Отдельное ведро кликов (CLICK_MAX_RATE/BURST) ограничивает clickPower:
+клиент отправляет клики пачкой, и пачка не может быть больше, чем
+можно накликать за прошедшее время. Нулевая скорость выключает
+соответствующее ограничение, ADMISSION_CONTROL = False - все сразу.
+Endpoint'ы из ADMISSION_EXEMPT (метрики, поток SSE) не ограничиваются.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, jsonify, request, session
+
+
+class TokenBucket:
+    """
+    Ведро токенов: rate токенов в секунду, не больше burst
+    """
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, count, now):
+        """
+            Забрать count токенов
+            Returns:
+                float: 0 - токены забраны, иначе сколько секунд ждать
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if count <= self.tokens:
+            self.tokens -= count
+            return 0.0
+        if count > self.burst:
+            # Столько за один раз не накопится никогда
+            return math.inf
+        return (count - self.tokens) / self.rate
+
+
+class BucketTable:
+    """
+    Ведра по ключу (игроку) с вытеснением давно не приходивших
+    """
+
+    def __init__(self, rate, burst, max_size):
+        self.rate = rate
+        self.burst = burst
+        self.max_size = max_size
+        self._buckets = OrderedDict()
+
+    def take(self, key, count, now):
+        """Как TokenBucket.take (вызывается под блокировкой владельца)"""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst, now)
+            if len(self._buckets) > self.max_size:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket.take(count, now)
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class AdmissionControl:
+    """
+    Ограничение частоты и числа одновременных запросов
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.max_in_flight = 0
+        self.exempt = frozenset()
+        self.global_bucket = None
+        self.users = None
+        self.clicks = None
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+        # Счетчики для /metrics
+        self.admitted = 0
+        self.shed_in_flight = 0
+        self.shed_global = 0
+        self.shed_user = 0
+        self.shed_clicks = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+            Подключить контроль допуска к запросам
+            Args:
+                app: Flask application
+        """
+        self.app = app
+        config = app.config
+        now = time.monotonic()
+        self.max_in_flight = config.get('ADMISSION_MAX_IN_FLIGHT', 0)
+        self.exempt = frozenset(config.get('ADMISSION_EXEMPT', ()))
+        tracked = config.get('ADMISSION_MAX_TRACKED_USERS', 100_000)
+
+        rate = config.get('ADMISSION_GLOBAL_RATE', 0)
+        self.global_bucket = (
+            TokenBucket(rate, config.get('ADMISSION_GLOBAL_BURST', rate), now) if rate > 0 else None
+        )
+        rate = config.get('ADMISSION_USER_RATE', 0)
+        self.users = (
+            BucketTable(rate, config.get('ADMISSION_USER_BURST', rate), tracked) if rate > 0 else None
+        )
+        rate = config.get('CLICK_MAX_RATE', 0)
+        self.clicks = (
+            BucketTable(rate, config.get('CLICK_MAX_BURST', rate), tracked) if rate > 0 else None
+        )
+        app.extensions['admission'] = self
+        if not config.get('ADMISSION_CONTROL', True):
+            self.max_in_flight = 0
+            self.global_bucket = self.users = self.clicks = None
+            return
+
+        if self.max_in_flight > 0 or self.global_bucket is not None or self.users is not None:
+            app.before_request(self._before_request)
+            app.teardown_request(self._teardown_request)
+
+        from services.metrics import metrics
+        metrics.add_collector(self.collect)
+
+    # Запросы
+
+    def _before_request(self):
+        if request.blueprint is None or request.blueprint in self.exempt \
+                or request.endpoint in self.exempt:
+            return None
+
+        key = session.get('user_id') or request.remote_addr
+        now = time.monotonic()
+        rejected = None
+        with self._lock:
+            if self.max_in_flight > 0 and self.in_flight >= self.max_in_flight:
+                self.shed_in_flight += 1
+                rejected = (503, 'Server is busy, try again later', 1)
+
+            # Сначала ведро игрока: частый клиент не тратит общие токены
+            elif self.users is not None and (wait := self.users.take(key, 1, now)):
+                self.shed_user += 1
+                rejected = (429, 'Too many requests', wait)
+
+            elif self.global_bucket is not None and (wait := self.global_bucket.take(1, now)):
+                self.shed_global += 1
+                rejected = (503, 'Server is busy, try again later', wait)
+
+            else:
+                self.in_flight += 1
+                self.admitted += 1
+
+        if rejected is not None:
+            return self.reject(*rejected)
+        g.admitted = True
+        return None
+
+    def _teardown_request(self, exc):
+        if g.pop('admitted', False):
+            with self._lock:
+                self.in_flight -= 1
+
+    @staticmethod
+    def reject(status, error, retry_after):
+        """
+            Ответ отказа с Retry-After (целые секунды, не меньше 1)
+            Returns:
+                tuple: (JSON, статус, заголовки)
+        """
+        if math.isinf(retry_after):
+            retry_after = 60
+        return jsonify({
+            'success': False,
+            'error': error
+        }), status, {'Retry-After': str(max(1, math.ceil(retry_after)))}
+
+    def take_clicks(self, user_id, clicks):
+        """
+            Списать клики пачки из ведра кликов игрока
+            Returns:
+                float: 0 - пачка допустима, иначе через сколько секунд
+                    столько кликов станет допустимо
+        """
+        if self.clicks is None:
+            return 0.0
+        with self._lock:
+            wait = self.clicks.take(user_id, clicks, time.monotonic())
+            if wait:
+                self.shed_clicks += 1
+        return wait
+
+    def collect(self):
+        return [
+            ('webgame_admission_admitted_total', 'counter',
+             'Requests admitted by admission control.', self.admitted),
+            ('webgame_admission_in_flight', 'gauge',
+             'Admitted requests being processed.', self.in_flight),
+            ('webgame_admission_shed_in_flight_total', 'counter',
+             'Requests rejected with 503: too many in flight.', self.shed_in_flight),
+            ('webgame_admission_shed_global_total', 'counter',
+             'Requests rejected with 503: global rate limit.', self.shed_global),
+            ('webgame_admission_shed_user_total', 'counter',
+             'Requests rejected with 429: per-user rate limit.', self.shed_user),
+            ('webgame_admission_shed_clicks_total', 'counter',
+             'Click batches rejected with 429: clickPower above the click rate.', self.shed_clicks),
+            ('webgame_admission_tracked_users', 'gauge',
+             'Players with a request token bucket in memory.', len(self.users) if self.users else 0),
+        ]
+
+
+admission = AdmissionControl()
@@ -0,0 +1,483 @@
+"""
+Архивация игроков, которые давно не заходили
+
+get_current_user создает игрока на каждую сессию без cookie, и таблицы
+users, upgrades, achievements и skins заполняются теми, кто больше не
+вернется. Фоновый проход раз в ARCHIVE_INTERVAL секунд находит игроков
+с last_seen старше ARCHIVE_INACTIVE_DAYS и переносит их в user_archive:
+строка на игрока, прогресс упакован в формате users.progress, вторичных
+индексов нет. Игроки обходятся по user_id пакетами по ARCHIVE_BATCH_SIZE,
+каждый пакет - отдельная короткая транзакция, не больше
+ARCHIVE_MAX_BATCHES пакетов на шард за проход; следующий проход
+продолжает с того же места. После прохода свободные страницы
+возвращаются файлу (PRAGMA incremental_vacuum). Файлы, созданные до
+auto_vacuum=INCREMENTAL, переводит один полный flask archive vacuum.
+
+Игроки с кликами в буфере этого процесса не архивируются. Клики,
+которые другой процесс не успел записать до архивации, ждут в его
+буфере возвращения игрока (services.click_buffer).
+
+Если сессия игрока возвращается, get_current_user восстанавливает его
+из архива (restore): накопленное автопроизводство зачисляется в счет,
+прогресс переводится в текущий режим хранения. Время получения
+достижений и покупки скинов в архиве не хранится, как и в упакованном
+режиме. Пока игрок в архиве, его нет в рейтинге.
+
+users.last_seen - время последнего запроса игрока: get_current_user
+отмечает игрока в памяти (seen) не чаще раза в ARCHIVE_SEEN_INTERVAL,
+а фоновый поток пишет накопленные отметки пакетным UPDATE раз в
+ARCHIVE_SEEN_FLUSH_INTERVAL секунд и перед каждым проходом. Запросы
+на чтение поэтому ничего не пишут, а last_update остается временем
+начисления автопроизводства.
+
+    flask archive run      - проход сейчас (с отчетом)
+    flask archive status   - игроки, архив, свободные страницы по шардам
+    flask archive vacuum   - полный VACUUM с переводом на incremental
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from models import db, production_since, Achievement, ArchivedUser, Skin, Upgrade, User
+from services.catalog import catalog
+from services.click_buffer import click_buffer
+from services.progress import Progress, progress_store
+from services.shards import shards
+from services.signals import users_committed
+
+_PROGRESS_TABLES = (Upgrade.__table__, Achievement.__table__, Skin.__table__)
+
+# Колонки users, которые хранит архив
+_USER_COLUMNS = ('user_id', 'username', 'score', 'per_second', 'state_version',
+                 'active_skin', 'last_update', 'created_at')
+
+
+class UserArchive:
+    """
+    Фоновая архивация неактивных игроков и их восстановление
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.inactive_days = 30
+        self.interval = 3600.0
+        self.seen_interval = 3600.0
+        self.seen_flush_interval = 60.0
+        self.batch_size = 500
+        self.max_batches = 20
+        self.vacuum_pages = 0
+
+        self.archived = 0     # Всего перенесено в архив этим процессом
+        self.restored = 0     # Всего восстановлено
+        self.freed_pages = 0  # Страниц возвращено incremental_vacuum
+        self.seen_writes = 0  # Записано отметок last_seen
+        self.last_report = None
+        self._cursors = {}    # Шард -> user_id, с которого продолжить обход
+        self._seen = {}       # user_id -> time.monotonic() последней отметки
+        self._unwritten = {}  # user_id -> last_seen, еще не записанное в базу
+
+        self._stopped = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        # Как фоновый поток вызывает проход (по умолчанию - напрямую)
+        self.runner = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+            Подключить архивацию: фоновый проход, CLI и метрики
+            Args:
+                app: Flask application
+        """
+        self.app = app
+        self.inactive_days = app.config.get('ARCHIVE_INACTIVE_DAYS', 30)
+        self.interval = app.config.get('ARCHIVE_INTERVAL', 3600.0)
+        self.seen_interval = app.config.get('ARCHIVE_SEEN_INTERVAL', 3600.0)
+        self.seen_flush_interval = app.config.get('ARCHIVE_SEEN_FLUSH_INTERVAL', 60.0)
+        self.batch_size = app.config.get('ARCHIVE_BATCH_SIZE', 500)
+        self.max_batches = app.config.get('ARCHIVE_MAX_BATCHES', 20)
+        self.vacuum_pages = app.config.get('ARCHIVE_VACUUM_PAGES', 0)
+        app.extensions['user_archive'] = self
+        app.cli.add_command(archive_command)
+        # Фоновый поток запускается с первым запросом (не в CLI)
+        app.before_request(self._ensure_worker)
+
+        metrics = app.extensions.get('metrics')
+        if metrics is not None:
+            metrics.add_collector(self.collect)
+
+    # Активность игроков
+
+    def seen(self, user_id):
+        """
+            Отметить запрос игрока (last_seen запишет фоновый поток)
+            Args:
+                user_id: id игрока из сессии
+        """
+        now = time.monotonic()
+        with self._lock:
+            recorded = self._seen.get(user_id)
+            if recorded is not None and now - recorded < self.seen_interval:
+                return
+            self._seen[user_id] = now
+            self._unwritten[user_id] = datetime.now()
+
+    def write_seen(self):
+        """
+            Записать накопленные отметки last_seen (UPDATE на шард)
+            Returns:
+                int: Записано игроков
+        """
+        now = time.monotonic()
+        with self._lock:
+            unwritten, self._unwritten = self._unwritten, {}
+            # Старые отметки больше не сдерживают запись - память не растет
+            self._seen = {
+                user_id: recorded for user_id, recorded in self._seen.items()
+                if now - recorded < self.seen_interval
+            }
+        if not unwritten:
+            return 0
+
+        users = User.__table__
+        stmt = (
+            update(users)
+            .where(users.c.user_id == bindparam('b_user_id'))
+            .values(last_seen=bindparam('b_last_seen'))
+        )
+        groups = {}
+        for user_id, last_seen in unwritten.items():
+            groups.setdefault(shards.shard_for(user_id), []).append(
+                {'b_user_id': user_id, 'b_last_seen': last_seen}
+            )
+        written = set()
+        try:
+            with self.app.app_context():
+                for shard, rows in groups.items():
+                    with shards.engine(shard).begin() as conn:
+                        conn.execute(stmt, rows)
+                    written.update(row['b_user_id'] for row in rows)
+        except Exception:
+            # Незаписанные отметки - со следующей записью
+            with self._lock:
+                for user_id, last_seen in unwritten.items():
+                    if user_id not in written:
+                        self._unwritten.setdefault(user_id, last_seen)
+            raise
+        finally:
+            with self._lock:
+                self.seen_writes += len(written)
+        return len(written)
+
+    # Архивация
+
+    def run_pass(self):
+        """
+            Один проход по всем шардам: архивация пакетами и vacuum
+            Returns:
+                dict: Отчет - перенесено игроков, пакетов, освобождено
+                страниц и затраченное время
+        """
+        started = time.perf_counter()
+        cutoff = datetime.now() - timedelta(days=self.inactive_days)
+        report = {'archived': 0, 'batches': 0, 'freed_pages': 0, 'seconds': 0.0}
+
+        # Игроки, отмеченные этим процессом, не должны выглядеть неактивными
+        self.write_seen()
+
+        with self.app.app_context():
+            for shard in shards.shards:
+                after = self._cursors.get(shard, 0)
+                for _ in range(self.max_batches):
+                    try:
+                        archived, after = self.archive_batch(shard, cutoff, after)
+                    except (IntegrityError, OperationalError) as exc:
+                        # Игроков пакета записал другой процесс или база
+                        # занята - продолжим на следующем проходе
+                        self.app.logger.warning('Archive batch on shard %s skipped: %s', shard, exc)
+                        break
+                    report['batches'] += 1
+                    report['archived'] += archived
+                    if after is None:
+                        break
+                # Шард просмотрен до конца - следующий проход с начала
+                self._cursors[shard] = after or 0
+                report['freed_pages'] += self.vacuum(shard)
+
+        report['seconds'] = round(time.perf_counter() - started, 3)
+        with self._lock:
+            self.archived += report['archived']
+            self.freed_pages += report['freed_pages']
+            self.last_report = report
+        self.app.logger.info(
+            'Archived %(archived)s users in %(batches)s batches, '
+            'freed %(freed_pages)s pages, %(seconds)ss', report
+        )
+        return report
+
+    def archive_batch(self, shard, cutoff, after=0):
+        """
+            Перенести в архив неактивных игроков шарда с user_id > after
+            (одна транзакция)
+            Returns:
+                tuple: (перенесено игроков, последний просмотренный user_id
+                или None, если шард просмотрен до конца)
+        """
+        users = User.__table__
+        archive = ArchivedUser.__table__
+        last_seen = func.coalesce(users.c.last_seen, users.c.last_update, users.c.created_at)
+
+        with shards.engine(shard).begin() as conn:
+            # Обход по первичному ключу: весь проход - один просмотр таблицы
+            scanned = conn.execute(
+                select(users.c.user_id)
+                .where(users.c.user_id > after)
+                .order_by(users.c.user_id)
+                .limit(self.batch_size)
+            ).scalars().all()
+            if not scanned:
+                return 0, None
+
+            rows = conn.execute(
+                select(*(users.c[key] for key in _USER_COLUMNS), users.c.progress)
+                .where(users.c.user_id.in_(scanned), last_seen < cutoff)
+            ).all()
+            # Игрок с кликами в буфере этого процесса не бездействует
+            rows = [row for row in rows if not click_buffer.pending(row.user_id)]
+            user_ids = [row.user_id for row in rows]
+            if user_ids:
+                progress = self._pack_progress(conn, rows)
+                now = datetime.now()
+                conn.execute(insert(archive), [
+                    dict(
+                        {key: getattr(row, key) for key in _USER_COLUMNS},
+                        score=row.score or 0,
+                        per_second=row.per_second or 0,
+                        state_version=row.state_version or 0,
+                        progress=progress[row.user_id],
+                        archived_at=now,
+                    )
+                    for row in rows
+                ])
+                for table in _PROGRESS_TABLES:
+                    conn.execute(delete(table).where(table.c.user_id.in_(user_ids)))
+                conn.execute(delete(users).where(users.c.user_id.in_(user_ids)))
+
+        if user_ids:
+            # Кэш пользователей и рейтинг забывают удаленных игроков
+            users_committed.send(self, changes=dict.fromkeys(user_ids))
+        last = scanned[-1] if len(scanned) == self.batch_size else None
+        return len(user_ids), last
+
+    @staticmethod
+    def _pack_progress(conn, rows):
+        """
+            Прогресс игроков в формате users.progress
+            Returns:
+                dict: user_id -> bytes
+        """
+        packed = {row.user_id: row.progress for row in rows if row.progress is not None}
+        progress = {row.user_id: Progress() for row in rows if row.progress is None}
+        if progress:
+            user_ids = list(progress)
+            upgrades, achievements, skins = _PROGRESS_TABLES
+            for user_id, name, level in conn.execute(
+                select(upgrades.c.user_id, upgrades.c.name, upgrades.c.level)
+                .where(upgrades.c.user_id.in_(user_ids))
+            ):
+                template = catalog.upgrades.by_name.get(name)
+                if template is not None and level:
+                    progress[user_id].set_level(template['id'], level)
+            for table, section, add in (
+                (achievements, catalog.achievements, Progress.add_achievement),
+                (skins, catalog.skins, Progress.add_skin),
+            ):
+                for user_id, name in conn.execute(
+                    select(table.c.user_id, table.c.name).where(table.c.user_id.in_(user_ids))
+                ):
+                    template = section.by_name.get(name)
+                    if template is not None:
+                        add(progress[user_id], template['id'])
+            packed.update((user_id, p.encode()) for user_id, p in progress.items())
+        return packed
+
+    def vacuum(self, shard):
+        """
+            Вернуть файлу свободные страницы шарда (auto_vacuum=INCREMENTAL)
+            Returns:
+                int: Освобождено страниц
+        """
+        engine = shards.engine(shard)
+        if engine.dialect.name != 'sqlite':
+            return 0
+        with engine.connect() as conn:
+            if conn.exec_driver_sql('PRAGMA auto_vacuum').scalar() != 2:
+                return 0
+            before = conn.exec_driver_sql('PRAGMA freelist_count').scalar()
+            pages = min(before, self.vacuum_pages) if self.vacuum_pages else before
+            if not pages:
+                return 0
+            # Драйвер выполняет один шаг запроса - одна страница за вызов.
+            # Все шаги - в одной транзакции, иначе каждый пишет свой коммит в WAL
+            conn.exec_driver_sql('BEGIN IMMEDIATE')
+            for _ in range(pages):
+                conn.exec_driver_sql('PRAGMA incremental_vacuum(1)')
+            conn.commit()
+            return before - conn.exec_driver_sql('PRAGMA freelist_count').scalar()
+
+    # Восстановление
+
+    def restore(self, user_id):
+        """
+            Вернуть игрока из архива в шард текущей сессии
+            Returns:
+                User или None, если игрока нет и в архиве
+        """
+        archived = db.session.get(ArchivedUser, user_id)
+        if archived is None:
+            return None
+
+        user = User()
+        for key in _USER_COLUMNS:
+            setattr(user, key, getattr(archived, key))
+        # Автопроизводство за время отсутствия - в счет, как при списании
+        user.score = archived.score + production_since(archived.per_second, archived.last_update)
+        user.last_update = user.last_seen = datetime.now()
+        user.touch()
+        db.session.delete(archived)
+        db.session.add(user)
+        if progress_store.packed:
+            user.progress = archived.progress
+        else:
+            upgrades, achievements, skins = Progress.decode(archived.progress).to_rows()
+            for row in upgrades + achievements + skins:
+                row.user_id = user_id
+                row.changed_version = user.state_version
+                db.session.add(row)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Игрока восстановил параллельный запрос
+            db.session.rollback()
+            return db.session.get(User, user_id)
+
+        with self._lock:
+            self.restored += 1
+            self._seen[user_id] = time.monotonic()
+        return user
+
+    # Фоновый поток
+
+    def _ensure_worker(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='user-archive', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        next_pass = time.monotonic() + self.interval
+        while not self._stopped.wait(self.seen_flush_interval):
+            # Проход только по ARCHIVE_INTERVAL (0 - только flask archive run)
+            due = self.interval > 0 and time.monotonic() >= next_pass
+            try:
+                self._call(self.run_pass if due else self.write_seen)
+            except Exception:
+                self.app.logger.exception('User archive pass failed')
+            if due:
+                next_pass = time.monotonic() + self.interval
+
+    def _call(self, func):
+        if self.runner is not None:
+            return self.runner(func)
+        return func()
+
+    def stop(self):
+        """Остановить фоновый поток"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    # Метрики
+
+    def collect(self):
+        """
+            Счетчики для /metrics
+            Returns:
+                list: (имя, тип, описание, значение)
+        """
+        with self._lock:
+            report = self.last_report or {}
+            return [
+                ('webgame_archive_users_total', 'counter', 'Users moved to the archive.', self.archived),
+                ('webgame_archive_restored_total', 'counter', 'Users restored from the archive.', self.restored),
+                ('webgame_archive_freed_pages_total', 'counter', 'Pages freed by incremental vacuum.', self.freed_pages),
+                ('webgame_archive_seen_writes_total', 'counter', 'Users whose last_seen was written.', self.seen_writes),
+                ('webgame_archive_last_pass_seconds', 'gauge', 'Duration of the last archive pass.',
+                 report.get('seconds', 0)),
+            ]
+
+
+user_archive = UserArchive()
+
+
+@click.group('archive')
+def archive_command():
+    """Архив игроков, которые давно не заходили"""
+
+
+@archive_command.command('run')
+@click.option('--days', type=int, help='Неактивны дольше (по умолчанию ARCHIVE_INACTIVE_DAYS)')
+@with_appcontext
+def archive_run_command(days):
+    """Архивировать неактивных игроков сейчас и освободить место"""
+    if days is not None:
+        user_archive.inactive_days = days
+    report = user_archive.run_pass()
+    click.echo(
+        f"Архивировано игроков: {report['archived']} (пакетов: {report['batches']}), "
+        f"освобождено страниц: {report['freed_pages']}, время: {report['seconds']} с"
+    )
+
+
+@archive_command.command('status')
+@with_appcontext
+def archive_status_command():
+    """Игроки, архив и свободные страницы по шардам"""
+    for shard in shards.shards:
+        with shards.engine(shard).connect() as conn:
+            active = conn.execute(select(func.count()).select_from(User.__table__)).scalar()
+            archived = conn.execute(select(func.count()).select_from(ArchivedUser.__table__)).scalar()
+            mode = conn.exec_driver_sql('PRAGMA auto_vacuum').scalar()
+            free = conn.exec_driver_sql('PRAGMA freelist_count').scalar()
+        vacuum = {0: 'NONE', 1: 'FULL', 2: 'INCREMENTAL'}.get(mode, mode)
+        click.echo(f'shard {shard}: {active} users, {archived} archived, '
+                   f'{free} free pages, auto_vacuum={vacuum}')
+
+
+@archive_command.command('vacuum')
+@with_appcontext
+def archive_vacuum_command():
+    """
+    Полный VACUUM каждого шарда с переходом на auto_vacuum=INCREMENTAL
+    (нужен один раз для файлов, созданных раньше; блокирует базу)
+    """
+    for shard in shards.shards:
+        started = time.perf_counter()
+        with shards.engine(shard).connect() as conn:
+            before = conn.exec_driver_sql('PRAGMA page_count').scalar()
+            conn.exec_driver_sql('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.exec_driver_sql('VACUUM')
+            after = conn.exec_driver_sql('PRAGMA page_count').scalar()
+        click.echo(f'shard {shard}: {before} -> {after} pages, '
+                   f'{time.perf_counter() - started:.2f} s')
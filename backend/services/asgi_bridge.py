@@ -0,0 +1,256 @@
+"""
+ASGI-режим: те же blueprint'ы в цикле событий asyncio
+
+Каждый HTTP-запрос выполняется как WSGI-вызов app.wsgi_app внутри
+greenlet (greenlet_spawn SQLAlchemy). Движки в этом режиме асинхронные
+(ASYNC_DATABASE, драйвер aiosqlite): когда обработчик выполняет SQL,
+greenlet отдает управление циклу событий до ответа драйвера, и в это
+время обрабатываются другие запросы. Код routes/ и services/ общий с
+потоковым режимом - отличается только то, кто ждет базу: поток сервера
+или цикл событий.
+
+Потоковые ответы без Content-Length (SSE /api/user/stream) блокируются
+на очереди событий, поэтому их тело читается в отдельном потоке.
+Фоновая запись буфера кликов, проход архивации и проверка достижений
+пулом потоков выполняются в цикле событий (runner).
+
+    uvicorn asgi:application
+"""
+import asyncio
+import io
+import sys
+import threading
+
+from sqlalchemy.util.concurrency import greenlet_spawn
+
+from models import db
+from services import schema
+from services.achievement_jobs import achievement_jobs
+from services.archive import user_archive
+from services.click_buffer import click_buffer
+from services.leaderboard import leaderboard
+
+# Конец потокового тела ответа
+_DONE = object()
+
+
+class AsgiBridge:
+    """
+    ASGI-приложение (HTTP и lifespan) поверх Flask-приложения
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.loop = None
+        self._started = False
+        self._startup_lock = asyncio.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            if not self._started:
+                # Сервер без lifespan: запускаемся при первом запросе
+                async with self._startup_lock:
+                    if not self._started:
+                        await self.startup()
+            await self._http(scope, receive, send)
+        elif scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        else:
+            raise ValueError(f"Unsupported ASGI scope: {scope['type']}")
+
+    # Жизненный цикл
+
+    async def startup(self):
+        """Обновить схему и перевести фоновую запись кликов в цикл событий"""
+        self.loop = asyncio.get_running_loop()
+        click_buffer.runner = self.run_threadsafe
+        user_archive.runner = self.run_threadsafe
+        achievement_jobs.runner = self.run_threadsafe
+        leaderboard.runner = self.run_threadsafe
+        if self.app.config.get('SCHEMA_AUTO_UPGRADE', True):
+            await greenlet_spawn(self._in_app_context, schema.upgrade_schema)
+        # Рейтинг строится из базы сразу, а не с первым запросом
+        leaderboard.start()
+        self._started = True
+
+    async def shutdown(self):
+        """Дописать буфер кликов и закрыть соединения с базой"""
+        await self.loop.run_in_executor(None, click_buffer.stop)
+        await self.loop.run_in_executor(None, user_archive.stop)
+        await self.loop.run_in_executor(None, achievement_jobs.stop)
+        await self.loop.run_in_executor(None, leaderboard.stop)
+        await greenlet_spawn(click_buffer.flush)
+        await greenlet_spawn(achievement_jobs.flush)
+        await greenlet_spawn(self._in_app_context, self._dispose_engines)
+        click_buffer.runner = None
+        user_archive.runner = None
+        achievement_jobs.runner = None
+        leaderboard.runner = None
+        self._started = False
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.startup()
+                except Exception as exc:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(exc)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _in_app_context(self, fn):
+        with self.app.app_context():
+            return fn()
+
+    @staticmethod
+    def _dispose_engines():
+        for engine in db.engines.values():
+            engine.dispose()
+
+    def run_threadsafe(self, fn):
+        """
+            Выполнить fn с доступом к базе из другого потока:
+            в greenlet цикла событий, дождавшись результата
+        """
+        return asyncio.run_coroutine_threadsafe(greenlet_spawn(fn), self.loop).result()
+
+    # HTTP
+
+    async def _http(self, scope, receive, send):
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = headers
+            return _write_unsupported
+
+        environ = build_environ(scope, bytes(body))
+        app_iter = await greenlet_spawn(self.app.wsgi_app, environ, start_response)
+        headers = response['headers']
+        start = {
+            'type': 'http.response.start',
+            'status': response['status'],
+            'headers': [
+                (name.lower().encode('latin-1'), value.encode('latin-1'))
+                for name, value in headers
+            ],
+        }
+
+        streamed = response['status'] not in (204, 304) and not any(
+            name.lower() == 'content-length' for name, _ in headers
+        )
+        if streamed:
+            await send(start)
+            await self._stream(app_iter, send)
+            return
+
+        try:
+            await send(start)
+            for chunk in app_iter:
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            close = getattr(app_iter, 'close', None)
+            if close is not None:
+                await greenlet_spawn(close)
+
+    async def _stream(self, app_iter, send):
+        """
+            Отправлять тело, которое читается (и закрывается) в отдельном
+            потоке: генератор может ждать событий сколько угодно
+        """
+        chunks = asyncio.Queue()
+        loop = self.loop
+        stopped = threading.Event()
+
+        def pump():
+            try:
+                for chunk in app_iter:
+                    if stopped.is_set():
+                        break
+                    loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+            finally:
+                close = getattr(app_iter, 'close', None)
+                if close is not None:
+                    close()
+                loop.call_soon_threadsafe(chunks.put_nowait, _DONE)
+
+        threading.Thread(target=pump, name='asgi-stream', daemon=True).start()
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is _DONE:
+                    break
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            # Клиент отключился: поток выйдет после следующего события
+            stopped.set()
+
+
+def _write_unsupported(data):
+    raise RuntimeError('WSGI write() is not supported in ASGI mode')
+
+
+def build_environ(scope, body):
+    """
+        WSGI environ (PEP 3333) для HTTP-запроса ASGI
+        Args:
+            scope: ASGI scope типа http
+            body: Тело запроса целиком
+    """
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    client = scope.get('client')
+    if client:
+        environ['REMOTE_ADDR'] = client[0]
+        environ['REMOTE_PORT'] = str(client[1])
+
+    for raw_name, raw_value in scope.get('headers', []):
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        if name == 'CONTENT_TYPE' or name == 'CONTENT_LENGTH':
+            key = name
+        else:
+            key = f'HTTP_{name}'
+        if key in environ:
+            separator = '; ' if key == 'HTTP_COOKIE' else ','
+            value = environ[key] + separator + value
+        environ[key] = value
+
+    # Тело уже прочитано целиком (в том числе chunked)
+    if body:
+        environ['CONTENT_LENGTH'] = str(len(body))
+    return environ
@@ -0,0 +1,288 @@
+"""
+Сборка статики: имена с хэшем содержимого и заранее сжатые варианты
+
+    flask assets build   - собрать ASSETS_DIR из static/ и index.html
+    flask assets clean   - удалить сборку (снова отдается static/)
+
+Для каждого файла static/ сборка пишет копию с хэшем содержимого в имени
+(js/game.js -> js/game.<sha256[:12]>.js) и рядом варианты .gz и .br
+(brotli - если установлен пакет Brotli), а также manifest.json:
+исходное имя -> имя с хэшем. index.html рендерится один раз со ссылками
+на файлы с хэшем и сжимается так же.
+
+Файлы сборки отдает routes.asset_routes: вариант выбирается по
+Accept-Encoding, файлы с хэшем кэшируются как immutable, index.html -
+с ETag и no-cache. Сжатия во время запроса нет. Без сборки asset_url в
+шаблонах возвращает обычный /static/ URL, а index.html рендерится как
+раньше (режим разработки). Манифест читается при запуске: после сборки
+процессы сервера перезапускаются.
+
+Сборка пишется в соседний временный каталог и подменяет ASSETS_DIR
+переименованием, поэтому работающие процессы не видят каталог
+наполовину собранным, а при ошибке остается прежняя сборка.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+import click
+from flask import current_app, render_template, request, send_from_directory, url_for
+from flask.cli import with_appcontext
+
+try:
+    import brotli
+except ImportError:  # Необязательная зависимость: без нее только gzip
+    brotli = None
+
+MANIFEST = 'manifest.json'
+INDEX = 'index.html'
+
+# Файлы меньше этого размера не сжимаются: выигрыш меньше заголовков
+MIN_COMPRESS_SIZE = 256
+
+# Варианты сжатия в порядке предпочтения: (кодировка, суффикс файла)
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+class AssetPipeline:
+    """
+    Манифест собранной статики и выбор сжатого варианта файла
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.directory = None
+        self.manifest = {}
+        self.hashed = frozenset()  # Имена файлов сборки, которые можно отдавать
+        self.index_hash = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+            Загрузить манифест сборки и подключить asset_url и CLI
+            Args:
+                app: Flask application
+        """
+        self.app = app
+        self.directory = app.config.get('ASSETS_DIR') or os.path.join(app.root_path, 'dist')
+        app.extensions['assets'] = self
+        app.add_template_global(self.url, 'asset_url')
+        app.cli.add_command(assets_cli)
+        self.load()
+
+    def load(self):
+        """
+            Прочитать manifest.json сборки
+            Returns:
+                bool: Сборка есть
+        """
+        path = os.path.join(self.directory, MANIFEST)
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            self.manifest, self.hashed, self.index_hash = {}, frozenset(), None
+            return False
+        self.manifest = data['files']
+        self.hashed = frozenset(self.manifest.values())
+        self.index_hash = data.get('index_hash')
+        return True
+
+    @property
+    def built(self):
+        return bool(self.manifest)
+
+    @property
+    def has_index(self):
+        """index.html есть в сборке"""
+        return self.index_hash is not None
+
+    def url(self, filename):
+        """
+            URL файла статики для шаблона: с хэшем, если есть сборка
+            Args:
+                filename: Путь внутри static/ ('js/game.js')
+        """
+        hashed = self.manifest.get(filename)
+        if hashed is None:
+            return url_for('static', filename=filename)
+        return url_for('assets.get_asset', filename=hashed)
+
+    # Отдача
+
+    def send(self, filename):
+        """
+            Ответ с файлом сборки в лучшей кодировке из Accept-Encoding
+            (send_from_directory не выпускает путь за пределы каталога)
+        """
+        mimetype = None
+        for encoding, suffix in ENCODINGS:
+            if request.accept_encodings[encoding] <= 0:
+                continue
+            if not os.path.isfile(os.path.join(self.directory, filename + suffix)):
+                continue
+            mimetype = mimetype or _guess_mimetype(filename)
+            response = send_from_directory(
+                self.directory, filename + suffix, mimetype=mimetype, etag=True
+            )
+            response.headers['Content-Encoding'] = encoding
+            break
+        else:
+            response = send_from_directory(self.directory, filename, etag=True)
+        response.vary.add('Accept-Encoding')
+        return response
+
+    # Сборка
+
+    def build(self, static_folder, render_index=None):
+        """
+            Собрать статику в self.directory (старая сборка заменяется
+            после успешной сборки)
+            Args:
+                static_folder: Каталог исходной статики
+                render_index: Функция без аргументов, возвращает HTML
+                    главной страницы (после записи манифеста)
+            Returns:
+                list: (имя в сборке, байт, байт gzip, байт br) по файлам
+        """
+        staging = f'{self.directory}.tmp-{os.getpid()}'
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        try:
+            report = self._build(staging, static_folder, render_index)
+            self._swap(staging)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            self.load()  # Манифест прежней сборки
+            raise
+        self.load()
+        return report
+
+    def _build(self, staging, static_folder, render_index):
+        """Записать сборку в каталог staging"""
+        files, report = {}, []
+        for root, _, names in os.walk(static_folder):
+            for name in sorted(names):
+                source = os.path.join(root, name)
+                relative = os.path.relpath(source, static_folder).replace(os.sep, '/')
+                with open(source, 'rb') as f:
+                    data = f.read()
+                stem, ext = os.path.splitext(relative)
+                hashed = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+                files[relative] = hashed
+                report.append((hashed, *self._write(staging, hashed, data)))
+
+        index_hash = None
+        if render_index is not None:
+            # Ссылки в index.html - уже на файлы с хэшем
+            self.manifest = files
+            data = render_index().encode('utf-8')
+            index_hash = hashlib.sha256(data).hexdigest()[:16]
+            report.append((INDEX, *self._write(staging, INDEX, data)))
+
+        with open(os.path.join(staging, MANIFEST), 'w', encoding='utf-8') as f:
+            json.dump({'files': files, 'index_hash': index_hash}, f, ensure_ascii=False, indent=2)
+        return report
+
+    def _swap(self, staging):
+        """
+            Поставить собранный каталог на место self.directory
+            (os.replace не заменяет непустой каталог, поэтому старая сборка
+            сначала отодвигается в сторону и удаляется после подмены)
+        """
+        old = f'{self.directory}.old-{os.getpid()}'
+        shutil.rmtree(old, ignore_errors=True)
+        if os.path.isdir(self.directory):
+            os.replace(self.directory, old)
+        os.replace(staging, self.directory)
+        shutil.rmtree(old, ignore_errors=True)
+
+    def _write(self, directory, name, data):
+        """
+            Записать файл и его сжатые варианты
+            Returns:
+                tuple: (байт, байт gzip или None, байт br или None)
+        """
+        path = os.path.join(directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+        gz = br = None
+        if len(data) >= MIN_COMPRESS_SIZE and _compressible(name):
+            # mtime=0: одинаковое содержимое - одинаковый .gz
+            gz = self._write_variant(path + '.gz', data, gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli is not None:
+                br = self._write_variant(path + '.br', data, brotli.compress(data, quality=11))
+        return len(data), gz, br
+
+    @staticmethod
+    def _write_variant(path, data, compressed):
+        """Записать сжатый вариант, если он меньше оригинала"""
+        if len(compressed) >= len(data):
+            return None
+        with open(path, 'wb') as f:
+            f.write(compressed)
+        return len(compressed)
+
+    def clean(self):
+        """Удалить сборку"""
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.manifest, self.hashed, self.index_hash = {}, frozenset(), None
+
+
+def _guess_mimetype(filename):
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+
+def _compressible(filename):
+    mimetype = _guess_mimetype(filename)
+    return mimetype.startswith('text/') or mimetype in (
+        'application/javascript', 'application/json', 'image/svg+xml'
+    )
+
+
+assets = AssetPipeline()
+
+
+# CLI: flask assets ...
+
+@click.group('assets')
+def assets_cli():
+    """Сборка статики с хэшами в именах и сжатыми вариантами"""
+
+
+@assets_cli.command('build')
+@with_appcontext
+def build_command():
+    """Собрать статику и index.html в ASSETS_DIR"""
+    app = current_app._get_current_object()
+
+    def render_index():
+        with app.test_request_context('/'):
+            return render_template(INDEX)
+
+    report = assets.build(app.static_folder, render_index)
+
+    def size(value):
+        return '-' if value is None else str(value)
+
+    click.echo(f"{'file':<40} {'bytes':>8} {'gzip':>8} {'br':>8}")
+    for name, raw, gz, br in report:
+        click.echo(f'{name:<40} {raw:>8} {size(gz):>8} {size(br):>8}')
+    if brotli is None:
+        click.echo('brotli: пакет Brotli не установлен, собраны только варианты gzip')
+    click.echo(f'Сборка: {assets.directory}')
+
+
+@assets_cli.command('clean')
+@with_appcontext
+def clean_command():
+    """Удалить сборку (статика снова отдается из static/)"""
+    assets.clean()
+    click.echo(f'Удалено: {assets.directory}')
@@ -0,0 +1,92 @@
+"""
+Каталог игры: неизменяемый реестр шаблонов из game_data
+
+Строится один раз при импорте. Шаблоны заморожены (MappingProxyType и
+кортежи), к ним есть индексы по id и по имени. JSON каталога
+сериализуется заранее, а его хэш (version) служит ETag и меняется
+только вместе с содержимым, поэтому /api/catalog/?v=<version> можно
+кэшировать навсегда. Ответы по пользователю содержат только id,
+уровни и флаги - названия, цены и цвета клиент берет из каталога.
+"""
+import hashlib
+import json
+from types import MappingProxyType
+
+from services.game_data import ACHIEVEMENT_TEMPLATES, SKIN_TEMPLATES, UPGRADE_TEMPLATES
+
+
+def _freeze(value):
+    """Неизменяемая копия шаблона"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+class Section:
+    """
+    Шаблоны одного вида в порядке каталога с индексами по id и имени
+    """
+
+    __slots__ = ('items', 'by_id', 'by_name')
+
+    def __init__(self, kind, templates):
+        items = tuple(_freeze(t) for t in templates)
+        by_id, by_name = {}, {}
+        for template in items:
+            if template['id'] in by_id:
+                raise ValueError(f"Duplicate {kind} id: {template['id']}")
+            if template['name'] in by_name:
+                raise ValueError(f"Duplicate {kind} name: {template['name']}")
+            by_id[template['id']] = template
+            by_name[template['name']] = template
+
+        object.__setattr__(self, 'items', items)
+        object.__setattr__(self, 'by_id', MappingProxyType(by_id))
+        object.__setattr__(self, 'by_name', MappingProxyType(by_name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Catalog is immutable')
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class Catalog:
+    """
+    Все шаблоны игры, JSON каталога и его версия
+    """
+
+    __slots__ = ('upgrades', 'achievements', 'skins', 'default_skin', 'body', 'version')
+
+    def __init__(self, upgrades, achievements, skins):
+        payload = {
+            'upgrades': list(upgrades),
+            'achievements': list(achievements),
+            'skins': list(skins),
+        }
+        body = json.dumps(
+            payload, ensure_ascii=False, sort_keys=True, separators=(',', ':')
+        ).encode('utf-8')
+
+        values = {
+            'upgrades': Section('upgrade', upgrades),
+            'achievements': Section('achievement', achievements),
+            'skins': Section('skin', skins),
+            # Бесплатный скин есть у всех и выбран по умолчанию
+            'default_skin': next(t['name'] for t in skins if t['base_cost'] == 0),
+            'body': body,
+            'version': hashlib.sha256(body).hexdigest()[:16],
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Catalog is immutable')
+
+
+catalog = Catalog(UPGRADE_TEMPLATES, ACHIEVEMENT_TEMPLATES, SKIN_TEMPLATES)
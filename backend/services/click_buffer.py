@@ -0,0 +1,280 @@
+"""
+Буфер кликов с отложенной записью (write-behind)
+
+Клики подтверждаются сразу, а в users.score попадают пакетным UPDATE
+раз в CLICK_FLUSH_INTERVAL секунд или досрочно, когда в буфере
+накопилось CLICK_BUFFER_MAX_USERS пользователей. В ASGI-режиме фоновый
+поток только отсчитывает интервал, а сама запись выполняется в цикле
+событий (runner задает services.asgi_bridge).
+
+Игрока могут перенести в архив (services.archive), пока его клики ждут
+записи, в том числе другим процессом. UPDATE для него не находит строку:
+такие клики остаются в буфере и записываются, когда игрок вернется
+из архива. Клики игроков, которых нет ни в users, ни в архиве,
+отбрасываются.
+
+Если пакет шарда не записался из-за данных (а не из-за занятой базы),
+он пишется по одной строке: строка, которую база не принимает, попадает
+в лог и отбрасывается, а не возвращается в буфер, где она срывала бы
+каждый следующий flush. Ожидающие клики игрока ограничены int64.
+"""
+import atexit
+import threading
+
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.exc import OperationalError
+
+from models import db, ArchivedUser, User
+from services.shards import shards
+from services.signals import BASE_FIELDS, users_committed
+
+# Больше не помещается в INTEGER SQLite (int64): такой пакет база не примет
+MAX_PENDING = 2 ** 63 - 1
+
+
+class ClickBuffer:
+    """
+    Накопитель кликов по пользователям внутри процесса
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.flush_interval = 1.0
+        self.max_users = 1000
+
+        self._pending = {}   # user_id -> клики, еще не отправленные в базу
+        self._inflight = {}  # user_id -> клики, которые пишутся прямо сейчас
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        # Как фоновый поток вызывает flush (по умолчанию - напрямую)
+        self.runner = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+            Подключить буфер к приложению
+            Args:
+                app: Flask application
+        """
+        self.app = app
+        self.flush_interval = app.config.get('CLICK_FLUSH_INTERVAL', 1.0)
+        self.max_users = app.config.get('CLICK_BUFFER_MAX_USERS', 1000)
+        app.extensions['click_buffer'] = self
+
+        # Все, что накопилось, записываем при остановке процесса
+        atexit.register(self.shutdown)
+
+    def add(self, user_id, clicks):
+        """
+            Добавить клики пользователя в буфер
+            Returns:
+                int: Клики пользователя, которых еще нет в users.score
+        """
+        with self._lock:
+            self._add_pending(user_id, clicks)
+            pending = self._pending[user_id] + self._inflight.get(user_id, 0)
+            overflow = len(self._pending) >= self.max_users
+
+        if self.flush_interval <= 0:
+            self.flush()
+            self._expire_score(user_id)
+        elif overflow:
+            self._wakeup.set()
+            self._ensure_flusher()
+        else:
+            self._ensure_flusher()
+
+        return pending
+
+    def _expire_score(self, user_id):
+        """Загруженный в сессию пользователь должен увидеть записанный счет"""
+        user = db.session.identity_map.get(db.session.identity_key(User, user_id))
+        if user is not None:
+            db.session.expire(user, ['score'])
+
+    def pending(self, user_id):
+        """Клики пользователя, которых еще нет в users.score"""
+        with self._lock:
+            return self._pending.get(user_id, 0) + self._inflight.get(user_id, 0)
+
+    def take(self, user_id):
+        """
+            Забрать ожидающие клики пользователя, чтобы записать их
+            вместе с покупкой (см. services.wallet)
+            Returns:
+                int: Количество забранных кликов
+        """
+        with self._lock:
+            return self._pending.pop(user_id, 0)
+
+    def restore(self, user_id, clicks):
+        """Вернуть в буфер клики, забранные take, если покупка не записана"""
+        with self._lock:
+            self._add_pending(user_id, clicks)
+        if self.flush_interval > 0:
+            self._ensure_flusher()
+
+    def flush(self):
+        """
+            Записать накопленные клики пакетным UPDATE (по одному на шард)
+            Returns:
+                int: Количество обновленных пользователей
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                self._inflight, self._pending = self._pending, {}
+                batch = [
+                    {'b_user_id': user_id, 'b_clicks': clicks}
+                    for user_id, clicks in self._inflight.items()
+                ]
+
+            # Пакет на каждый шард (без шардирования - один); клики
+            # шардов, которые успели записаться до ошибки, не возвращаются
+            changes = {}
+            written = set()
+            archived = set()
+            try:
+                with self.app.app_context():
+                    groups = {}
+                    for row in batch:
+                        groups.setdefault(shards.shard_for(row['b_user_id']), []).append(row)
+
+                    for shard, rows in groups.items():
+                        try:
+                            results = [self._write(shard, rows)]
+                        except OperationalError:
+                            raise  # База занята или недоступна - повторим пакет
+                        except Exception:
+                            # Строка, которую база не принимает, не должна
+                            # блокировать остальные: пишем по одной
+                            results = self._write_rows(shard, rows)
+                        written.update(row['b_user_id'] for row in rows)
+                        for selected, shard_archived in results:
+                            archived.update(shard_archived)
+                            if users_committed.receivers:
+                                changes.update(
+                                    (row[0], dict(zip(BASE_FIELDS, row[1:]))) for row in selected
+                                )
+            except Exception:
+                # Возвращаем клики в буфер, чтобы не потерять их
+                with self._lock:
+                    for user_id, clicks in self._inflight.items():
+                        if user_id not in written or user_id in archived:
+                            self._add_pending(user_id, clicks)
+                    self._inflight = {}
+                if changes:
+                    users_committed.send(self, changes=changes)
+                raise
+
+            with self._lock:
+                # Игроки в архиве: клики дождутся их возвращения
+                for user_id in archived:
+                    self._add_pending(user_id, self._inflight[user_id])
+                self._inflight = {}
+
+            if changes:
+                users_committed.send(self, changes=changes)
+            return len(batch) - len(archived)
+
+    def _write(self, shard, rows):
+        """
+            Записать клики пакетом в одной транзакции шарда
+            Returns:
+                tuple: (новые значения найденных строк users,
+                    id игроков из rows, которые сейчас в архиве)
+        """
+        users = User.__table__
+        stmt = (
+            update(users)
+            .where(users.c.user_id == bindparam('b_user_id'))
+            .values(score=users.c.score + bindparam('b_clicks'))
+        )
+        user_ids = [row['b_user_id'] for row in rows]
+        shard_archived = set()
+        with shards.engine(shard).begin() as conn:
+            conn.execute(stmt, rows)
+            # Строки, которые нашел UPDATE (запись в шард уже
+            # заблокирована), и новые значения для подписчиков
+            selected = conn.execute(
+                select(users.c.user_id, *(users.c[key] for key in BASE_FIELDS))
+                .where(users.c.user_id.in_(user_ids))
+            ).all()
+            missing = set(user_ids).difference(row[0] for row in selected)
+            if missing:
+                archive = ArchivedUser.__table__
+                shard_archived = set(conn.execute(
+                    select(archive.c.user_id).where(archive.c.user_id.in_(missing))
+                ).scalars())
+        return selected, shard_archived
+
+    def _write_rows(self, shard, rows):
+        """
+            Записать клики по одной строке; строка, которая не
+            записывается и отдельно, отбрасывается (иначе она
+            останавливала бы запись шарда при каждом flush)
+            Returns:
+                list: Результаты _write записанных строк
+        """
+        results = []
+        for row in rows:
+            try:
+                results.append(self._write(shard, [row]))
+            except OperationalError:
+                raise
+            except Exception:
+                self.app.logger.exception(
+                    'Dropped %s buffered clicks of user %s', row['b_clicks'], row['b_user_id']
+                )
+        return results
+
+    def _add_pending(self, user_id, clicks):
+        """Добавить клики к ожидающим (вызывается под self._lock)"""
+        self._pending[user_id] = min(self._pending.get(user_id, 0) + clicks, MAX_PENDING)
+
+    def stop(self):
+        """Остановить фоновый поток записи"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def shutdown(self):
+        """Остановить фоновый поток и записать остаток буфера"""
+        self.stop()
+        if self.app is not None:
+            self.flush()
+
+    def _ensure_flusher(self):
+        """Запустить фоновый поток записи при первом клике"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run, name='click-buffer-flush', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                if self.runner is not None:
+                    self.runner(self.flush)
+                else:
+                    self.flush()
+            except Exception:
+                if self.app is not None:
+                    self.app.logger.exception('Click buffer flush failed')
+
+
+click_buffer = ClickBuffer()
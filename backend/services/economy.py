@@ -0,0 +1,80 @@
+"""
+Сервис экономики: доход пользователя в секунду
+
+Доход хранится в колонке users.per_second и меняется только при
+успешной покупке улучшения (Upgrade.purchase), поэтому на горячем пути
+строки upgrades не читаются. Пересчет по строкам нужен только для
+проверки согласованности.
+"""
+import click
+from flask.cli import with_appcontext
+
+from models import db, User
+from services.progress import progress_store
+from services.shards import shards
+
+
+def get_per_second(user):
+    """
+        Доход пользователя в секунду
+        Args:
+            user: Пользователь
+        Returns:
+            int: Сохраненный доход в секунду
+    """
+    if user.per_second is None:
+        # Строка создана до появления колонки - считаем один раз и сохраняем
+        user.per_second = recompute_per_second(user)
+    return user.per_second
+
+
+def recompute_per_second(user):
+    """
+        Пересчитать доход в секунду по уровням улучшений
+        Returns:
+            int: Фактический доход в секунду
+    """
+    return sum(u.current_production for u in progress_store.upgrades(user))
+
+
+def check_per_second(user, fix=False):
+    """
+        Проверить, что сохраненный доход совпадает с пересчитанным
+        Args:
+            user: Пользователь
+            fix: Записать пересчитанное значение при расхождении
+        Returns:
+            tuple: (сохраненный доход, фактический доход)
+    """
+    stored = user.per_second
+    actual = recompute_per_second(user)
+    if fix and stored != actual:
+        user.per_second = actual
+    return stored, actual
+
+
+@click.command('check-economy')
+@click.option('--fix', is_flag=True, help='Исправить расхождения')
+@with_appcontext
+def check_economy_command(fix):
+    """Сверить users.per_second с уровнями улучшений"""
+    mismatched = 0
+    for shard in shards.shards:
+        with shards.using(shard):
+            for user in User.query.order_by(User.user_id).yield_per(500):
+                stored, actual = check_per_second(user, fix=fix)
+                if stored != actual:
+                    mismatched += 1
+                    click.echo(f'user {user.user_id}: stored={stored} actual={actual}')
+            if fix:
+                db.session.commit()
+    click.echo(f'Расхождений: {mismatched}')
+
+
+def init_app(app):
+    """
+        Регистрация CLI-команд сервиса
+        Args:
+            app: Flask application
+    """
+    app.cli.add_command(check_economy_command)
@@ -0,0 +1,195 @@
+"""
+Профиль движка SQLite для многопоточной работы
+
+Для файловой базы включаются WAL (читатели не блокируют писателя),
+busy_timeout вместо мгновенной ошибки "database is locked",
+synchronous=NORMAL и mmap. Пул соединений задается в конфиге.
+Endpoint'ы, помеченные @read_only, читают через отдельный пул
+соединений только для чтения (mode=ro, query_only); запись в таком
+запросе (например, создание нового игрока) все равно идет в основной пул.
+При SHARD_COUNT > 1 у каждого шарда (services.shards) свои движки
+'shard<N>' и 'shard<N>-readonly', и сессия выбирает их по g.shard.
+
+ASYNC_DATABASE - движки SQLAlchemy asyncio (aiosqlite) для ASGI-режима
+(services.asgi_bridge). Flask-SQLAlchemy получает их синхронный фасад
+(AsyncEngine.sync_engine), поэтому модели, сессия и все события движка
+работают как в потоковом режиме; код должен выполняться в greenlet_spawn.
+"""
+import functools
+import os
+
+from flask import g, has_app_context
+from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# Ключ bind'а с пулом только для чтения
+READ_BIND = 'readonly'
+
+# Асинхронные драйверы для ASYNC_DATABASE
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+}
+
+
+def async_url(url):
+    """URL базы с асинхронным драйвером"""
+    url = make_url(url)
+    if '+' in url.drivername:
+        return url
+    try:
+        return url.set(drivername=ASYNC_DRIVERS[url.drivername])
+    except KeyError:
+        raise ValueError(f'No async driver for {url.drivername}') from None
+
+
+def sqlite_file(app):
+    """Путь к файлу SQLite или None, если база не файловый SQLite"""
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:'):
+        return None
+    path = url.database[5:] if url.query.get('uri') else url.database
+    if not os.path.isabs(path):
+        path = os.path.join(app.instance_path, path)
+    return path
+
+
+def shard_path(path, shard):
+    """Файл шарда: основной файл для шарда 0, <имя>-shard<N>.<расширение> для остальных"""
+    if not shard:
+        return path
+    root, ext = os.path.splitext(path)
+    return f'{root}-shard{shard}{ext}'
+
+
+def shard_bind(shard, read=False):
+    """Ключ bind'а шарда (None - основной движок)"""
+    if not shard:
+        return READ_BIND if read else None
+    return f'shard{shard}-{READ_BIND}' if read else f'shard{shard}'
+
+
+def configure(app):
+    """
+        Задать опции движков до db.init_app
+        Args:
+            app: Flask application
+    """
+    path = sqlite_file(app)
+    shard_count = app.config.get('SHARD_COUNT', 1)
+    if shard_count > 1 and path is None:
+        raise ValueError('SHARD_COUNT > 1 requires a file SQLite database')
+
+    profile = path is not None and app.config.get('SQLITE_ENGINE_PROFILE', True)
+    pool = {}
+    if profile:
+        pool = {
+            'pool_size': app.config.get('SQLITE_POOL_SIZE', 10),
+            'max_overflow': app.config.get('SQLITE_MAX_OVERFLOW', 10),
+            'pool_timeout': app.config.get('SQLITE_POOL_TIMEOUT', 30),
+            # busy_timeout ставится прагмой, timeout драйвера - то же в секундах
+            'connect_args': {'timeout': app.config.get('SQLITE_BUSY_TIMEOUT', 5000) / 1000},
+        }
+        options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+        for key, value in pool.items():
+            options.setdefault(key, value)
+
+    read_pool_size = app.config.get('SQLITE_READ_POOL_SIZE', 10) if profile else 0
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+    for shard in range(shard_count):
+        shard_file = shard_path(path, shard)
+        if shard:
+            binds.setdefault(shard_bind(shard), dict(pool, url=url.set(database=shard_file)))
+        if read_pool_size > 0:
+            read_url = url.set(database=f'file:{shard_file}', query={'mode': 'ro', 'uri': 'true'})
+            binds.setdefault(
+                shard_bind(shard, read=True), dict(pool, url=read_url, pool_size=read_pool_size)
+            )
+
+
+def init_app(app, db):
+    """
+        Применять прагмы к каждому новому соединению
+        Args:
+            app: Flask application
+            db: Расширение SQLAlchemy после db.init_app
+    """
+    if not app.config.get('SQLITE_ENGINE_PROFILE', True) or sqlite_file(app) is None:
+        return
+
+    common = [
+        f"busy_timeout={int(app.config.get('SQLITE_BUSY_TIMEOUT', 5000))}",
+        f"mmap_size={int(app.config.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))}",
+    ]
+    writer = [
+        # Действует для новых файлов (до первой таблицы), старые переводит
+        # flask archive vacuum
+        f"auto_vacuum={app.config.get('SQLITE_AUTO_VACUUM', 'INCREMENTAL')}",
+        f"journal_mode={app.config.get('SQLITE_JOURNAL_MODE', 'WAL')}",
+        f"synchronous={app.config.get('SQLITE_SYNCHRONOUS', 'NORMAL')}",
+    ] + common
+    reader = common + ['query_only=ON']
+
+    with app.app_context():
+        engines = dict(db.engines)
+
+    for key, engine in engines.items():
+        pragmas = reader if key is not None and key.endswith(READ_BIND) else writer
+        event.listen(engine, 'connect', functools.partial(_apply_pragmas, pragmas))
+
+
+def _apply_pragmas(pragmas, dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in pragmas:
+            cursor.execute(f'PRAGMA {pragma}')
+    finally:
+        cursor.close()
+
+
+class Database(SQLAlchemy):
+    """
+    Flask-SQLAlchemy, который при ASYNC_DATABASE создает движки
+    SQLAlchemy asyncio и работает через их синхронный фасад
+    """
+
+    def _make_engine(self, bind_key, options, app):
+        if not app.config.get('ASYNC_DATABASE'):
+            return super()._make_engine(bind_key, options, app)
+
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        options = dict(options)
+        url = async_url(options.pop('url'))
+        return create_async_engine(url, **options).sync_engine
+
+
+def read_only(view):
+    """Декоратор endpoint'а: чтение через пул только для чтения"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+class RoutingSession(Session):
+    """
+    Сессия, которая отправляет запросы в шард g.shard, а в запросах
+    @read_only - чтение в пул шарда только для чтения. Flush всегда
+    идет в движок шарда для записи.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            shard = g.get('shard')
+            read = not self._flushing and g.get('read_only')
+            if shard or read:
+                engines = self._db.engines
+                engine = (read and engines.get(shard_bind(shard, read=True))) or engines.get(shard_bind(shard))
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
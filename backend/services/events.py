@@ -0,0 +1,177 @@
+"""
+Шина событий для потока /api/user/stream (Server-Sent Events)
+
+Pub/sub внутри процесса: у каждого подключения своя ограниченная очередь.
+Если клиент не успевает читать и очередь переполнилась, подключение
+закрывается - браузер переподключится сам и заново запросит состояние.
+События о коммитах приходят по сигналам users_committed и
+achievements_unlocked, поэтому подписчики видят только записанные данные.
+При нескольких процессах поток получает события только своего процесса.
+"""
+import json
+import queue
+import threading
+import time
+
+from models import production_since
+from services.click_buffer import click_buffer
+from services.signals import achievements_unlocked, users_committed
+
+
+class Subscription:
+    """
+    Подписка одного подключения на события пользователя
+    """
+
+    def __init__(self, user_id, max_queue):
+        self.user_id = user_id
+        self.queue = queue.Queue(max_queue)
+        self.closed = False
+        self.per_second = None  # Последний отправленный доход в секунду
+
+    def close(self):
+        self.closed = True
+        # Будим читателя, если в очереди есть место
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+
+class EventBus:
+    """
+    Подписчики по user_id и рассылка событий в их очереди
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.queue_size = 100
+        self.heartbeat_interval = 15.0
+        self.max_lifetime = 300.0
+        self.max_streams_per_user = 3
+
+        self._subscribers = {}  # user_id -> [Subscription, ...]
+        self._lock = threading.Lock()
+        self.dropped = 0  # Подключения, закрытые из-за медленного чтения
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+            Настройка потока событий и подписка на сигналы коммитов
+            Args:
+                app: Flask application
+        """
+        self.app = app
+        self.queue_size = app.config.get('SSE_QUEUE_SIZE', 100)
+        self.heartbeat_interval = app.config.get('SSE_HEARTBEAT_INTERVAL', 15.0)
+        self.max_lifetime = app.config.get('SSE_MAX_LIFETIME', 300.0)
+        self.max_streams_per_user = app.config.get('SSE_MAX_STREAMS_PER_USER', 3)
+        app.extensions['events'] = self
+
+        users_committed.connect(self._on_users_committed, weak=False)
+        achievements_unlocked.connect(self._on_achievements_unlocked, weak=False)
+
+    def subscribe(self, user_id):
+        """
+            Подписаться на события пользователя.
+            Лишние подключения сверх SSE_MAX_STREAMS_PER_USER закрываются,
+            начиная с самого старого.
+            Returns:
+                Subscription: Подписка с очередью событий
+        """
+        subscription = Subscription(user_id, self.queue_size)
+        with self._lock:
+            subscriptions = self._subscribers.setdefault(user_id, [])
+            subscriptions.append(subscription)
+            evicted = subscriptions[:-self.max_streams_per_user]
+            del subscriptions[:-self.max_streams_per_user]
+        for old in evicted:
+            old.close()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Убрать подписку (при закрытии подключения)"""
+        with self._lock:
+            subscriptions = self._subscribers.get(subscription.user_id)
+            if subscriptions and subscription in subscriptions:
+                subscriptions.remove(subscription)
+                if not subscriptions:
+                    del self._subscribers[subscription.user_id]
+        subscription.closed = True
+
+    def has_subscribers(self, user_id):
+        return user_id in self._subscribers
+
+    def publish(self, user_id, event, data):
+        """
+            Отправить событие всем подключениям пользователя
+            Args:
+                event: Имя события (score, per_second, achievement)
+                data: JSON-совместимые данные события
+        """
+        with self._lock:
+            subscriptions = list(self._subscribers.get(user_id, ()))
+
+        for subscription in subscriptions:
+            try:
+                subscription.queue.put_nowait((event, data))
+            except queue.Full:
+                # Медленный клиент: отключаем, а не копим события без конца
+                self.dropped += 1
+                self.unsubscribe(subscription)
+
+    def _on_users_committed(self, sender, changes):
+        for user_id, fields in changes.items():
+            if fields is None or not self.has_subscribers(user_id):
+                continue
+
+            score = (
+                (fields['score'] or 0)
+                + production_since(fields['per_second'], fields['last_update'])
+                + click_buffer.pending(user_id)
+            )
+            self.publish(user_id, 'score', {'score': score})
+
+            per_second = fields['per_second'] or 0
+            with self._lock:
+                subscriptions = list(self._subscribers.get(user_id, ()))
+            if any(s.per_second != per_second for s in subscriptions):
+                for subscription in subscriptions:
+                    subscription.per_second = per_second
+                self.publish(user_id, 'per_second', {'per_second': per_second})
+
+    def _on_achievements_unlocked(self, sender, unlocked):
+        for user_id, achievements in unlocked.items():
+            for achievement in achievements:
+                self.publish(user_id, 'achievement', achievement)
+
+    def stream(self, subscription):
+        """
+            Генератор тела ответа text/event-stream.
+            Пока событий нет, раз в SSE_HEARTBEAT_INTERVAL отправляется
+            комментарий, чтобы прокси не закрыли соединение. Через
+            SSE_MAX_LIFETIME поток завершается, и клиент переподключается.
+        """
+        deadline = time.monotonic() + self.max_lifetime
+        try:
+            yield f'retry: {int(self.heartbeat_interval * 1000)}\n\n'
+            while not subscription.closed:
+                timeout = min(self.heartbeat_interval, deadline - time.monotonic())
+                if timeout <= 0:
+                    break
+                try:
+                    item = subscription.queue.get(timeout=timeout)
+                except queue.Empty:
+                    yield ': heartbeat\n\n'
+                    continue
+                if item is None or subscription.closed:
+                    break
+                event, data = item
+                yield f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+        finally:
+            self.unsubscribe(subscription)
+
+
+events = EventBus()
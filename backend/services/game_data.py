@@ -5,46 +5,58 @@
 # Шаблоны улучшений
 UPGRADE_TEMPLATES = [
     {
+        'id': 1,
         'name': 'Курсор',
         'icon': '👆',
         'description': 'Автоматически кликает 1 раз в секунду',
         'baseCost': 15,
         'baseProduction': 1,
+        'costMultiplier': 1.15,
     },
     {
+        'id': 2,
         'name': 'Бабушка',
         'icon': '👵',
         'description': 'Печет печеньки и приносит по 5 очков в секунду',
         'baseCost': 100,
         'baseProduction': 5,
+        'costMultiplier': 1.15,
     },
     {
+        'id': 3,
         'name': 'Ферма',
         'icon': '🌾',
         'description': 'Выращивает ресурсы, принося по 20 очков в секунду',
         'baseCost': 500,
         'baseProduction': 20,
+        'costMultiplier': 1.15,
     },
     {
+        'id': 4,
         'name': 'Фабрика',
         'icon': '🏭',
         'description': 'Производит товары: 50 очков в секунду',
         'baseCost': 2000,
         'baseProduction': 50,
+        'costMultiplier': 1.15,
     },
     {
+        'id': 5,
         'name': 'Шахта',
         'icon': '⛏️',
         'description': 'Добывает ресурсы: 100 очков в секунду',
         'baseCost': 5000,
         'baseProduction': 100,
+        'costMultiplier': 1.15,
     },
     {
+        'id': 6,
         'name': 'Банк',
         'icon': '🏦',
         'description': 'Инвестирует деньги: 200 очков в секунду',
         'baseCost': 10000,
         'baseProduction': 200,
+        'costMultiplier': 1.15,
     },
 ]
 
@@ -60,42 +72,71 @@ UPGRADE_TEMPLATES = [
 # ]
 
 # Шаблоны достижений
+# Условие разблокировки: metric comparator threshold, например score >= 100.
+# Метрики: score - очки, per_second - доход в секунду.
+# Сравнения: '>=' и '>'. Новое достижение добавляется только шаблоном.
 ACHIEVEMENT_TEMPLATES = [
     {
+        'id': 1,
         'name': 'Первый клик',
         'icon': '🎯',
-        'description': 'Сделайте ваш первый клик'
+        'description': 'Сделайте ваш первый клик',
+        'metric': 'score',
+        'threshold': 1,
+        'comparator': '>=',
     },
     {
+        'id': 2,
         'name': 'Сотня кликов',
         'icon': '💯',
-        'description': 'Наберите 100 очков'
+        'description': 'Наберите 100 очков',
+        'metric': 'score',
+        'threshold': 100,
+        'comparator': '>=',
     },
     {
+        'id': 3,
         'name': 'Первое улучшение',
         'icon': '⬆️',
-        'description': 'Купите первое улучшение'
+        'description': 'Купите первое улучшение',
+        'metric': 'per_second',
+        'threshold': 0,
+        'comparator': '>',
     },
     {
+        'id': 4,
         'name': 'Тысяча очков',
         'icon': '🌟',
-        'description': 'Наберите 1000 очков'
+        'description': 'Наберите 1000 очков',
+        'metric': 'score',
+        'threshold': 1000,
+        'comparator': '>=',
     },
     {
+        'id': 5,
         'name': 'Автоматизация',
         'icon': '🤖',
-        'description': 'Достигните 10 очков в секунду'
+        'description': 'Достигните 10 очков в секунду',
+        'metric': 'per_second',
+        'threshold': 10,
+        'comparator': '>=',
     },
     {
+        'id': 6,
         'name': 'Миллионер',
         'icon': '💰',
-        'description': 'Наберите 1,000,000 очков'
+        'description': 'Наберите 1,000,000 очков',
+        'metric': 'score',
+        'threshold': 1_000_000,
+        'comparator': '>=',
     },
 ]
 
 # Шаблоны скинов
+# Скин с нулевой ценой есть у каждого пользователя сразу и активен по умолчанию
 SKIN_TEMPLATES = [
     {
+        'id': 1,
         'name': 'Стандартный',
         'description': 'Классический вид игры',
         'base_cost': 0,
@@ -107,6 +148,7 @@ SKIN_TEMPLATES = [
         }
     },
     {
+        'id': 2,
         'name': 'Океан',
         'description': 'Морская тематика',
         'base_cost': 1000,
@@ -118,6 +160,7 @@ SKIN_TEMPLATES = [
         }
     },
     {
+        'id': 3,
         'name': 'Лес',
         'description': 'Природная свежесть',
         'base_cost': 2000,
@@ -129,6 +172,7 @@ SKIN_TEMPLATES = [
         }
     },
     {
+        'id': 4,
         'name': 'Закат',
         'description': 'Теплые вечерние цвета',
         'base_cost': 3000,
@@ -140,6 +184,7 @@ SKIN_TEMPLATES = [
         }
     },
     {
+        'id': 5,
         'name': 'Космос',
         'description': 'Звездное небо',
         'base_cost': 5000,
@@ -150,4 +195,4 @@ SKIN_TEMPLATES = [
             'character': '#9C27B0'
         }
     }
-]
\ No newline at end of file
+]
@@ -0,0 +1,353 @@
+"""
+Таблица лидеров
+
+Индекс в памяти - индексируемый skip list с ширинами ссылок, поэтому
+вставка, удаление, место игрока и выборка по позиции стоят O(log n).
+Индекс обновляется инкрементально по сигналу users_committed, а из
+базы строится фоновым потоком при старте процесса (в ASGI-режиме - при
+старте цикла событий, иначе - с первым запросом). Запросы не строят
+индекс сами: до готовности они ждут не дольше
+LEADERBOARD_READY_TIMEOUT секунд, затем отвечают 503.
+
+Сигналы приходят только о записях своего процесса (клики других
+воркеров, их покупки). При нескольких процессах можно включить
+перестройку из базы раз в LEADERBOARD_REFRESH_INTERVAL секунд: рейтинг
+отстает от чужих записей не больше чем на этот интервал. По умолчанию
+0 - индекс строится один раз (один процесс). Во время перестройки
+запросы читают старый индекс.
+"""
+import heapq
+import math
+import random
+import threading
+import time
+
+from sqlalchemy import func, select
+
+from models import db, User
+from services.shards import shards
+from services.signals import users_committed
+
+# Пауза перед повтором неудавшейся постройки индекса, секунд
+RETRY_INTERVAL = 1.0
+
+
+class _Node:
+    __slots__ = ('key', 'next', 'width')
+
+    def __init__(self, key, level):
+        self.key = key
+        self.next = [None] * level
+        self.width = [1] * level
+
+
+class RankedSkipList:
+    """
+    Упорядоченное множество с доступом по позиции (order-statistic skip list)
+
+    width[level] узла - сколько позиций проходит ссылка next[level]
+    """
+
+    def __init__(self, max_levels=24):
+        self.max_levels = max_levels
+        self.size = 0
+        self._tail = _Node((math.inf,), 0)
+        self._head = _Node(None, max_levels)
+        self._head.next = [self._tail] * max_levels
+
+    def __len__(self):
+        return self.size
+
+    def _random_level(self):
+        return min(self.max_levels, 1 - int(math.log(1.0 - random.random(), 2.0)))
+
+    def insert(self, key):
+        chain = [None] * self.max_levels
+        steps_at_level = [0] * self.max_levels
+        node = self._head
+        for level in reversed(range(self.max_levels)):
+            while node.next[level].key <= key:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        height = self._random_level()
+        new = _Node(key, height)
+        steps = 0
+        for level in range(height):
+            prev = chain[level]
+            new.next[level] = prev.next[level]
+            prev.next[level] = new
+            new.width[level] = prev.width[level] - steps
+            prev.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(height, self.max_levels):
+            chain[level].width[level] += 1
+        self.size += 1
+
+    def remove(self, key):
+        chain = [None] * self.max_levels
+        node = self._head
+        for level in reversed(range(self.max_levels)):
+            while node.next[level].key < key:
+                node = node.next[level]
+            chain[level] = node
+
+        target = chain[0].next[0]
+        if target.key != key:
+            raise KeyError(key)
+
+        for level in range(len(target.next)):
+            prev = chain[level]
+            prev.width[level] += target.width[level] - 1
+            prev.next[level] = target.next[level]
+        for level in range(len(target.next), self.max_levels):
+            chain[level].width[level] -= 1
+        self.size -= 1
+
+    def index(self, key):
+        """Позиция ключа с нуля"""
+        node = self._head
+        position = 0
+        for level in reversed(range(self.max_levels)):
+            while node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+        if node.next[0].key != key:
+            raise KeyError(key)
+        return position
+
+    def slice(self, start, count):
+        """count ключей начиная с позиции start"""
+        if start >= self.size or count <= 0:
+            return []
+        node = self._head
+        remaining = start + 1
+        for level in reversed(range(self.max_levels)):
+            while node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+
+        keys = []
+        while node is not self._tail and len(keys) < count:
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
+
+    @classmethod
+    def from_sorted(cls, keys, max_levels=24):
+        """Построить список из отсортированных ключей за O(n)"""
+        skip_list = cls(max_levels)
+        last = [skip_list._head] * max_levels
+        last_position = [0] * max_levels
+        position = 0
+        for position, key in enumerate(keys, 1):
+            node = _Node(key, skip_list._random_level())
+            for level in range(len(node.next)):
+                last[level].next[level] = node
+                last[level].width[level] = position - last_position[level]
+                last[level] = node
+                last_position[level] = position
+
+        for level in range(max_levels):
+            last[level].next[level] = skip_list._tail
+            last[level].width[level] = position + 1 - last_position[level]
+        skip_list.size = position
+        return skip_list
+
+
+class Leaderboard:
+    """
+    Рейтинг игроков по очкам: ключ индекса (-score, user_id),
+    поэтому первое место - наибольший счет, при равенстве - ранний игрок
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._scores = {}
+        self._index = RankedSkipList()
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._backlog = None  # Изменения, пришедшие во время перестройки
+        self.refresh_interval = 0.0
+        self.ready_timeout = 5.0
+        self.refreshed_at = None  # time.monotonic() последней перестройки
+        self.refreshes = 0
+        self._stopped = threading.Event()
+        self._thread = None
+        # Как фоновый поток вызывает перестройку (по умолчанию - напрямую)
+        self.runner = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+            Подписать рейтинг на изменения счета
+            Args:
+                app: Flask application
+        """
+        self.app = app
+        self.refresh_interval = app.config.get('LEADERBOARD_REFRESH_INTERVAL', 0.0)
+        self.ready_timeout = app.config.get('LEADERBOARD_READY_TIMEOUT', 5.0)
+        app.extensions['leaderboard'] = self
+        users_committed.connect(self._on_users_committed, weak=False)
+        # Без ASGI-цикла поток строит индекс с первого запроса (не в CLI)
+        app.before_request(self.start)
+
+        metrics = app.extensions.get('metrics')
+        if metrics is not None:
+            metrics.add_collector(self.collect)
+
+    def _on_users_committed(self, sender, changes):
+        for user_id, fields in changes.items():
+            if fields is None:
+                self.update(user_id, None)
+            elif 'score' in fields:
+                self.update(user_id, fields['score'])
+
+    def update(self, user_id, score):
+        """
+            Обновить счет игрока в рейтинге
+            Args:
+                score: Новый счет или None, чтобы убрать игрока
+        """
+        with self._lock:
+            if self._backlog is not None:
+                self._backlog[user_id] = score
+            if self._ready.is_set():
+                self._apply(user_id, score)
+
+    def _apply(self, user_id, score):
+        old = self._scores.get(user_id)
+        if old == score:
+            return
+        if old is not None:
+            self._index.remove((-old, user_id))
+        if score is None:
+            self._scores.pop(user_id, None)
+        else:
+            self._index.insert((-score, user_id))
+            self._scores[user_id] = score
+
+    def rebuild(self):
+        """
+            Построить индекс заново по таблице users всех шардов
+            (старый индекс, если он есть, обслуживает запросы до замены)
+        """
+        with self._rebuild_lock:
+            with self._lock:
+                self._backlog = {}
+
+            score = func.coalesce(User.score, 0)
+            query = select(User.user_id, score).order_by(score.desc(), User.user_id)
+            with self.app.app_context():
+                parts = shards.scatter(lambda: db.session.execute(query).all())
+                db.session.remove()
+
+            # Каждый шард отсортирован, слияние сохраняет порядок
+            scores = dict(heapq.merge(*parts, key=lambda row: (-row[1], row[0])))
+            index = RankedSkipList.from_sorted((-score, user_id) for user_id, score in scores.items())
+
+            with self._lock:
+                self._scores, self._index = scores, index
+                self._ready.set()
+                for user_id, score in self._backlog.items():
+                    self._apply(user_id, score)
+                self._backlog = None
+                self.refreshed_at = time.monotonic()
+                self.refreshes += 1
+
+    def wait_ready(self, timeout=None):
+        """
+            Дождаться первой постройки индекса фоновым потоком
+            Args:
+                timeout: Секунд ожидания, по умолчанию LEADERBOARD_READY_TIMEOUT
+            Returns:
+                bool: False - индекс еще не построен
+        """
+        return self._ready.wait(self.ready_timeout if timeout is None else timeout)
+
+    def top(self, n):
+        """
+            Первые n игроков
+            Returns:
+                list: [(место, user_id, счет), ...]
+        """
+        with self._lock:
+            keys = self._index.slice(0, n)
+        return [(rank, user_id, -neg_score) for rank, (neg_score, user_id) in enumerate(keys, 1)]
+
+    def rank(self, user_id):
+        """
+            Место игрока
+            Returns:
+                tuple: (место, счет) или None, если игрока нет в рейтинге
+        """
+        with self._lock:
+            score = self._scores.get(user_id)
+            if score is None:
+                return None
+            return self._index.index((-score, user_id)) + 1, score
+
+    def __len__(self):
+        return len(self._index)
+
+    # Фоновое обновление
+
+    def start(self):
+        """Построить индекс в фоновом потоке (и обновлять, если задан интервал)"""
+        if self._ready.is_set() and self.refresh_interval <= 0:
+            return
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='leaderboard', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        delay = 0  # Первая постройка - сразу
+        while not self._stopped.wait(delay):
+            try:
+                if self.runner is not None:
+                    self.runner(self.rebuild)
+                else:
+                    self.rebuild()
+            except Exception:
+                self.app.logger.exception('Leaderboard rebuild failed')
+
+            if not self._ready.is_set():
+                delay = RETRY_INTERVAL
+            elif self.refresh_interval > 0:
+                delay = self.refresh_interval
+            else:
+                return
+
+    def stop(self):
+        """Остановить фоновый поток"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def collect(self):
+        """
+            Счетчики для /metrics
+            Returns:
+                list: (имя, тип, описание, значение)
+        """
+        age = time.monotonic() - self.refreshed_at if self.refreshed_at is not None else 0
+        return [
+            ('webgame_leaderboard_players', 'gauge',
+             'Players in the in-memory leaderboard.', len(self._scores)),
+            ('webgame_leaderboard_refreshes_total', 'counter',
+             'Leaderboard rebuilds from the database.', self.refreshes),
+            ('webgame_leaderboard_age_seconds', 'gauge',
+             'Seconds since the leaderboard was rebuilt from the database.', age),
+        ]
+
+
+leaderboard = Leaderboard()
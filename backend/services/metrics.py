@@ -0,0 +1,256 @@
+"""
+Метрики запросов в формате Prometheus (/metrics)
+
+По каждому endpoint считаются запросы, ошибки, гистограмма задержек,
+SQL-запросы, их суммарное время и коммиты. Данные копятся в агрегатах
+своего потока без блокировок: поток пишет только в свои счетчики, а
+/metrics суммирует их при чтении. Агрегаты завершившихся потоков
+сворачиваются в общий, чтобы не расти вместе с числом потоков сервера.
+Текущий запрос хранится в contextvar, а не в поле потока: в ASGI-режиме
+запросы чередуются в одном потоке. SQL без активного запроса (буфер кликов, фоновые задачи) попадает в
+endpoint "_background".
+"""
+import contextvars
+import threading
+import time
+
+from flask import request
+from sqlalchemy import event
+
+from models import db
+
+# Границы корзин гистограммы задержек, в секундах
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+BACKGROUND = '_background'
+
+
+class EndpointStats:
+    """Счетчики одного endpoint в одном потоке"""
+
+    __slots__ = ('requests', 'errors', 'latency_sum', 'buckets',
+                 'queries', 'query_time', 'commits')
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.latency_sum = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # последняя - +Inf
+        self.queries = 0
+        self.query_time = 0.0
+        self.commits = 0
+
+    def observe(self, latency):
+        self.requests += 1
+        self.latency_sum += latency
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def merge(self, other):
+        self.requests += other.requests
+        self.errors += other.errors
+        self.latency_sum += other.latency_sum
+        self.queries += other.queries
+        self.query_time += other.query_time
+        self.commits += other.commits
+        for i, value in enumerate(other.buckets):
+            self.buckets[i] += value
+
+
+class Metrics:
+    """
+    Сбор метрик через события Flask и движка SQLAlchemy
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = True
+        self._local = threading.local()
+        # Текущий запрос: [endpoint, начало, статус] и начало SQL-запроса
+        self._request = contextvars.ContextVar('metrics_request', default=None)
+        self._query_started = contextvars.ContextVar('metrics_query_started', default=None)
+        self._lock = threading.Lock()  # Только регистрация потоков и чтение
+        self._threads = []  # [(поток, {endpoint: EndpointStats}), ...]
+        self._retired = {}  # Агрегаты завершившихся потоков
+        self._collectors = []  # Счетчики других сервисов (add_collector)
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+            Подключить метрики к запросам и движку базы
+            Args:
+                app: Flask application
+        """
+        self.app = app
+        self.enabled = app.config.get('METRICS_ENABLED', True)
+        app.extensions['metrics'] = self
+        if not self.enabled:
+            return
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+        with app.app_context():
+            engines = list(db.engines.values())
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+            event.listen(engine, 'commit', self._on_commit)
+
+    def add_collector(self, collect):
+        """
+            Добавить в /metrics счетчики сервиса
+            Args:
+                collect: Функция без аргументов, возвращает список
+                    (имя, тип, описание, значение)
+        """
+        self._collectors.append(collect)
+
+    # Агрегаты потока
+
+    def _stats(self, endpoint):
+        local = self._local
+        try:
+            table = local.table
+        except AttributeError:
+            table = local.table = {}
+            with self._lock:
+                self._threads.append((threading.current_thread(), table))
+                if len(self._threads) > 256:
+                    self._retire_dead_threads()
+
+        stats = table.get(endpoint)
+        if stats is None:
+            stats = table[endpoint] = EndpointStats()
+        return stats
+
+    def _current(self):
+        state = self._request.get()
+        return self._stats(state[0] if state is not None else BACKGROUND)
+
+    def _retire_dead_threads(self):
+        """Свернуть агрегаты завершившихся потоков (под self._lock)"""
+        alive = []
+        for thread, table in self._threads:
+            if thread.is_alive():
+                alive.append((thread, table))
+                continue
+            for endpoint, stats in table.items():
+                self._retired.setdefault(endpoint, EndpointStats()).merge(stats)
+        self._threads = alive
+
+    # События Flask
+
+    def _before_request(self):
+        self._request.set([request.endpoint or 'unknown', time.perf_counter(), None])
+
+    def _after_request(self, response):
+        state = self._request.get()
+        if state is not None:
+            state[2] = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        state = self._request.get()
+        if state is None:
+            return
+        stats = self._current()
+        if exc is not None or (state[2] or 0) >= 500:
+            stats.errors += 1
+        stats.observe(time.perf_counter() - state[1])
+        self._request.set(None)
+
+    # События движка
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self._query_started.set(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        stats = self._current()
+        stats.queries += 1
+        started = self._query_started.get()
+        if started is not None:
+            stats.query_time += time.perf_counter() - started
+            self._query_started.set(None)
+
+    def _on_commit(self, conn):
+        self._current().commits += 1
+
+    # Чтение
+
+    def snapshot(self):
+        """
+            Суммарные счетчики по всем потокам
+            Returns:
+                dict: endpoint -> EndpointStats
+        """
+        with self._lock:
+            self._retire_dead_threads()
+            totals = {}
+            for endpoint, stats in self._retired.items():
+                totals.setdefault(endpoint, EndpointStats()).merge(stats)
+            for _, table in self._threads:
+                for endpoint, stats in list(table.items()):
+                    totals.setdefault(endpoint, EndpointStats()).merge(stats)
+        return totals
+
+    def render(self):
+        """Текст метрик в формате Prometheus exposition 0.0.4"""
+        totals = self.snapshot()
+        lines = []
+
+        def family(name, kind, help_text, rows):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.extend(rows)
+
+        def label(endpoint):
+            return endpoint.replace('\\', '\\\\').replace('"', '\\"')
+
+        family('webgame_http_requests_total', 'counter', 'HTTP requests by endpoint.', [
+            f'webgame_http_requests_total{{endpoint="{label(e)}"}} {s.requests}'
+            for e, s in sorted(totals.items()) if e != BACKGROUND
+        ])
+        family('webgame_http_errors_total', 'counter', 'Requests that ended with 5xx or an exception.', [
+            f'webgame_http_errors_total{{endpoint="{label(e)}"}} {s.errors}'
+            for e, s in sorted(totals.items()) if e != BACKGROUND
+        ])
+
+        rows = []
+        for e, s in sorted(totals.items()):
+            if e == BACKGROUND:
+                continue
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, s.buckets):
+                cumulative += count
+                rows.append(f'webgame_http_request_duration_seconds_bucket{{endpoint="{label(e)}",le="{bound}"}} {cumulative}')
+            rows.append(f'webgame_http_request_duration_seconds_bucket{{endpoint="{label(e)}",le="+Inf"}} {s.requests}')
+            rows.append(f'webgame_http_request_duration_seconds_sum{{endpoint="{label(e)}"}} {s.latency_sum:.6f}')
+            rows.append(f'webgame_http_request_duration_seconds_count{{endpoint="{label(e)}"}} {s.requests}')
+        family('webgame_http_request_duration_seconds', 'histogram', 'Request latency.', rows)
+
+        family('webgame_db_queries_total', 'counter', 'SQL statements executed.', [
+            f'webgame_db_queries_total{{endpoint="{label(e)}"}} {s.queries}'
+            for e, s in sorted(totals.items())
+        ])
+        family('webgame_db_query_duration_seconds_total', 'counter', 'Time spent executing SQL.', [
+            f'webgame_db_query_duration_seconds_total{{endpoint="{label(e)}"}} {s.query_time:.6f}'
+            for e, s in sorted(totals.items())
+        ])
+        family('webgame_db_commits_total', 'counter', 'Database commits.', [
+            f'webgame_db_commits_total{{endpoint="{label(e)}"}} {s.commits}'
+            for e, s in sorted(totals.items())
+        ])
+        for collect in self._collectors:
+            for name, kind, help_text, value in collect():
+                family(name, kind, help_text, [f'{name} {value}'])
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
@@ -0,0 +1,80 @@
+"""
+Расчет цен улучшений
+
+Цена уровня k: int(base_cost * multiplier ** k). Сумма уровней оценивается
+по формуле геометрической прогрессии, а точная цена покупки - это сумма
+поуровневых цен с тем же округлением, поэтому покупка пачкой стоит ровно
+столько же, сколько покупка по одному.
+
+Закрытая формула для точной цены не подходит: сумма округленных вниз
+цен меньше формулы на сумму дробных частей уровней, а ее без обхода
+уровней не посчитать. Поэтому точная цена - цикл по уровням, а длина
+покупки ограничена MAX_QUANTITY (при множителях каталога цены растут
+так быстро, что на счет в int64 столько уровней не купить). При
+multiplier == 1 все уровни стоят одинаково, и цена считается умножением.
+"""
+import math
+
+# Наибольшее число уровней одной покупки
+MAX_QUANTITY = 10_000
+
+
+def level_cost(base_cost, multiplier, level):
+    """Цена одного уровня (та же формула, что и в Upgrade.current_cost)"""
+    return int(base_cost * (multiplier ** level))
+
+
+def bulk_cost(base_cost, multiplier, level, quantity):
+    """
+        Точная цена quantity уровней начиная с level
+        Returns:
+            int: Сумма поуровневых цен
+        Raises:
+            ValueError: quantity больше MAX_QUANTITY
+    """
+    if multiplier == 1:
+        return level_cost(base_cost, multiplier, level) * quantity
+    if quantity > MAX_QUANTITY:
+        raise ValueError(f'Cannot price more than {MAX_QUANTITY} levels at once')
+    return sum(level_cost(base_cost, multiplier, level + k) for k in range(quantity))
+
+
+def max_affordable(base_cost, multiplier, level, budget):
+    """
+        Сколько уровней можно купить на budget (не больше MAX_QUANTITY)
+
+        Количество оценивается обращением формулы геометрической прогрессии,
+        затем уточняется точными поуровневыми ценами: округление вниз
+        делает точную сумму не больше оценки, так что поправка - пара шагов.
+
+        Returns:
+            tuple: (количество уровней, их точная цена)
+    """
+    first = level_cost(base_cost, multiplier, level)
+    if budget < first or first <= 0:
+        return 0, 0
+
+    if multiplier == 1:
+        quantity = min(int(budget // first), MAX_QUANTITY)
+        return quantity, first * quantity
+
+    start = base_cost * (multiplier ** level)
+    estimate = int(math.log(budget * (multiplier - 1) / start + 1, multiplier))
+
+    quantity = min(max(estimate, 1), MAX_QUANTITY)
+    total = bulk_cost(base_cost, multiplier, level, quantity)
+
+    # Оценка в float могла оказаться на шаг больше
+    while quantity > 1 and total > budget:
+        quantity -= 1
+        total -= level_cost(base_cost, multiplier, level + quantity)
+
+    # Округленные цены дешевле оценки - докупаем, пока хватает
+    while quantity < MAX_QUANTITY:
+        next_cost = level_cost(base_cost, multiplier, level + quantity)
+        if total + next_cost > budget:
+            break
+        total += next_cost
+        quantity += 1
+
+    return quantity, total
@@ -0,0 +1,334 @@
+"""
+Профилирование отдельных запросов по выборке (flame graph и SQL)
+
+Включается настройками: PROFILER_SAMPLE_RATE - доля запросов каждого
+endpoint, PROFILER_ENDPOINT_RATES - доли для отдельных endpoint'ов или
+целых blueprint'ов ('upgrade.buy_upgrade', 'user'), PROFILER_TOKEN -
+запрос с заголовком "X-Profile: <токен>" профилируется всегда. Если
+ничего из этого не задано, init_app не регистрирует ни одного хука и
+слушателя движка: выключенный профилировщик ничего не стоит.
+
+Отобранный запрос выполняется как обычно, а общий фоновый поток раз в
+PROFILER_INTERVAL секунд снимает стек его потока (sys._current_frames).
+В стек попадают только кадры ниже full_dispatch_request этого запроса:
+в ASGI-режиме запросы чередуются в одном потоке, и чужие greenlet'ы
+отбрасываются. Ожидание базы в ASGI-режиме не сэмплируется (greenlet
+отдал управление) - его время видно в списке SQL.
+
+После ответа в PROFILER_DIR пишутся два файла:
+
+    <время>-<endpoint>-<id>.collapsed  - стеки в формате collapsed
+        (flamegraph.pl, speedscope, inferno)
+    <время>-<endpoint>-<id>.json       - запрос, статус, время и SQL
+
+Хранятся последние PROFILER_MAX_PROFILES профилей, старые удаляются.
+Id профиля возвращается в заголовке X-Profile-Id.
+"""
+import contextvars
+import hmac
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import request
+from sqlalchemy import event
+
+from models import db
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'X-Profile'
+
+# Кадр, ниже которого начинается обработка запроса Flask
+ANCHOR = 'full_dispatch_request'
+
+
+class Profile:
+    """Профиль одного запроса"""
+
+    __slots__ = ('id', 'endpoint', 'thread_id', 'anchor', 'stacks',
+                 'samples', 'statements', 'dropped', 'started', 'status')
+
+    def __init__(self, profile_id, endpoint):
+        self.id = profile_id
+        self.endpoint = endpoint
+        self.thread_id = threading.get_ident()
+        self.anchor = None
+        self.stacks = Counter()
+        self.samples = 0
+        self.statements = []
+        self.dropped = 0  # SQL сверх PROFILER_MAX_STATEMENTS
+        self.started = time.perf_counter()
+        self.status = None
+
+
+class RequestProfiler:
+    """
+    Сэмплирующий профилировщик запросов по выборке
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self.sample_rate = 0.0
+        self.endpoint_rates = {}
+        self.token = None
+        self.interval = 0.001
+        self.directory = None
+        self.max_profiles = 200
+        self.max_statements = 500
+        self.written = 0
+        self._rates = {}  # endpoint -> доля (кэш разбора endpoint_rates)
+        self._profile = contextvars.ContextVar('profiler_profile', default=None)
+        self._query_started = contextvars.ContextVar('profiler_query_started', default=None)
+        self._active = {}  # id профиля -> Profile, пока запрос выполняется
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._sequence = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+            Подключить профилировщик, если он включен настройками
+            Args:
+                app: Flask application
+        """
+        self.app = app
+        self.sample_rate = app.config.get('PROFILER_SAMPLE_RATE', 0.0)
+        self.endpoint_rates = dict(app.config.get('PROFILER_ENDPOINT_RATES') or {})
+        self.token = app.config.get('PROFILER_TOKEN') or None
+        self.interval = app.config.get('PROFILER_INTERVAL', 0.001)
+        self.directory = app.config.get('PROFILER_DIR') or os.path.join(app.instance_path, 'profiles')
+        self.max_profiles = app.config.get('PROFILER_MAX_PROFILES', 200)
+        self.max_statements = app.config.get('PROFILER_MAX_STATEMENTS', 500)
+        app.extensions['profiler'] = self
+
+        self.enabled = bool(
+            self.sample_rate > 0
+            or any(rate > 0 for rate in self.endpoint_rates.values())
+            or self.token
+        )
+        if not self.enabled:
+            return
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+        with app.app_context():
+            engines = list(db.engines.values())
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+        from services.metrics import metrics
+        metrics.add_collector(self.collect)
+
+    # Отбор запросов
+
+    def rate(self, endpoint):
+        """
+            Доля профилируемых запросов endpoint'а
+            Returns:
+                float: От 0 до 1
+        """
+        rate = self._rates.get(endpoint)
+        if rate is None:
+            blueprint = endpoint.rpartition('.')[0]
+            rate = self.endpoint_rates.get(
+                endpoint, self.endpoint_rates.get(blueprint, self.sample_rate)
+            )
+            self._rates[endpoint] = rate
+        return rate
+
+    def _requested(self):
+        """Запрос с токеном в заголовке X-Profile"""
+        value = request.headers.get(HEADER)
+        if not (value and self.token):
+            return False
+        # Байты: compare_digest не сравнивает строки с не-ASCII символами
+        # (Werkzeug декодирует заголовки как latin-1)
+        return hmac.compare_digest(value.encode('latin-1'), self.token.encode())
+
+    # События Flask
+
+    def _before_request(self):
+        endpoint = request.endpoint or 'unknown'
+        if not (self._requested() or random.random() < self.rate(endpoint)):
+            return
+
+        with self._lock:
+            self._sequence += 1
+            profile_id = f'{os.getpid()}-{self._sequence}'
+        profile = Profile(profile_id, endpoint)
+        profile.anchor = self._find_anchor()
+        self._profile.set(profile)
+        with self._lock:
+            self._active[profile.id] = profile
+        self._ensure_sampler()
+
+    def _after_request(self, response):
+        profile = self._profile.get()
+        if profile is not None:
+            profile.status = response.status_code
+            response.headers['X-Profile-Id'] = profile.id
+        return response
+
+    def _teardown_request(self, exc):
+        profile = self._profile.get()
+        if profile is None:
+            return
+        self._profile.set(None)
+        with self._lock:
+            self._active.pop(profile.id, None)
+        duration = time.perf_counter() - profile.started
+        try:
+            self.write(profile, duration, exc)
+        except OSError:
+            logger.exception('Profile %s was not written', profile.id)
+
+    @staticmethod
+    def _find_anchor():
+        """Кадр full_dispatch_request текущего запроса"""
+        frame = sys._getframe(1)
+        while frame is not None:
+            if frame.f_code.co_name == ANCHOR:
+                return frame
+            frame = frame.f_back
+        return None
+
+    # События движка
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self._profile.get() is not None:
+            self._query_started.set(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        profile = self._profile.get()
+        if profile is None:
+            return
+        started = self._query_started.get()
+        self._query_started.set(None)
+        if len(profile.statements) >= self.max_statements:
+            profile.dropped += 1
+            return
+        profile.statements.append({
+            'statement': statement,
+            'parameters': repr(parameters)[:500],
+            'executemany': executemany,
+            'ms': round((time.perf_counter() - started) * 1000, 3) if started is not None else None,
+        })
+
+    # Сэмплирование
+
+    def _ensure_sampler(self):
+        """Запустить общий поток сэмплирования при первом профиле"""
+        self._wakeup.set()
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='request-profiler', daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                profiles = list(self._active.values())
+                if not profiles:
+                    self._wakeup.clear()
+            if not profiles:
+                self._wakeup.wait()
+                continue
+            frames = sys._current_frames()
+            for profile in profiles:
+                frame = frames.get(profile.thread_id)
+                if frame is not None:
+                    self._sample(profile, frame)
+            del frames
+            time.sleep(self.interval)
+
+    @staticmethod
+    def _sample(profile, frame):
+        """Добавить стек потока, если он выполняет этот запрос"""
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f'{os.path.basename(code.co_filename)}:{code.co_qualname}')
+            if frame is profile.anchor:
+                break
+            frame = frame.f_back
+        else:
+            if profile.anchor is not None:
+                return  # Поток (greenlet) выполняет другой запрос
+        stack.reverse()
+        profile.stacks[';'.join(stack)] += 1
+        profile.samples += 1
+
+    # Файлы профилей
+
+    def write(self, profile, duration, exc=None):
+        """
+            Записать профиль и удалить старые сверх PROFILER_MAX_PROFILES
+            Returns:
+                str: Путь к файлу .collapsed
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        base = os.path.join(self.directory, f'{stamp}-{profile.endpoint}-{profile.id}')
+
+        with open(base + '.collapsed', 'w', encoding='utf-8') as f:
+            for stack, count in profile.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        with open(base + '.json', 'w', encoding='utf-8') as f:
+            json.dump({
+                'id': profile.id,
+                'endpoint': profile.endpoint,
+                'method': request.method,
+                'path': request.full_path.rstrip('?'),
+                'status': profile.status,
+                'error': repr(exc) if exc is not None else None,
+                'duration_ms': round(duration * 1000, 3),
+                'interval_ms': self.interval * 1000,
+                'samples': profile.samples,
+                'sql_ms': round(sum(s['ms'] or 0 for s in profile.statements), 3),
+                'sql_dropped': profile.dropped,
+                'sql': profile.statements,
+            }, f, ensure_ascii=False, indent=2)
+
+        self.written += 1
+        self._rotate()
+        return base + '.collapsed'
+
+    def _rotate(self):
+        """Оставить последние max_profiles профилей"""
+        names = sorted(
+            name for name in os.listdir(self.directory) if name.endswith('.collapsed')
+        )
+        for name in names[:max(len(names) - self.max_profiles, 0)]:
+            base = os.path.join(self.directory, name[:-len('.collapsed')])
+            for suffix in ('.collapsed', '.json'):
+                try:
+                    os.remove(base + suffix)
+                except FileNotFoundError:
+                    pass
+
+    def collect(self):
+        return [
+            ('webgame_profiler_profiles_total', 'counter',
+             'Requests profiled and written to PROFILER_DIR.', self.written),
+        ]
+
+
+profiler = RequestProfiler()
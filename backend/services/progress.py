@@ -0,0 +1,465 @@
+"""
+Хранение прогресса пользователя: улучшения, достижения и скины
+
+PROGRESS_STORAGE = 'relational' - строки в upgrades, achievements и
+skins (по строке на купленное улучшение, достижение и скин).
+PROGRESS_STORAGE = 'packed' - весь прогресс в одной колонке users.progress:
+
+    B  версия формата
+    B  n - число уровней улучшений
+    nI уровни улучшений по id каталога (id 1 - первый элемент)
+    Q  битовая маска достижений (бит id - 1)
+    Q  битовая маска купленных скинов (бит id - 1)
+
+Тогда состояние, клик и покупки читают и пишут только строку users.
+Время разблокировки достижений и покупки скинов в упакованном виде
+не хранится. Выбранный скин в обоих режимах - колонка users.active_skin.
+
+В реляционном режиме строки помнят state_version пользователя при
+последнем изменении (changed_version) - по ней changes() отдает только
+измененное после версии клиента. В упакованном режиме версий по
+элементам нет, и клиенту с устаревшей версией нужен полный снимок.
+
+Пользователь переводится в текущий режим при первом обращении
+(adopt), всю базу сразу переводит flask progress-storage pack|unpack.
+"""
+import struct
+from datetime import datetime
+
+import click
+from flask.cli import with_appcontext
+
+from sqlalchemy import Integer, inspect as sa_inspect, literal, null, select, union_all
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
+from models import db, Achievement, Skin, Upgrade, User
+from services.catalog import catalog
+from services.shards import shards
+
+RELATIONAL = 'relational'
+PACKED = 'packed'
+
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct('<BB')
+_MASKS = struct.Struct('<QQ')
+
+for _section in (catalog.achievements, catalog.skins):
+    if any(not 1 <= t['id'] <= 64 for t in _section):
+        raise ValueError('Packed progress supports catalog ids 1..64 for achievements and skins')
+if any(not 1 <= t['id'] <= 255 for t in catalog.upgrades):
+    raise ValueError('Packed progress supports catalog ids 1..255 for upgrades')
+
+
+class Progress:
+    """
+    Распакованный прогресс пользователя
+    """
+
+    __slots__ = ('levels', 'achievements', 'skins')
+
+    def __init__(self, levels=(), achievements=0, skins=0):
+        self.levels = list(levels)
+        self.achievements = achievements
+        self.skins = skins
+
+    @classmethod
+    def decode(cls, blob):
+        """
+            Распаковать значение колонки users.progress
+            Args:
+                blob: bytes или None (пустой прогресс)
+        """
+        if not blob:
+            return cls()
+        version, count = _HEADER.unpack_from(blob, 0)
+        if version != FORMAT_VERSION:
+            raise ValueError(f'Unknown progress format version: {version}')
+        offset = _HEADER.size
+        levels = struct.unpack_from(f'<{count}I', blob, offset)
+        achievements, skins = _MASKS.unpack_from(blob, offset + 4 * count)
+        return cls(levels, achievements, skins)
+
+    def encode(self):
+        """Упаковать в bytes для колонки users.progress"""
+        levels = list(self.levels)
+        while levels and not levels[-1]:
+            levels.pop()
+        return (
+            _HEADER.pack(FORMAT_VERSION, len(levels))
+            + struct.pack(f'<{len(levels)}I', *levels)
+            + _MASKS.pack(self.achievements, self.skins)
+        )
+
+    def level(self, upgrade_id):
+        index = upgrade_id - 1
+        return self.levels[index] if index < len(self.levels) else 0
+
+    def set_level(self, upgrade_id, level):
+        index = upgrade_id - 1
+        if index >= len(self.levels):
+            self.levels.extend([0] * (index + 1 - len(self.levels)))
+        self.levels[index] = level
+
+    def has_achievement(self, achievement_id):
+        return bool(self.achievements >> (achievement_id - 1) & 1)
+
+    def add_achievement(self, achievement_id):
+        self.achievements |= 1 << (achievement_id - 1)
+
+    def owns_skin(self, skin_id):
+        return bool(self.skins >> (skin_id - 1) & 1)
+
+    def add_skin(self, skin_id):
+        self.skins |= 1 << (skin_id - 1)
+
+    @classmethod
+    def from_rows(cls, upgrades, achievements, skins):
+        """Собрать прогресс из строк реляционного хранения"""
+        progress = cls()
+        for upgrade in upgrades:
+            progress.set_level(upgrade.template['id'], upgrade.level or 0)
+        for achievement in achievements:
+            progress.add_achievement(achievement.template['id'])
+        for skin in skins:
+            progress.add_skin(skin.template['id'])
+        return progress
+
+    def to_rows(self):
+        """
+            Строки реляционного хранения (без user_id)
+            Returns:
+                tuple: (улучшения, достижения, скины)
+        """
+        upgrades = [
+            Upgrade(name=t['name'], level=self.level(t['id']))
+            for t in catalog.upgrades if self.level(t['id'])
+        ]
+        achievements = [
+            Achievement(name=t['name'])
+            for t in catalog.achievements if self.has_achievement(t['id'])
+        ]
+        skins = [
+            Skin(name=t['name'])
+            for t in catalog.skins if self.owns_skin(t['id'])
+        ]
+        return upgrades, achievements, skins
+
+
+class ProgressStore:
+    """
+    Доступ к прогрессу пользователя в выбранном режиме хранения.
+    В упакованном режиме возвращает несвязанные с сессией объекты
+    Upgrade/Achievement/Skin, а изменения записывает в users.progress
+    """
+
+    def __init__(self, app=None):
+        self.mode = RELATIONAL
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+            Выбрать режим хранения и зарегистрировать CLI-команду
+            Args:
+                app: Flask application
+        """
+        mode = app.config.get('PROGRESS_STORAGE', RELATIONAL)
+        if mode not in (RELATIONAL, PACKED):
+            raise ValueError(f'Unknown PROGRESS_STORAGE: {mode}')
+        self.mode = mode
+        app.extensions['progress_store'] = self
+        app.cli.add_command(progress_storage_command)
+
+    @property
+    def packed(self):
+        return self.mode == PACKED
+
+    # Перевод пользователя между режимами
+
+    def new_user(self, user):
+        """Начальный прогресс нового пользователя"""
+        if self.packed:
+            user.progress = Progress().encode()
+
+    def adopt(self, user):
+        """
+            Перевести пользователя в текущий режим, если он хранится в другом
+            Returns:
+                bool: Были ли изменения (закоммичены)
+        """
+        if self.packed and user.progress is None:
+            pack_user(user)
+        elif not self.packed and user.progress is not None:
+            unpack_user(user)
+        else:
+            return False
+        user.touch()
+        db.session.commit()
+        return True
+
+    def _load(self, user):
+        return Progress.decode(user.progress)
+
+    def _save(self, user, progress):
+        user.progress = progress.encode()
+
+    # Чтение
+
+    def snapshot(self, user):
+        """
+            Пользователь с загруженным прогрессом для build_state.
+            В реляционном режиме незагруженные коллекции читаются одним
+            запросом (UNION ALL по трем таблицам); строка users повторно
+            не читается (она может быть взята из кэша горячих пользователей)
+            Returns:
+                User: Тот же пользователь
+        """
+        if self.packed:
+            return user
+        unloaded = [key for key in SNAPSHOT_ROWS if key in sa_inspect(user).unloaded]
+        if not unloaded:
+            return user
+
+        rows = {key: [] for key in unloaded}
+        stmt = union_all(*(_snapshot_select(key, user.user_id) for key in unloaded))
+        for kind, *values in db.session.execute(stmt):
+            rows[kind].append(_attach_row(kind, user.user_id, values))
+        for key, collection in rows.items():
+            set_committed_value(user, key, collection)
+        return user
+
+    def upgrades(self, user):
+        """Улучшения пользователя с уровнем больше нуля (или строкой в базе)"""
+        if not self.packed:
+            return list(user.upgrades)
+        progress = self._load(user)
+        return [
+            Upgrade(name=t['name'], level=progress.level(t['id']))
+            for t in catalog.upgrades if progress.level(t['id'])
+        ]
+
+    def achievements(self, user):
+        """Полученные достижения пользователя"""
+        if not self.packed:
+            return list(user.achievements)
+        progress = self._load(user)
+        return [
+            Achievement(name=t['name'])
+            for t in catalog.achievements if progress.has_achievement(t['id'])
+        ]
+
+    def skins(self, user):
+        """Купленные скины пользователя (без бесплатных)"""
+        if not self.packed:
+            return list(user.skins)
+        progress = self._load(user)
+        return [
+            Skin(name=t['name'])
+            for t in catalog.skins if progress.owns_skin(t['id'])
+        ]
+
+    def changes(self, user, since):
+        """
+            Улучшения, достижения и скины, измененные после версии since
+            Returns:
+                tuple: (улучшения, достижения, скины) или None, если
+                изменения по элементам не отслеживаются (упакованный режим)
+        """
+        if self.packed:
+            return None
+        return tuple(
+            model.query.filter(
+                model.user_id == user.user_id, model.changed_version > since
+            ).all()
+            for model in (Upgrade, Achievement, Skin)
+        )
+
+    def unlocked_names(self, user):
+        """Имена полученных достижений"""
+        if not self.packed:
+            return {
+                name for (name,) in db.session.query(Achievement.name).filter_by(
+                    user_id=user.user_id
+                )
+            }
+        progress = self._load(user)
+        return {
+            t['name'] for t in catalog.achievements if progress.has_achievement(t['id'])
+        }
+
+    def owns_skin(self, user, name):
+        """Куплен ли скин (бесплатный скин есть у всех)"""
+        template = catalog.skins.by_name[name]
+        if template['base_cost'] == 0:
+            return True
+        if self.packed:
+            return self._load(user).owns_skin(template['id'])
+        return Skin.query.filter_by(user_id=user.user_id, name=name).first() is not None
+
+    # Изменение
+
+    def find_upgrade(self, user, name):
+        """
+            Улучшение пользователя по имени
+            Returns:
+                Upgrade или None, если его еще не покупали
+        """
+        if not self.packed:
+            return Upgrade.query.filter_by(user_id=user.user_id, name=name).first()
+        template = catalog.upgrades.by_name.get(name)
+        if template is None:
+            return None
+        level = self._load(user).level(template['id'])
+        return Upgrade(name=name, level=level) if level else None
+
+    def new_upgrade(self, user, name):
+        """
+            Улучшение нулевого уровня, еще не записанное: строка
+            (или уровень) появится в save_upgrade после покупки
+        """
+        return Upgrade(name=name, level=0)
+
+    def save_upgrade(self, user, upgrade):
+        """Записать уровень улучшения после покупки"""
+        if self.packed:
+            progress = self._load(user)
+            progress.set_level(upgrade.template['id'], upgrade.level)
+            self._save(user, progress)
+            return
+        # Версия уже увеличена списанием за покупку
+        upgrade.changed_version = user.state_version or 0
+        if upgrade.user_id is None:
+            upgrade.user_id = user.user_id
+            db.session.add(upgrade)
+
+    def add_achievement(self, user, name):
+        """
+            Разблокировать достижение
+            Returns:
+                Achievement: Полученное достижение
+        """
+        if not self.packed:
+            achievement = Achievement(name=name, user=user)
+            db.session.add(achievement)
+            achievement.unlock()
+            achievement.changed_version = user.state_version or 0
+            return achievement
+
+        progress = self._load(user)
+        achievement = Achievement(name=name, achieved_at=datetime.now())
+        progress.add_achievement(achievement.template['id'])
+        self._save(user, progress)
+        user.touch()
+        return achievement
+
+    def add_skin(self, user, skin):
+        """Записать купленный скин (после Skin.purchase)"""
+        if not self.packed:
+            skin.user_id = user.user_id
+            skin.changed_version = user.state_version or 0
+            db.session.add(skin)
+            return
+        progress = self._load(user)
+        progress.add_skin(skin.template['id'])
+        self._save(user, progress)
+
+
+progress_store = ProgressStore()
+
+
+# Строки прогресса для снимка: коллекция -> (модель, поля). Части
+# UNION ALL выбирают поля в одном порядке, уровня нет - NULL
+SNAPSHOT_ROWS = {
+    'upgrades': (Upgrade, ('upgrade_id', 'name', 'level', 'purchased_at', 'changed_version')),
+    'achievements': (Achievement, ('achievement_id', 'name', None, 'achieved_at', 'changed_version')),
+    'skins': (Skin, ('skin_id', 'name', None, 'acquired_at', 'changed_version')),
+}
+
+
+def _snapshot_select(key, user_id):
+    model, fields = SNAPSHOT_ROWS[key]
+    return select(literal(key).label('kind'), *(
+        getattr(model, field) if field else null().cast(Integer) for field in fields
+    )).where(model.user_id == user_id)
+
+
+def _attach_row(key, user_id, values):
+    """
+        Строка прогресса из значений запроса, прикрепленная к сессии
+        без отдельного SELECT (как пользователь из services.user_cache)
+        Returns:
+            Upgrade, Achievement или Skin
+    """
+    model, fields = SNAPSHOT_ROWS[key]
+    mapper = model.__mapper__
+    existing = db.session.identity_map.get(mapper.identity_key_from_primary_key((values[0],)))
+    if existing is not None:
+        return existing
+    row = mapper.class_manager.new_instance()
+    for field, value in zip(fields, values):
+        if field:
+            set_committed_value(row, field, value)
+    set_committed_value(row, 'user_id', user_id)
+    make_transient_to_detached(row)
+    db.session.add(row)
+    return row
+
+
+def pack_user(user):
+    """Перенести строки прогресса пользователя в users.progress"""
+    upgrades = Upgrade.query.filter_by(user_id=user.user_id).all()
+    achievements = Achievement.query.filter_by(user_id=user.user_id).all()
+    skins = Skin.query.filter_by(user_id=user.user_id).all()
+
+    user.progress = Progress.from_rows(upgrades, achievements, skins).encode()
+    for row in upgrades + achievements + skins:
+        db.session.delete(row)
+
+
+def unpack_user(user):
+    """Перенести users.progress в строки upgrades, achievements и skins"""
+    # Удаление через flush сессии: он идет в движок для записи и в
+    # запросах @read_only (массовый DELETE ушел бы в пул для чтения)
+    for model in (Upgrade, Achievement, Skin):
+        for row in model.query.filter_by(user_id=user.user_id):
+            db.session.delete(row)
+    db.session.flush()
+
+    upgrades, achievements, skins = Progress.decode(user.progress).to_rows()
+    for row in upgrades + achievements + skins:
+        row.user_id = user.user_id
+        # Строки совпадают с прогрессом, который клиент видел в этой версии
+        row.changed_version = user.state_version or 0
+        db.session.add(row)
+    user.progress = None
+
+
+@click.command('progress-storage')
+@click.argument('direction', type=click.Choice(['pack', 'unpack']))
+@click.option('--batch-size', default=500, show_default=True)
+@with_appcontext
+def progress_storage_command(direction, batch_size):
+    """Перевести всех пользователей в упакованное (pack) или реляционное (unpack) хранение"""
+    if direction == 'pack':
+        pending = User.progress.is_(None)
+        convert = pack_user
+    else:
+        pending = User.progress.isnot(None)
+        convert = unpack_user
+
+    converted = 0
+    for shard in shards.shards:
+        with shards.using(shard):
+            while True:
+                users = User.query.filter(pending).order_by(User.user_id).limit(batch_size).all()
+                if not users:
+                    break
+                for user in users:
+                    convert(user)
+                db.session.commit()
+                converted += len(users)
+                click.echo(f'{direction}: {converted}')
+
+    click.echo(f'Переведено пользователей: {converted}')
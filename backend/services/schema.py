@@ -0,0 +1,44 @@
+"""
+Схема базы: миграции Flask-Migrate
+
+Схема создается и обновляется цепочкой ревизий из migrations/
+(flask db upgrade или upgrade_schema() при старте); файл шарда N
+обновляет flask db upgrade -x shard=N. Планы запросов горячего пути
+проверяют тесты (tests/test_query_plans.py).
+"""
+import os
+
+from flask_migrate import Migrate, stamp, upgrade
+from sqlalchemy import inspect
+
+from models import db
+from services.shards import shards
+
+MIGRATIONS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations'
+)
+
+# Ревизия, совпадающая со схемой, которую создавал db.create_all()
+BASELINE_REVISION = '0001'
+
+migrate = Migrate(directory=MIGRATIONS_DIR)
+
+
+def init_app(app):
+    """
+        Подключить миграции (flask db ...)
+        Args:
+            app: Flask application
+    """
+    migrate.init_app(app, db)
+
+
+def upgrade_schema():
+    """Довести схему базы (и всех файлов шардов) до последней ревизии"""
+    tables = set(inspect(db.engine).get_table_names())
+    if 'users' in tables and 'alembic_version' not in tables:
+        # База создана db.create_all() до появления миграций
+        stamp(directory=MIGRATIONS_DIR, revision=BASELINE_REVISION)
+    upgrade(directory=MIGRATIONS_DIR)
+    for shard in shards.shards[1:]:
+        upgrade(directory=MIGRATIONS_DIR, x_arg=[f'shard={shard}'])
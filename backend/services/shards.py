@@ -0,0 +1,383 @@
+"""
+Шардирование игроков по файлам SQLite
+
+SHARD_COUNT = 1 - одна база, как раньше. При SHARD_COUNT = N шард 0 -
+основной файл (DATABASE_URL), шард i - файл <имя>-shard<i>.db рядом с
+ним, у каждого своя блокировка записи. Пользователь со всем прогрессом
+живет в одном шарде:
+
+    user_id -> корзина user_id % SHARD_BUCKETS -> шард по карте корзин
+
+Карта (shard_buckets) и общий счетчик user_id (id_sequences) хранятся в
+основном файле. Карта создается один раз: для пустой базы корзины
+раскладываются по кругу, для существующей - все остаются на шарде 0,
+пока их не перенесет flask shards rebalance.
+
+get_current_user выбирает шард по user_id и кладет его в g.shard, после
+чего RoutingSession отправляет туда все запросы сессии - сервисы и
+endpoint'ы от шардирования не зависят. Запросы по всем игрокам
+(рейтинг, общие счетчики) выполняет scatter: функция на каждом шарде,
+результаты собираются списком.
+
+Процесс читает карту один раз, поэтому rebalance нужно запускать при
+остановленных воркерах. Если пользователь не найден в своем шарде,
+карта перечитывается (корзину могли перенести).
+"""
+import contextlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import g
+from flask.cli import with_appcontext
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Achievement, ArchivedUser, IdSequence, ShardBucket, Skin, Upgrade, User
+from services.engine_profile import shard_bind
+
+USER_SEQUENCE = 'users'
+
+# Таблицы прогресса: строки переносятся без суррогатного ключа,
+# в другом файле он выдается заново
+_CHILD_TABLES = (Upgrade.__table__, Achievement.__table__, Skin.__table__)
+
+
+class ShardRouter:
+    """
+    Карта корзин пользователей по шардам и выбор шарда для запроса
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.count = 1
+        self.buckets = 1024
+        self._map = None  # [шард корзины 0, шард корзины 1, ...]
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+            Подключить шардирование и CLI-команду flask shards
+            Args:
+                app: Flask application
+        """
+        self.app = app
+        self.count = app.config.get('SHARD_COUNT', 1)
+        self.buckets = app.config.get('SHARD_BUCKETS', 1024)
+        if self.count < 1 or self.buckets < self.count:
+            raise ValueError('SHARD_COUNT must be between 1 and SHARD_BUCKETS')
+        app.extensions['shards'] = self
+        app.cli.add_command(shards_command)
+
+    @property
+    def enabled(self):
+        return self.count > 1
+
+    @property
+    def shards(self):
+        return range(self.count)
+
+    def engine(self, shard):
+        """Движок шарда для записи"""
+        return db.engines[shard_bind(shard)]
+
+    # Карта корзин
+
+    def bucket(self, user_id):
+        return user_id % self.buckets
+
+    def bucket_shard(self, bucket):
+        """Шард, в котором хранится корзина"""
+        if self._map is None:
+            self.reload()
+        return self._map[bucket]
+
+    def bucket_counts(self):
+        """Число корзин на каждом шарде"""
+        if self._map is None:
+            self.reload()
+        return [self._map.count(shard) for shard in self.shards]
+
+    def shard_for(self, user_id):
+        """Шард, в котором хранится пользователь"""
+        if not self.enabled:
+            return 0
+        return self.bucket_shard(self.bucket(user_id))
+
+    def reload(self):
+        """Перечитать карту корзин (при первом обращении - создать)"""
+        query = select(ShardBucket.bucket, ShardBucket.shard)
+        with self._lock:
+            try:
+                with self.engine(0).begin() as conn:
+                    rows = dict(conn.execute(query).all())
+                    if not rows:
+                        rows = self._create_map(conn)
+            except IntegrityError:
+                # Карту одновременно создал другой процесс
+                with self.engine(0).connect() as conn:
+                    rows = dict(conn.execute(query).all())
+            if len(rows) != self.buckets:
+                raise ValueError(
+                    f'Shard map has {len(rows)} buckets, SHARD_BUCKETS is {self.buckets}'
+                )
+            if max(rows.values()) >= self.count:
+                raise ValueError(
+                    f'Shard map uses shard {max(rows.values())}, SHARD_COUNT is {self.count}'
+                )
+            self._map = [rows[bucket] for bucket in range(self.buckets)]
+
+    def _create_map(self, conn):
+        """Первая карта и счетчик user_id (под блокировкой записи основного файла)"""
+        last_id = conn.execute(select(func.max(User.user_id))).scalar() or 0
+        for shard in self.shards[1:]:
+            with self.engine(shard).connect() as other:
+                last_id = max(last_id, other.execute(select(func.max(User.user_id))).scalar() or 0)
+        # Существующие игроки лежат в основном файле до rebalance
+        rows = {
+            bucket: 0 if last_id else bucket % self.count
+            for bucket in range(self.buckets)
+        }
+        conn.execute(insert(ShardBucket), [
+            {'bucket': bucket, 'shard': shard} for bucket, shard in rows.items()
+        ])
+        conn.execute(insert(IdSequence).values(name=USER_SEQUENCE, value=last_id))
+        return rows
+
+    def refresh(self, user_id):
+        """
+            Перечитать карту, если пользователь не найден в своем шарде
+            Returns:
+                bool: Шард пользователя изменился (g.shard обновлен)
+        """
+        if not self.enabled:
+            return False
+        before = self.shard_for(user_id)
+        self.reload()
+        if self.shard_for(user_id) == before:
+            return False
+        self.route(user_id)
+        return True
+
+    # Маршрутизация
+
+    def route(self, user_id):
+        """Направить сессию текущего контекста в шард пользователя"""
+        if self.enabled:
+            g.shard = self.shard_for(user_id)
+
+    @contextlib.contextmanager
+    def using(self, shard):
+        """Выполнить блок с сессией, направленной в шард shard"""
+        previous = g.get('shard')
+        g.shard = shard
+        try:
+            yield
+        finally:
+            g.shard = previous
+
+    def allocate_user_id(self):
+        """
+            Новый user_id из общего счетчика
+            Returns:
+                int или None, если шардирования нет (автоинкремент)
+        """
+        if not self.enabled:
+            return None
+        if self._map is None:
+            self.reload()
+        sequence = IdSequence.__table__
+        with self.engine(0).begin() as conn:
+            conn.execute(
+                update(sequence)
+                .where(sequence.c.name == USER_SEQUENCE)
+                .values(value=sequence.c.value + 1)
+            )
+            return conn.execute(
+                select(sequence.c.value).where(sequence.c.name == USER_SEQUENCE)
+            ).scalar()
+
+    # Запросы по всем шардам
+
+    def scatter(self, fn):
+        """
+            Выполнить fn() на каждом шарде: в своем контексте приложения
+            с сессией, направленной в шард (потоки - по шарду; в ASGI-режиме
+            по очереди, база доступна только из цикла событий)
+            Returns:
+                list: Результаты по номерам шардов
+        """
+        if not self.enabled:
+            return [fn()]
+        if self.app.config.get('ASYNC_DATABASE'):
+            return [self._run_on(shard, fn) for shard in self.shards]
+        with ThreadPoolExecutor(max_workers=self.count, thread_name_prefix='shard') as pool:
+            return list(pool.map(lambda shard: self._run_on(shard, fn), self.shards))
+
+    def _run_on(self, shard, fn):
+        with self.app.app_context():
+            g.shard = shard
+            try:
+                return fn()
+            finally:
+                db.session.remove()
+
+    def count_users(self):
+        """Число игроков во всех шардах"""
+        return sum(self.scatter(lambda: db.session.query(func.count(User.user_id)).scalar()))
+
+    # Перенос корзин
+
+    def move_bucket(self, bucket, target):
+        """
+            Перенести пользователей корзины (и их архив) в шард target: копия строк,
+            смена карты, удаление из старого шарда. Повторный запуск
+            после сбоя безопасен: копия в target сначала удаляется, а если
+            карта уже указывает на target, из остальных шардов удаляются
+            оставшиеся там строки корзины
+            Returns:
+                int: Перенесено пользователей
+        """
+        source = self.bucket_shard(bucket)
+        if source == target:
+            # Сбой между сменой карты и удалением: строки в старом шарде
+            # уже не видны приложению, убираем их
+            for shard in self.shards:
+                if shard != target:
+                    self._delete_bucket(shard, bucket)
+            return 0
+
+        users = User.__table__
+        archive = ArchivedUser.__table__
+        in_bucket = (users.c.user_id % self.buckets) == bucket
+        in_archive = (archive.c.user_id % self.buckets) == bucket
+        with self.engine(source).connect() as conn:
+            user_rows = [dict(row._mapping) for row in conn.execute(select(users).where(in_bucket))]
+            user_ids = [row['user_id'] for row in user_rows]
+            # Архивированные игроки корзины переезжают вместе с ней
+            archived_rows = [dict(row._mapping) for row in conn.execute(select(archive).where(in_archive))]
+            children = {
+                table: [
+                    {key: value for key, value in row._mapping.items()
+                     if key not in table.primary_key.columns}
+                    for row in conn.execute(select(table).where(table.c.user_id.in_(user_ids)))
+                ] if user_ids else []
+                for table in _CHILD_TABLES
+            }
+
+        with self.engine(target).begin() as conn:
+            if user_ids:
+                for table in _CHILD_TABLES:
+                    conn.execute(delete(table).where(table.c.user_id.in_(user_ids)))
+                conn.execute(delete(users).where(users.c.user_id.in_(user_ids)))
+                conn.execute(insert(users), user_rows)
+                for table, rows in children.items():
+                    if rows:
+                        conn.execute(insert(table), rows)
+            if archived_rows:
+                conn.execute(delete(archive).where(in_archive))
+                conn.execute(insert(archive), archived_rows)
+
+        with self.engine(0).begin() as conn:
+            conn.execute(
+                update(ShardBucket).where(ShardBucket.bucket == bucket).values(shard=target)
+            )
+        self._map[bucket] = target
+
+        if user_ids or archived_rows:
+            self._delete_bucket(source, bucket, user_ids)
+        return len(user_ids)
+
+    def _delete_bucket(self, shard, bucket, user_ids=None):
+        """
+            Удалить из шарда пользователей корзины с прогрессом и архив корзины
+            Args:
+                user_ids: Пользователи корзины в шарде, если уже известны
+            Returns:
+                int: Удалено пользователей
+        """
+        users = User.__table__
+        archive = ArchivedUser.__table__
+        with self.engine(shard).begin() as conn:
+            if user_ids is None:
+                user_ids = list(conn.execute(
+                    select(users.c.user_id).where((users.c.user_id % self.buckets) == bucket)
+                ).scalars())
+            if user_ids:
+                for table in _CHILD_TABLES:
+                    conn.execute(delete(table).where(table.c.user_id.in_(user_ids)))
+                conn.execute(delete(users).where(users.c.user_id.in_(user_ids)))
+            conn.execute(delete(archive).where((archive.c.user_id % self.buckets) == bucket))
+        return len(user_ids)
+
+    def plan(self):
+        """
+            Корзины, которые нужно перенести для равномерной раскладки
+            Returns:
+                list: [(корзина, текущий шард, целевой шард), ...]
+        """
+        if self._map is None:
+            self.reload()
+        return [
+            (bucket, shard, bucket % self.count)
+            for bucket, shard in enumerate(self._map)
+            if shard != bucket % self.count
+        ]
+
+
+shards = ShardRouter()
+
+
+@click.group('shards')
+def shards_command():
+    """Шарды игроков: состояние и перенос корзин"""
+
+
+@shards_command.command('status')
+@with_appcontext
+def shards_status_command():
+    """Игроки и корзины по шардам"""
+    counts = shards.scatter(lambda: db.session.query(func.count(User.user_id)).scalar())
+    if shards.enabled:
+        shards.reload()
+        buckets = shards.bucket_counts()
+    else:
+        buckets = [shards.buckets]
+    for shard, (users, owned) in enumerate(zip(counts, buckets)):
+        click.echo(f'shard {shard}: {users} users, {owned} buckets')
+    click.echo(f'Всего игроков: {sum(counts)}')
+
+
+@shards_command.command('rebalance')
+@click.option('--bucket', type=int, help='Перенести одну корзину (вместе с --to)')
+@click.option('--to', 'target', type=int, help='Целевой шард для --bucket')
+@click.option('--dry-run', is_flag=True, help='Только показать план')
+@with_appcontext
+def shards_rebalance_command(bucket, target, dry_run):
+    """
+    Разложить корзины по шардам равномерно (корзина b -> шард b % SHARD_COUNT)
+    или перенести одну корзину. Запускать при остановленных воркерах
+    """
+    if not shards.enabled:
+        raise click.ClickException('SHARD_COUNT is 1, nothing to rebalance')
+
+    if bucket is not None or target is not None:
+        if bucket is None or target is None:
+            raise click.UsageError('--bucket and --to go together')
+        if not 0 <= bucket < shards.buckets or not 0 <= target < shards.count:
+            raise click.BadParameter('bucket or shard out of range')
+        shards.reload()
+        moves = [(bucket, shards.bucket_shard(bucket), target)]
+    else:
+        moves = shards.plan()
+
+    moved = 0
+    for bucket, source, target in moves:
+        if dry_run:
+            click.echo(f'bucket {bucket}: shard {source} -> {target}')
+            continue
+        moved += shards.move_bucket(bucket, target)
+    click.echo(f'Корзин: {len(moves)}, перенесено игроков: {moved}')
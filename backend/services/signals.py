@@ -0,0 +1,115 @@
+"""
+Сигналы об изменениях пользователей, зафиксированных в базе
+
+users_committed отправляется после успешного коммита с аргументом changes:
+    {user_id: {колонка: новое значение}} или {user_id: None}, если
+    пользователь удален. Кроме измененных колонок в словаре всегда есть
+    score, per_second и last_update - их хватает, чтобы посчитать
+    текущий счет с автопроизводством.
+achievements_unlocked отправляется после коммита новых достижений:
+    {user_id: [JSON достижения, ...]}.
+ORM-изменения пользователей собираются событиями сессии, пакетные UPDATE
+(буфер кликов) отправляют сигнал сами, а условные UPDATE в транзакции
+сессии (списания) отмечает record_user_changes. Разблокированные достижения
+отмечает record_unlocked: в упакованном хранении прогресса у них нет строк.
+"""
+from blinker import Namespace
+from sqlalchemy import event
+from sqlalchemy.orm import attributes
+
+from models import db, User
+
+_signals = Namespace()
+
+users_committed = _signals.signal('users-committed')
+achievements_unlocked = _signals.signal('achievements-unlocked')
+
+_INFO_KEY = 'users_committed'
+_ACHIEVEMENTS_KEY = 'achievements_unlocked'
+
+# Колонки, которые передаются при любом изменении пользователя
+BASE_FIELDS = ('score', 'per_second', 'last_update')
+
+
+def _column_changes(user, new):
+    """Измененные колонки пользователя (для новой строки - все)"""
+    changes = {}
+    for column in User.__mapper__.column_attrs:
+        if new or attributes.get_history(user, column.key).has_changes():
+            changes[column.key] = getattr(user, column.key)
+    if changes:
+        for key in BASE_FIELDS:
+            changes.setdefault(key, getattr(user, key))
+    return changes
+
+
+@event.listens_for(db.session, 'before_flush')
+def _collect_dirty_users(session, flush_context, instances):
+    # До записи: после UPDATE история версии (state_version) уже сброшена,
+    # и изменение только версии (touch) осталось бы без сигнала
+    pending = session.info.setdefault(_INFO_KEY, {})
+
+    for obj in session.dirty:
+        if isinstance(obj, User):
+            changes = _column_changes(obj, new=False)
+            if changes:
+                merged = pending.get(obj.user_id) or {}
+                merged.update(changes)
+                pending[obj.user_id] = merged
+
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_user_changes(session, flush_context):
+    pending = session.info.setdefault(_INFO_KEY, {})
+
+    # Новые строки - после записи: user_id назначает база
+    for obj in session.new:
+        if isinstance(obj, User):
+            pending[obj.user_id] = _column_changes(obj, new=True)
+
+    for obj in session.deleted:
+        if isinstance(obj, User):
+            pending[obj.user_id] = None
+
+
+def record_user_changes(user_id, changes):
+    """
+        Отметить изменение пользователя, сделанное в транзакции сессии
+        в обход ORM; сигнал уйдет после коммита
+        Args:
+            user_id: id пользователя
+            changes: {колонка: новое значение}, включая BASE_FIELDS
+    """
+    pending = db.session.info.setdefault(_INFO_KEY, {})
+    merged = pending.get(user_id) or {}
+    merged.update(changes)
+    pending[user_id] = merged
+
+
+def record_unlocked(user_id, achievement):
+    """
+        Отметить достижение, разблокированное в текущей транзакции;
+        сигнал уйдет после коммита
+        Args:
+            user_id: id пользователя
+            achievement: JSON достижения
+    """
+    unlocked = db.session.info.setdefault(_ACHIEVEMENTS_KEY, {})
+    unlocked.setdefault(user_id, []).append(achievement)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _send_user_changes(session):
+    changes = session.info.pop(_INFO_KEY, None)
+    if changes:
+        users_committed.send(None, changes=changes)
+
+    unlocked = session.info.pop(_ACHIEVEMENTS_KEY, None)
+    if unlocked:
+        achievements_unlocked.send(None, unlocked=unlocked)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _drop_user_changes(session):
+    session.info.pop(_INFO_KEY, None)
+    session.info.pop(_ACHIEVEMENTS_KEY, None)
@@ -0,0 +1,169 @@
+"""
+Сервис снимка состояния пользователя
+
+Снимок собирается из пользователя и его коллекций (по запросу на каждую),
+без коммитов. Версия состояния (users.state_version) вместе со счетом
+дает ETag, поэтому неизменившийся опрос отвечает 304 без сериализации.
+
+Клиент, который знает версию своего состояния, передает ее (since) и
+получает дельту: счет и доход, а из улучшений, достижений и скинов -
+только измененные после этой версии. Если версия слишком старая
+(STATE_DELTA_MAX_GAP) или изменения по элементам не отслеживаются
+(упакованное хранение), отдается полный снимок.
+"""
+from flask import current_app, jsonify, request
+from services.click_buffer import click_buffer
+from services.economy import get_per_second
+from services.catalog import catalog
+from services.progress import progress_store
+
+
+def load_snapshot(user):
+    """
+        Догрузить улучшения, достижения и скины пользователя
+        по запросу на коллекцию (в упакованном хранении
+        они уже в строке пользователя)
+        Returns:
+            User: Тот же пользователь с загруженным прогрессом
+    """
+    return progress_store.snapshot(user)
+
+
+def current_score(user):
+    """Счет с учетом накопленного автопроизводства и кликов из буфера"""
+    get_per_second(user)
+    return user.score + user.accrued_production() + click_buffer.pending(user.user_id)
+
+
+def state_etag(user, score):
+    """ETag состояния: меняется вместе с версией, счетом или доходом"""
+    return f'{user.user_id}-{user.state_version or 0}-{score}-{user.per_second or 0}'
+
+
+def achievements_etag(user):
+    """ETag списка достижений: они меняются только вместе с версией"""
+    return f'{user.user_id}-{user.state_version or 0}'
+
+
+def achievement_list(achievements):
+    """
+        Полученные достижения пользователя в порядке каталога
+        Args:
+            achievements: Полученные достижения пользователя
+    """
+    return sorted(
+        (a.to_dict() for a in achievements), key=lambda a: a['achievement_id']
+    )
+
+
+def skin_list(skins):
+    """
+        id скинов, которые есть у пользователя (включая бесплатные)
+        Args:
+            skins: Купленные скины пользователя
+    """
+    owned = {s.name for s in skins}
+    return [
+        t['id'] for t in catalog.skins
+        if t['base_cost'] == 0 or t['name'] in owned
+    ]
+
+
+def active_skin(user):
+    """id выбранного скина пользователя"""
+    template = catalog.skins.by_name.get(user.active_skin)
+    return template['id'] if template else None
+
+
+def build_state(user, score):
+    """
+        Собрать JSON состояния из загруженного снимка.
+        Названия, цены и цвета в ответ не входят - они в каталоге
+        Returns:
+            dict: Данные пользователя, уровни улучшений, id достижений и скинов
+    """
+    return {
+        'user_id': user.user_id,
+        'username': user.username,
+        'version': user.state_version or 0,
+        'score': score,
+        'per_second': user.per_second or 0,
+        'catalog_version': catalog.version,
+        'upgrades': sorted(
+            (u.to_dict() for u in progress_store.upgrades(user)), key=lambda u: u['upgrade_id']
+        ),
+        'achievements': achievement_list(progress_store.achievements(user)),
+        'skins': skin_list(progress_store.skins(user)),
+        'active_skin': active_skin(user)
+    }
+
+
+def build_delta(user, score, since):
+    """
+        Собрать дельту состояния после версии since
+        Returns:
+            dict: Счет, доход, версия каталога и измененные элементы или None,
+            если клиенту нужен полный снимок
+    """
+    version = user.state_version or 0
+    if since == version:
+        # Изменились только счет и доход
+        upgrades, achievements, skins = (), (), ()
+    elif since > version or version - since > current_app.config.get('STATE_DELTA_MAX_GAP', 50):
+        return None
+    else:
+        changes = progress_store.changes(user, since)
+        if changes is None:
+            return None
+        upgrades, achievements, skins = changes
+
+    delta = {
+        'delta': True,
+        'since': since,
+        'version': version,
+        'score': score,
+        'per_second': user.per_second or 0,
+        'catalog_version': catalog.version,
+    }
+    if since != version:
+        delta['active_skin'] = active_skin(user)
+    if upgrades:
+        delta['upgrades'] = sorted(
+            (u.to_dict() for u in upgrades), key=lambda u: u['upgrade_id']
+        )
+    if achievements:
+        delta['achievements'] = achievement_list(achievements)
+    if skins:
+        delta['skins'] = sorted(s.template['id'] for s in skins)
+    return delta
+
+
+def build_sync(user, score, since=None):
+    """
+        Состояние для клиента: дельта после версии since или полный снимок
+        Args:
+            since: Версия состояния клиента (None - полный снимок)
+    """
+    if since is not None:
+        delta = build_delta(user, score, since)
+        if delta is not None:
+            return delta
+    return build_state(load_snapshot(user), score)
+
+
+def conditional_json(etag, build):
+    """
+        Условный GET: 304, если у клиента актуальная версия
+        Args:
+            etag: ETag текущего состояния
+            build: Функция, которая строит JSON, если версия изменилась
+    """
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(build())
+
+    response.set_etag(etag)
+    # Браузер хранит ответ, но каждый раз сверяет версию с сервером
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
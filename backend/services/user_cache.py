@@ -0,0 +1,235 @@
+"""
+Кэш горячих пользователей для get_current_user
+
+Процесс хранит снимки строк users (значения колонок) в LRU с TTL.
+При попадании пользователь прикрепляется к сессии без запроса к базе.
+Запись в users (сигнал users_committed: ORM-коммиты, списания) удаляет
+снимок и меняет штамп пользователя. Пакетная запись кликов присылает
+значения, прочитанные из базы в той же транзакции, - ими снимок
+обновляется на месте, иначе активный игрок терял бы его каждую секунду.
+
+Штампы - общий для процессов файл, отображенный в память (mmap):
+по 8 байт на слот, слот = user_id % USER_CACHE_STAMP_SLOTS. Процесс,
+записавший пользователя, кладет в слот новое уникальное значение;
+снимок годен, только пока штамп в слоте совпадает с прочитанным перед
+загрузкой строки. Проверка - одно чтение из памяти, без системных
+вызовов. Без файла (база в памяти) штампы живут внутри процесса.
+Смена штампа не атомарна относительно других процессов, поэтому снимок
+дополнительно ограничен TTL; списания защищены версией пользователя
+(services.wallet) и от устаревшего снимка не зависят.
+"""
+import itertools
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
+from models import db, User
+from services.click_buffer import ClickBuffer
+from services.engine_profile import sqlite_file
+from services.signals import users_committed
+
+_STAMP = struct.Struct('<Q')
+
+
+class StampTable:
+    """
+    Штампы версий пользователей: mmap файла или память процесса
+    """
+
+    def __init__(self, slots, path=None):
+        self.slots = slots
+        self.path = path
+        size = slots * _STAMP.size
+        if path is None:
+            self._buffer = bytearray(size)
+        else:
+            with open(path, 'a+b') as f:
+                if os.fstat(f.fileno()).st_size < size:
+                    f.truncate(size)
+                self._buffer = mmap.mmap(f.fileno(), size)
+        # Уникальные значения: pid процесса и счетчик записей
+        self._tokens = itertools.count(1)
+
+    def read(self, user_id):
+        return _STAMP.unpack_from(self._buffer, (user_id % self.slots) * _STAMP.size)[0]
+
+    def bump(self, user_id):
+        token = (os.getpid() << 40) | (next(self._tokens) & ((1 << 40) - 1))
+        _STAMP.pack_into(self._buffer, (user_id % self.slots) * _STAMP.size, token)
+        return token
+
+
+class UserCache:
+    """
+    LRU/TTL-кэш снимков пользователей: user_id -> (значения, штамп, время)
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.max_size = 10_000
+        self.ttl = 30.0
+        self.stamps = None
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0  # Снимок устарел по штампу или TTL
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._columns = [column.key for column in User.__mapper__.column_attrs]
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+            Подключить кэш: штампы, подписка на записи и метрики
+            Args:
+                app: Flask application
+        """
+        self.app = app
+        self.max_size = app.config.get('USER_CACHE_SIZE', 10_000)
+        self.ttl = app.config.get('USER_CACHE_TTL', 30.0)
+        self.stamps = StampTable(
+            app.config.get('USER_CACHE_STAMP_SLOTS', 65536), self._stamp_path(app)
+        )
+        app.extensions['user_cache'] = self
+        users_committed.connect(self._on_users_committed, weak=False)
+
+        metrics = app.extensions.get('metrics')
+        if metrics is not None:
+            metrics.add_collector(self.collect)
+
+    @staticmethod
+    def _stamp_path(app):
+        path = app.config.get('USER_CACHE_STAMP_FILE')
+        if path:
+            return path
+        # По умолчанию - рядом с файлом SQLite, чтобы его видели все воркеры
+        database = sqlite_file(app)
+        return database + '-userstamps' if database else None
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    # Чтение
+
+    def get(self, user_id):
+        """
+            Пользователь в текущей сессии: из identity map, из кэша
+            (без запроса к базе) или из базы
+            Returns:
+                User или None, если пользователя нет
+        """
+        user = db.session.identity_map.get(db.session.identity_key(User, user_id))
+        if user is not None:
+            return user
+
+        if not self.enabled:
+            return db.session.get(User, user_id)
+
+        values = self._lookup(user_id)
+        if values is not None:
+            return self._attach(values)
+
+        # Штамп читается до загрузки: запись после этого момента
+        # его поменяет, и снимок не будет использован
+        stamp = self.stamps.read(user_id)
+        user = db.session.get(User, user_id)
+        if user is not None:
+            self._store(user_id, {key: getattr(user, key) for key in self._columns}, stamp)
+        return user
+
+    def _lookup(self, user_id):
+        with self._lock:
+            entry = self._data.get(user_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            values, stamp, stored_at = entry
+            if stamp != self.stamps.read(user_id) or time.monotonic() - stored_at > self.ttl:
+                del self._data[user_id]
+                self.stale += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(user_id)
+            self.hits += 1
+            return values
+
+    def _attach(self, values):
+        """Сделать из снимка пользователя в текущей сессии без SELECT"""
+        user = User.__mapper__.class_manager.new_instance()
+        for key, value in values.items():
+            set_committed_value(user, key, value)
+        make_transient_to_detached(user)
+        db.session.add(user)
+        return user
+
+    def _store(self, user_id, values, stamp):
+        with self._lock:
+            self._data[user_id] = (values, stamp, time.monotonic())
+            self._data.move_to_end(user_id)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    # Инвалидация
+
+    def forget(self, user_id):
+        """Удалить снимок пользователя в этом процессе"""
+        with self._lock:
+            self._data.pop(user_id, None)
+
+    def invalidate(self, user_id):
+        """Пользователь записан: удалить снимок и сменить штамп для всех процессов"""
+        self.stamps.bump(user_id)
+        self.forget(user_id)
+
+    def refresh(self, user_id, fields):
+        """
+            Обновить снимок значениями, только что прочитанными из базы.
+            Снимок, устаревший к этому моменту, удаляется
+        """
+        with self._lock:
+            entry = self._data.get(user_id)
+            if entry is not None and entry[1] == self.stamps.read(user_id):
+                values = dict(entry[0])
+                values.update((key, value) for key, value in fields.items() if key in values)
+                self._data[user_id] = (values, self.stamps.bump(user_id), entry[2])
+                return
+        self.invalidate(user_id)
+
+    def _on_users_committed(self, sender, changes):
+        exact = isinstance(sender, ClickBuffer)
+        for user_id, fields in changes.items():
+            if exact and fields is not None:
+                self.refresh(user_id, fields)
+            else:
+                self.invalidate(user_id)
+
+    # Метрики
+
+    def collect(self):
+        """
+            Счетчики для /metrics
+            Returns:
+                list: (имя, тип, описание, значение)
+        """
+        with self._lock:
+            size = len(self._data)
+        return [
+            ('webgame_user_cache_hits_total', 'counter', 'get_current_user served from cache.', self.hits),
+            ('webgame_user_cache_misses_total', 'counter', 'get_current_user loaded from the database.', self.misses),
+            ('webgame_user_cache_stale_total', 'counter', 'Cached users dropped by stamp or TTL.', self.stale),
+            ('webgame_user_cache_evictions_total', 'counter', 'Cached users evicted by LRU.', self.evictions),
+            ('webgame_user_cache_size', 'gauge', 'Cached users.', size),
+        ]
+
+
+user_cache = UserCache()
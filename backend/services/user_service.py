@@ -1,6 +1,9 @@
 from flask import session
-from models import db, User, Achievement, Skin
-from services.game_data import ACHIEVEMENT_TEMPLATES, SKIN_TEMPLATES
+from models import db, User
+from services.archive import user_archive
+from services.progress import progress_store
+from services.shards import shards
+from services.user_cache import user_cache
 
 
 def get_current_user():
@@ -9,57 +12,46 @@ def get_current_user():
     """
     # Проверяем, есть ли user_id в сессии
     if 'user_id' in session:
-        # Пытаемся получить пользователя из базы
-        user = User.query.get(session['user_id'])
+        # Сессия базы - в шард пользователя, затем пользователь
+        # из кэша горячих пользователей или из базы
+        user_id = session['user_id']
+        shards.route(user_id)
+        user = user_cache.get(user_id)
+        if user is None and shards.refresh(user_id):
+            # Корзину пользователя перенесли в другой шард
+            user = user_cache.get(user_id)
+        if user is None:
+            # Игрок вернулся после архивации
+            user = user_archive.restore(user_id)
         
-        # Если пользователь существует, возвращаем
+        # Если пользователь существует, возвращаем (прогресс
+        # в другом режиме хранения переводится в текущий)
         if user:
+            progress_store.adopt(user)
+            # Время последнего запроса для архивации (запишется позже)
+            user_archive.seen(user_id)
             return user
         
         # Если не существует (база удалена), очищаем сессию
         session.pop('user_id', None)
     
-    # Создаем нового пользователя
+    # Создаем нового пользователя: одна строка в users, достижения и
+    # скины появятся только при разблокировке или покупке
     user = User()
+    # При шардировании user_id выдает общий счетчик, он же задает шард
+    user_id = shards.allocate_user_id()
+    if user_id is not None:
+        user.user_id = user_id
+        shards.route(user_id)
+    progress_store.new_user(user)
     db.session.add(user)
     db.session.commit()
     session['user_id'] = user.user_id
     
-    # Инициализируем данные для нового пользователя
-    init_user_data(user)
-    
     return user
 
 
-def init_user_data(user):
-    """
-    Создать начальные данные для нового пользователя
-    """
-    # Создаем достижения
-    for template in ACHIEVEMENT_TEMPLATES:
-        achievement = Achievement(
-            name=template['name'],
-            icon=template['icon'],
-            description=template['description'],
-            user_id=user.user_id
-        )
-        db.session.add(achievement)
-    
-    # Создаем скины
-    for template in SKIN_TEMPLATES:
-        skin = Skin(
-            name=template['name'],
-            description=template['description'],
-            base_cost=template['base_cost'],
-            colors=template['colors'],
-            user_id=user.user_id
-        )
-        
-        # Стандартный скин сразу куплен и активен
-        if template['base_cost'] == 0:
-            skin.acquired_at = db.func.now()
-            skin.is_active = True
-        
-        db.session.add(skin)
-    
-    db.session.commit()
+def forget_current_user():
+    """Сбросить снимок текущего пользователя (например, после конфликта версий)"""
+    if 'user_id' in session:
+        user_cache.forget(session['user_id'])
@@ -0,0 +1,172 @@
+"""
+Атомарные операции со счетом пользователя
+
+Счет никогда не пишется ORM целиком (score = <значение из Python>):
+клики прибавляются пакетным UPDATE score = score + ? (буфер кликов),
+а покупки списываются одним условным UPDATE:
+
+    UPDATE users SET score = score + :credit - :cost, ...
+    WHERE user_id = :id AND state_version = :version AND score + :credit >= :cost
+    RETURNING score, per_second
+
+credit - клики из буфера этого процесса и автопроизводство с last_update.
+users.state_version - версия для оптимистичной блокировки (version_id_col):
+ее меняют все изменения уровней, достижений, скинов, дохода и last_update,
+поэтому уровни и цена, прочитанные в Python, не могут устареть к моменту
+списания. При расхождении версии запрос повторяется (retry_conflicts).
+Блокировки строк между чтением и записью не держатся.
+"""
+import functools
+from datetime import datetime
+
+from flask import jsonify
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.exc import StaleDataError
+
+from models import db, User
+from services.click_buffer import click_buffer
+from services.signals import BASE_FIELDS, record_user_changes
+from services.user_service import forget_current_user
+
+# Ошибки параллельного изменения: версия пользователя устарела или
+# строку с тем же (user_id, name) уже вставил другой запрос
+CONFLICTS = (StaleDataError, IntegrityError)
+
+
+class Wallet:
+    """
+    Счет пользователя в пределах одного запроса-покупки.
+    Забирает клики пользователя из буфера и возвращает их туда,
+    если транзакция не удалась. Клики, не вошедшие в списание
+    (в том числе добавленные add_clicks), после запроса пишет буфер
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.user_id = user.user_id
+        self.taken = click_buffer.take(self.user_id)
+        self.clicks = self.taken  # Клики, которых еще нет в users.score
+        self.accrued = user.accrued_production()
+        self.charged = False
+        self.spent = 0
+        # Наибольший бюджет за запрос: клики пакета могут пересечь порог
+        # достижения, а покупки после них - снова опустить счет ниже
+        self.peak = self.budget
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            if self.taken:
+                click_buffer.restore(self.user_id, self.taken)
+        elif self.clicks:
+            click_buffer.add(self.user_id, self.clicks)
+        return False
+
+    @property
+    def credit(self):
+        """Начисления, которых еще нет в users.score"""
+        return self.clicks + (0 if self.charged else self.accrued)
+
+    def add_clicks(self, clicks):
+        """Клики этого запроса: доступны для списания сразу"""
+        self.clicks += clicks
+        self.peak = max(self.peak, self.budget)
+
+    @property
+    def budget(self):
+        """Сколько очков можно потратить"""
+        return (self.user.score or 0) + self.credit
+
+    def charge(self, cost, per_second=0):
+        """
+            Списать cost одним условным UPDATE
+            Args:
+                cost: Цена покупки
+                per_second: Прибавка к доходу в секунду
+            Returns:
+                bool: True - списано, False - не хватает очков
+            Raises:
+                StaleDataError: Пользователя изменил параллельный запрос
+        """
+        user = self.user
+        users = User.__table__
+        # Изменения пользователя из этого же запроса (выбор скина в пакете
+        # действий) записываются до списания: оно сверяет версию с базой
+        if user in db.session.dirty:
+            db.session.flush()
+        credit = self.credit
+        version = user.state_version or 0
+        now = datetime.now()
+
+        stmt = (
+            update(users)
+            .where(
+                users.c.user_id == user.user_id,
+                func.coalesce(users.c.state_version, 0) == version,
+                users.c.score + credit >= cost,
+            )
+            .values(
+                score=users.c.score + (credit - cost),
+                per_second=func.coalesce(users.c.per_second, 0) + per_second,
+                state_version=version + 1,
+                last_update=now,
+            )
+        )
+        returned = (users.c.score, users.c.per_second)
+
+        if db.session.get_bind().dialect.update_returning:
+            row = db.session.execute(stmt.returning(*returned)).first()
+        else:
+            result = db.session.execute(stmt)
+            row = result.rowcount and db.session.execute(
+                select(*returned).where(users.c.user_id == user.user_id)
+            ).first()
+
+        if not row:
+            current = db.session.execute(
+                select(users.c.state_version).where(users.c.user_id == user.user_id)
+            ).scalar()
+            if (current or 0) != version:
+                raise StaleDataError(f'User {user.user_id} was modified concurrently')
+            return False
+
+        score, new_per_second = row
+        for key, value in (('score', score), ('per_second', new_per_second),
+                           ('state_version', version + 1), ('last_update', now)):
+            set_committed_value(user, key, value)
+        self.clicks = 0
+        self.charged = True
+        self.spent += cost
+
+        changes = {key: getattr(user, key) for key in BASE_FIELDS}
+        changes['state_version'] = version + 1
+        record_user_changes(user.user_id, changes)
+        return True
+
+
+def retry_conflicts(view=None, attempts=3):
+    """
+    Декоратор endpoint'а: при параллельном изменении пользователя
+    откатить транзакцию и выполнить запрос заново. Если конфликт
+    повторяется attempts раз - 409
+    """
+    if view is None:
+        return functools.partial(retry_conflicts, attempts=attempts)
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        for _ in range(attempts):
+            try:
+                return view(*args, **kwargs)
+            except CONFLICTS:
+                db.session.rollback()
+                forget_current_user()
+        return jsonify({
+            'success': False,
+            'error': 'Concurrent update, try again'
+        }), 409
+    return wrapper
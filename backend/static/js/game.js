@@ -6,34 +6,65 @@ let gameState = {
     score: 0,
     clickPower: 1,
     perSecond: 0,
-    upgrades: [],
-    achievements: [],
-    skins: [],
-    activeSkin: null
+    upgrades: [],       // [{upgrade_id, level, current_cost}] - купленные улучшения
+    achievements: [],   // [{achievement_id, achieved_at}] - полученные достижения
+    skins: [],          // id скинов, которые есть у игрока
+    activeSkin: null    // id выбранного скина
 };
 
+// Каталог улучшений, достижений и скинов (названия, цены, цвета)
+let catalog = null;
+let catalogVersion = null;
+
+// Версия состояния с сервера: с ней приходят только изменения (дельта)
+let stateVersion = null;
+
 let pendingClicks = 0;
-let isSendingClicks = false;
 
-const upgradesData = [
-    { id: 'cursor', name: 'Курсор', icon: '👆', description: 'Автоматически кликает 1 раз в секунду', baseCost: 15, baseProduction: 1 },
-    { id: 'grandma', name: 'Бабушка', icon: '👵', description: 'Печет печеньки и приносит 5 очков в секунду', baseCost: 100, baseProduction: 5 },
-    { id: 'farm', name: 'Ферма', icon: '🌾', description: 'Выращивает ресурсы: 20 очков в секунду', baseCost: 500, baseProduction: 20 },
-    { id: 'factory', name: 'Фабрика', icon: '🏭', description: 'Производит товары: 50 очков в секунду', baseCost: 2000, baseProduction: 50 },
-    { id: 'mine', name: 'Шахта', icon: '⛏️', description: 'Добывает ресурсы: 100 очков в секунду', baseCost: 5000, baseProduction: 100 },
-    { id: 'bank', name: 'Банк', icon: '🏦', description: 'Инвестирует деньги: 200 очков в секунду', baseCost: 10000, baseProduction: 200 }
-];
+// Покупки и смена скина ждут отправки пакетом /api/user/actions
+// вместе с накопленными кликами: [{action, resolve, reject}]
+let queuedActions = [];
+let isSendingActions = false;
+// Сервер перегружен (429/503): следующая отправка не раньше Retry-After
+let retryAt = 0;
+
+// ETag последних ответов для условных GET-запросов
+const etags = {};
+
+// Поток событий сервера (SSE); без поддержки EventSource работает опрос
+let eventSource = null;
+
+// GET с If-None-Match: возвращает null, если данные не изменились (304)
+async function fetchIfChanged(url) {
+    const headers = etags[url] ? {'If-None-Match': etags[url]} : {};
+    const response = await fetch(url, {headers, cache: 'no-store'});
+    if (response.status === 304) return null;
+    if (!response.ok) throw new Error('Network response was not ok.');
+    const etag = response.headers.get('ETag');
+    if (etag) etags[url] = etag;
+    return response.json();
+}
+
+// Каталог с версией в URL кэшируется браузером навсегда
+async function loadCatalog(version) {
+    if (version === catalogVersion) return;
+    const response = await fetch(`${API_BASE}/catalog/?v=${encodeURIComponent(version)}`);
+    if (!response.ok) throw new Error('Catalog request failed.');
+    catalog = await response.json();
+    catalogVersion = version;
+}
+
+function findTemplate(section, id) {
+    return catalog[section].find(t => t.id === id);
+}
 
 async function initGame() {
     try {
-        const response = await fetch(`${API_BASE}/user/state`);
-        if (!response.ok) throw new Error('Network response was not ok.');
-        const data = await response.json();
-        
-        updateGameState(data);
-        if (gameState.activeSkin) {
-            applySkin(gameState.activeSkin.colors);
-        }
+        const data = await fetchIfChanged(`${API_BASE}/user/state`);
+        await loadCatalog(data.catalog_version);
+
+        applyState(data);
+        applyActiveSkin();
         
         renderAll();
         startGameLoop();
@@ -45,7 +76,56 @@ async function initGame() {
 
 function startGameLoop() {
     setInterval(visualAutoProduction, 1000);
-    setInterval(flushPendingClicks, 5000);
+    setInterval(sendActions, 5000);
+    setInterval(syncState, 30000);
+    connectEvents();
+}
+
+function connectEvents() {
+    if (!window.EventSource) return;
+
+    eventSource = new EventSource(`${API_BASE}/user/stream`);
+    let connectedBefore = false;
+
+    eventSource.addEventListener('open', () => {
+        // После переподключения догоняем события, пропущенные в разрыве
+        if (connectedBefore) syncState(true);
+        connectedBefore = true;
+    });
+    eventSource.addEventListener('score', (e) => {
+        const data = JSON.parse(e.data);
+        gameState.score = data.score + pendingClicks;
+        updateDisplay();
+    });
+    eventSource.addEventListener('per_second', (e) => {
+        gameState.perSecond = JSON.parse(e.data).per_second;
+        updateDisplay();
+    });
+    eventSource.addEventListener('achievement', (e) => {
+        handleUnlocked([JSON.parse(e.data)]);
+    });
+}
+
+function isStreaming() {
+    return eventSource !== null && eventSource.readyState === EventSource.OPEN;
+}
+
+// force - запросить состояние даже при открытом потоке событий
+async function syncState(force = false) {
+    if (isStreaming() && force !== true) return;
+    try {
+        const since = stateVersion !== null ? `?since=${stateVersion}` : '';
+        const data = await fetchIfChanged(`${API_BASE}/user/state${since}`);
+        if (!data) return;
+        await loadCatalog(data.catalog_version);
+        applyState(data);
+        applyActiveSkin();
+        // Клики, которые еще не отправлены, сервер пока не видит
+        gameState.score += pendingClicks;
+        updateDisplay();
+    } catch (error) {
+        console.error('Error syncing state:', error);
+    }
 }
 
 function visualAutoProduction() {
@@ -78,58 +158,76 @@ document.getElementById('clickButton').addEventListener('click', (e) => {
     createParticle(e.clientX, e.clientY, `+${gameState.clickPower}`);
 });
 
-async function flushPendingClicks() {
-    if (pendingClicks === 0 || isSendingClicks) return;
-    
-    isSendingClicks = true;
+// Отправить накопленные клики и действия одним запросом
+async function sendActions() {
+    if (isSendingActions || (pendingClicks === 0 && queuedActions.length === 0)) return;
+    if (Date.now() < retryAt) return;
+
+    isSendingActions = true;
     const clicksToSend = pendingClicks;
+    const batch = queuedActions;
     pendingClicks = 0;
-    
+    queuedActions = [];
+
+    // Клики идут первыми: на них можно сразу покупать
+    const actions = batch.map(item => item.action);
+    if (clicksToSend > 0) actions.unshift({type: 'click', clickPower: clicksToSend});
+
     try {
-        const response = await fetch(`${API_BASE}/user/click`, {
+        const response = await fetch(`${API_BASE}/user/actions`, {
             method: 'POST',
             headers: {'Content-Type': 'application/json'},
-            body: JSON.stringify({clickPower: clicksToSend})
+            body: JSON.stringify({actions, since: stateVersion})
         });
 
+        if (response.status === 429 || response.status === 503) {
+            // Пакет не выполнен: клики и действия уйдут после Retry-After
+            retryAt = Date.now() + (parseInt(response.headers.get('Retry-After'), 10) || 1) * 1000;
+            pendingClicks += clicksToSend;
+            queuedActions = batch.concat(queuedActions);
+            setTimeout(sendActions, retryAt - Date.now());
+            return;
+        }
         const data = await response.json();
         if (!response.ok) throw new Error(data.error || 'Server error');
-        
-        updateGameState(data);
+
+        // Уведомления - до замены списка достижений состоянием с сервера
+        handleUnlocked(data.unlocked_achievements);
+        applyState(data.state);
+        // Клики, сделанные во время запроса, сервер пока не видит
+        gameState.score += pendingClicks;
+        applyActiveSkin();
         updateDisplay();
-        
-        if (data.unlocked_achievements?.length > 0) {
-            data.unlocked_achievements.forEach(ach => showNotification(`🎉 ${ach.name}!`, 'success'));
-            await syncAchievements();
-        }
+
+        const results = clicksToSend > 0 ? data.results.slice(1) : data.results;
+        batch.forEach((item, i) => item.resolve(results[i]));
     } catch (error) {
-        console.error('Error flushing clicks:', error);
+        console.error('Error sending actions:', error);
         pendingClicks += clicksToSend;
+        batch.forEach(item => item.reject(error));
     } finally {
-        isSendingClicks = false;
+        isSendingActions = false;
+        if (queuedActions.length > 0) sendActions();
     }
 }
 
-async function buyUpgrade(upgradeName) {
-    await flushPendingClicks();
-    try {
-        const response = await fetch(`${API_BASE}/upgrades/buy`, {
-            method: 'POST',
-            headers: {'Content-Type': 'application/json'},
-            body: JSON.stringify({name: upgradeName})
-        });
-
-        const data = await response.json();
-        if (!response.ok) throw new Error(data.error || 'Server error on purchase');
+// Выполнить действие в ближайшем пакете; отказ сервера - исключение
+async function runAction(action) {
+    const result = new Promise((resolve, reject) => {
+        queuedActions.push({action, resolve, reject});
+    });
+    sendActions();
+    const data = await result;
+    if (!data.success) throw new Error(data.error);
+    return data;
+}
 
-        updateGameState(data);
-        updateDisplay();
-        showNotification(`✅ Куплено: ${upgradeName}!`, 'success');
-        
-        if (data.unlocked_achievements?.length > 0) {
-            data.unlocked_achievements.forEach(ach => showNotification(`🎉 ${ach.name}!`, 'success'));
-            await syncAchievements();
-        }
+// quantity: число уровней или 'max' - купить сколько хватает очков
+async function buyUpgrade(upgradeName, quantity = 1) {
+    try {
+        const data = await runAction({type: 'buy_upgrade', name: upgradeName, quantity});
+        const bought = data.quantity > 1 ? ` x${data.quantity}` : '';
+        showNotification(`✅ Куплено: ${upgradeName}${bought}!`, 'success');
     } catch (error) {
         console.error('Error buying upgrade:', error);
         showNotification(`❌ ${error.message}`, 'error');
@@ -137,19 +235,8 @@ async function buyUpgrade(upgradeName) {
 }
 
 async function buySkin(skinId) {
-    await flushPendingClicks();
     try {
-        const response = await fetch(`${API_BASE}/skins/buy`, {
-            method: 'POST',
-            headers: {'Content-Type': 'application/json'},
-            body: JSON.stringify({skin_id: skinId})
-        });
-
-        const data = await response.json();
-        if (!response.ok) throw new Error(data.error || 'Ошибка при покупке скина');
-        
-        updateGameState(data);
-        updateDisplay();
+        await runAction({type: 'buy_skin', skin_id: skinId});
         showNotification('✅ Скин куплен!', 'success');
     } catch (error) {
         console.error('Error buying skin:', error.message);
@@ -159,21 +246,7 @@ async function buySkin(skinId) {
 
 async function activateSkin(skinId) {
     try {
-        const response = await fetch(`${API_BASE}/skins/activate`, {
-            method: 'POST',
-            headers: {'Content-Type': 'application/json'},
-            body: JSON.stringify({skin_id: skinId})
-        });
-        
-        const data = await response.json();
-        if (!response.ok) throw new Error(data.error || 'Ошибка активации');
-
-        gameState.activeSkin = data.skin;
-        applySkin(data.skin.colors);
-
-        gameState.skins.forEach(s => { s.is_active = (s.skin_id === skinId); });
-        
-        renderSkins();
+        await runAction({type: 'activate_skin', skin_id: skinId});
         showNotification('✅ Скин активирован!', 'success');
     } catch (error) {
         console.error('Error activating skin:', error.message);
@@ -190,16 +263,35 @@ function updateGameState(data) {
         gameState.achievements = Array.isArray(data.achievements) ? data.achievements : [];
     }
     if (data.skins) gameState.skins = data.skins;
+    if (data.active_skin !== undefined) gameState.activeSkin = data.active_skin;
     if (data.upgrade) {
-        const index = gameState.upgrades.findIndex(u => u.name === data.upgrade.name);
+        const index = gameState.upgrades.findIndex(u => u.upgrade_id === data.upgrade.upgrade_id);
         if (index >= 0) gameState.upgrades[index] = data.upgrade;
         else gameState.upgrades.push(data.upgrade);
     }
-    if (data.skin) {
-        const index = gameState.skins.findIndex(s => s.skin_id === data.skin.skin_id);
-        if (index >= 0) gameState.skins[index] = data.skin;
-        else gameState.skins.push(data.skin);
+    if (data.skin && !gameState.skins.includes(data.skin.skin_id)) {
+        gameState.skins.push(data.skin.skin_id);
+    }
+}
+
+// Полное состояние заменяет списки, дельта (delta) дополняет их
+function applyState(data) {
+    if (data.delta) {
+        data = {
+            ...data,
+            upgrades: mergeById(gameState.upgrades, data.upgrades, 'upgrade_id'),
+            achievements: mergeById(gameState.achievements, data.achievements, 'achievement_id'),
+            skins: [...new Set([...gameState.skins, ...(data.skins || [])])]
+        };
     }
+    updateGameState(data);
+    if (data.version !== undefined) stateVersion = data.version;
+}
+
+function mergeById(items, changed = [], key) {
+    const merged = new Map(items.map(item => [item[key], item]));
+    changed.forEach(item => merged.set(item[key], item));
+    return [...merged.values()];
 }
 
 function renderAll() {
@@ -220,11 +312,11 @@ function updateDisplay() {
 function renderShop() {
     const shopContainer = document.getElementById('shopItems');
     shopContainer.innerHTML = '';
-    upgradesData.forEach(template => {
-        const userUpgrade = gameState.upgrades.find(u => u.name === template.name) || {};
+    catalog.upgrades.forEach(template => {
+        const userUpgrade = gameState.upgrades.find(u => u.upgrade_id === template.id) || {};
         const level = userUpgrade.level || 0;
         const currentCost = userUpgrade.current_cost || template.baseCost;
-        const production = userUpgrade.current_production || 0;
+        const production = template.baseProduction * level;
         const canAfford = gameState.score >= currentCost;
         const item = document.createElement('div');
         item.className = 'shop-item';
@@ -239,7 +331,8 @@ function renderShop() {
                 </div>
                 <div style="margin-top: 10px; font-size: 14px; color: #667eea;">Производство: ${production}/сек</div>
             </div>
-            <button class="shop-item-button" onclick="buyUpgrade('${template.name}')" ${!canAfford ? 'disabled' : ''}>Купить</button>`;
+            <button class="shop-item-button" onclick="buyUpgrade('${template.name}')" ${!canAfford ? 'disabled' : ''}>Купить</button>
+            <button class="shop-item-button shop-item-button-max" onclick="buyUpgrade('${template.name}', 'max')" ${!canAfford ? 'disabled' : ''}>Купить максимум</button>`;
         shopContainer.appendChild(item);
     });
 }
@@ -247,21 +340,22 @@ function renderShop() {
 function renderSkins() {
     const container = document.getElementById('skinsContainer');
     container.innerHTML = '';
-    if (!gameState.skins) return;
-    gameState.skins.forEach(skin => {
+    catalog.skins.forEach(skin => {
+        const isOwned = gameState.skins.includes(skin.id);
+        const isActive = gameState.activeSkin === skin.id;
         const item = document.createElement('div');
         item.className = 'shop-item skin';
-        if (skin.is_owned) item.classList.add('owned');
-        if (skin.is_active) item.classList.add('active');
+        if (isOwned) item.classList.add('owned');
+        if (isActive) item.classList.add('active');
         
         let buttonHtml;
-        if (skin.is_active) {
+        if (isActive) {
             buttonHtml = `<button class="shop-item-button" disabled>Активен</button>`;
-        } else if (skin.is_owned) {
-            buttonHtml = `<button class="shop-item-button" onclick="activateSkin(${skin.skin_id})">Применить</button>`;
+        } else if (isOwned) {
+            buttonHtml = `<button class="shop-item-button" onclick="activateSkin(${skin.id})">Применить</button>`;
         } else {
             const canAfford = gameState.score >= skin.base_cost;
-            buttonHtml = `<button class="shop-item-button" onclick="buySkin(${skin.skin_id})" ${!canAfford ? 'disabled' : ''}>Купить</button>`;
+            buttonHtml = `<button class="shop-item-button" onclick="buySkin(${skin.id})" ${!canAfford ? 'disabled' : ''}>Купить</button>`;
         }
 
         item.innerHTML = `
@@ -270,7 +364,7 @@ function renderSkins() {
                 <div class="shop-item-name">${skin.name}</div>
                 <div class="shop-item-description">${skin.description}</div>
                 <div class="shop-item-stats">
-                    ${skin.is_owned ? `<span style="color: #4CAF50; font-weight: bold;">✓ Куплен</span>` : `<span class="shop-item-cost">${formatNumber(skin.base_cost)}</span>`}
+                    ${isOwned ? `<span style="color: #4CAF50; font-weight: bold;">✓ Куплен</span>` : `<span class="shop-item-cost">${formatNumber(skin.base_cost)}</span>`}
                 </div>
             </div>
             ${buttonHtml}`;
@@ -278,42 +372,45 @@ function renderSkins() {
     });
 }
 
-async function syncAchievements() {
-    try {
-        const response = await fetch(`${API_BASE}/achievements/`);
-        if (!response.ok) return;
-        const achievementsData = await response.json()
-        if (Array.isArray(achievementsData)) {
-            gameState.achievements = achievementsData;
-            renderAchievements();
-        } else {
-            console.warn('Achievements data is not array: ', achievementsData);
-        }
-    } catch (error) { 
-            console.error('Error syncing achievements:', error);
-    }
+// Новые достижения приходят и в ответах, и в потоке событий:
+// уведомляем только о тех, что еще не отмечены разблокированными
+function handleUnlocked(achievements) {
+    if (!achievements?.length) return;
+    let changed = false;
+    achievements.forEach(ach => {
+        if (gameState.achievements.some(a => a.achievement_id === ach.achievement_id)) return;
+        gameState.achievements.push(ach);
+        const template = findTemplate('achievements', ach.achievement_id);
+        showNotification(`🎉 ${template ? template.name : ''}!`, 'success');
+        changed = true;
+    });
+    if (changed) renderAchievements();
 }
 
 function renderAchievements() {
     const container = document.getElementById('achievementsContainer');
     container.innerHTML = '';
 
-    if (!Array.isArray(gameState.achievements)) return;
-    
-    gameState.achievements.forEach(achievement => {
+    catalog.achievements.forEach(achievement => {
+        const isUnlocked = gameState.achievements.some(a => a.achievement_id === achievement.id);
         const item = document.createElement('div');
-        item.className = `achievement-item ${achievement.is_unlocked ? 'unlocked' : 'locked'}`;
+        item.className = `achievement-item ${isUnlocked ? 'unlocked' : 'locked'}`;
         item.innerHTML = `
             <div class="achievement-icon">${achievement.icon}</div>
             <div class="achievement-name">${achievement.name}</div>
             <div class="achievement-description">${achievement.description}</div>
-            <div class="achievement-status ${achievement.is_unlocked ? 'unlocked' : 'locked'}">
-                ${achievement.is_unlocked ? '✓ Разблокировано' : '🔒 Заблокировано'}
+            <div class="achievement-status ${isUnlocked ? 'unlocked' : 'locked'}">
+                ${isUnlocked ? '✓ Разблокировано' : '🔒 Заблокировано'}
             </div>`;
         container.appendChild(item);
     });
 }
 
+function applyActiveSkin() {
+    const skin = findTemplate('skins', gameState.activeSkin);
+    if (skin) applySkin(skin.colors);
+}
+
 function applySkin(colors) {
     document.body.style.background = `linear-gradient(135deg, ${colors.primary} 0%, ${colors.secondary} 100%)`;
     const header = document.querySelector('.header');
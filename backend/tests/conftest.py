@@ -0,0 +1,80 @@
+"""
+Общие фикстуры тестов: приложение на временной базе SQLite
+
+Приложение создается при импорте app, поэтому база и настройки
+задаются переменными окружения до импорта. Контроль допуска
+выключен: тесты делают много запросов подряд от одного игрока.
+"""
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+sys.path.insert(0, BACKEND_DIR)
+
+_database_dir = tempfile.mkdtemp(prefix='clicker-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_database_dir, 'test.db')
+os.environ['ADMISSION_CONTROL'] = '0'
+os.environ.pop('SHARD_COUNT', None)
+os.environ.pop('PROGRESS_STORAGE', None)
+os.environ.pop('ACHIEVEMENT_EVALUATION', None)
+
+from app import app as flask_app  # noqa: E402
+from services.click_buffer import click_buffer  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    yield flask_app
+    click_buffer.stop()
+
+
+@pytest.fixture
+def client(app):
+    """Клиент нового игрока (пользователь создается первым запросом)"""
+    client = app.test_client()
+    client.get('/api/user/state')
+    return client
+
+
+def user_id_of(client):
+    """id игрока клиента (из cookie-сессии)"""
+    with client.session_transaction() as session:
+        return session['user_id']
+
+
+@pytest.fixture
+def flush(app):
+    """Записать буфер кликов в базу"""
+    return click_buffer.flush
+
+
+@contextmanager
+def capture_sql():
+    """
+        Собрать SQL, выполненный во всех движках внутри блока
+        Returns:
+            list: (statement, parameters) в порядке выполнения
+    """
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def selects(statements):
+    """Только SELECT из собранного SQL"""
+    return [s for s in statements if s[0].lstrip().upper().startswith('SELECT')]
@@ -0,0 +1,72 @@
+BEGIN TRANSACTION;
+CREATE TABLE achievements (
+	achievement_id INTEGER NOT NULL, 
+	name VARCHAR(100) NOT NULL, 
+	description VARCHAR(255), 
+	icon VARCHAR(255), 
+	is_unlocked BOOLEAN, 
+	achieved_at DATETIME, 
+	user_id INTEGER NOT NULL, 
+	PRIMARY KEY (achievement_id), 
+	FOREIGN KEY(user_id) REFERENCES users (user_id)
+);
+INSERT INTO "achievements" VALUES(1,'Первый клик','Сделайте ваш первый клик','🎯',1,'2026-10-18 20:17:22.056133',1);
+INSERT INTO "achievements" VALUES(2,'Сотня кликов','Наберите 100 очков','💯',1,'2026-10-18 20:17:22.056160',1);
+INSERT INTO "achievements" VALUES(3,'Первое улучшение','Купите первое улучшение','⬆️',1,'2026-10-18 20:17:22.078115',1);
+INSERT INTO "achievements" VALUES(4,'Тысяча очков','Наберите 1000 очков','🌟',1,'2026-10-18 20:17:22.062151',1);
+INSERT INTO "achievements" VALUES(5,'Автоматизация','Достигните 10 очков в секунду','🤖',0,NULL,1);
+INSERT INTO "achievements" VALUES(6,'Миллионер','Наберите 1,000,000 очков','💰',0,NULL,1);
+INSERT INTO "achievements" VALUES(7,'Первый клик','Сделайте ваш первый клик','🎯',1,'2026-10-18 20:17:22.126694',2);
+INSERT INTO "achievements" VALUES(8,'Сотня кликов','Наберите 100 очков','💯',0,NULL,2);
+INSERT INTO "achievements" VALUES(9,'Первое улучшение','Купите первое улучшение','⬆️',0,NULL,2);
+INSERT INTO "achievements" VALUES(10,'Тысяча очков','Наберите 1000 очков','🌟',0,NULL,2);
+INSERT INTO "achievements" VALUES(11,'Автоматизация','Достигните 10 очков в секунду','🤖',0,NULL,2);
+INSERT INTO "achievements" VALUES(12,'Миллионер','Наберите 1,000,000 очков','💰',0,NULL,2);
+CREATE TABLE skins (
+	skin_id INTEGER NOT NULL, 
+	name VARCHAR(100) NOT NULL, 
+	description VARCHAR(255), 
+	base_cost INTEGER NOT NULL, 
+	is_active BOOLEAN, 
+	colors JSON NOT NULL, 
+	acquired_at DATETIME, 
+	user_id INTEGER NOT NULL, 
+	PRIMARY KEY (skin_id), 
+	FOREIGN KEY(user_id) REFERENCES users (user_id)
+);
+INSERT INTO "skins" VALUES(1,'Стандартный','Классический вид игры',0,0,'{"primary": "#667eea", "secondary": "#764ba2", "button": "linear-gradient(135deg, #f093fb 0%, #f5576c 100%)", "character": "#FFD700"}','2026-10-18 20:17:22',1);
+INSERT INTO "skins" VALUES(2,'Океан','Морская тематика',1000,1,'{"primary": "#00c6ff", "secondary": "#0072ff", "button": "linear-gradient(135deg, #667eea 0%, #764ba2 100%)", "character": "#4FC3F7"}','2026-10-18 20:17:22.103433',1);
+INSERT INTO "skins" VALUES(3,'Лес','Природная свежесть',2000,0,'{"primary": "#56ab2f", "secondary": "#a8e063", "button": "linear-gradient(135deg, #11998e 0%, #38ef7d 100%)", "character": "#8BC34A"}',NULL,1);
+INSERT INTO "skins" VALUES(4,'Закат','Теплые вечерние цвета',3000,0,'{"primary": "#ff6a00", "secondary": "#ee0979", "button": "linear-gradient(135deg, #f093fb 0%, #f5576c 100%)", "character": "#FF7043"}',NULL,1);
+INSERT INTO "skins" VALUES(5,'Космос','Звездное небо',5000,0,'{"primary": "#0f2027", "secondary": "#2c5364", "button": "linear-gradient(135deg, #667eea 0%, #764ba2 100%)", "character": "#9C27B0"}',NULL,1);
+INSERT INTO "skins" VALUES(6,'Стандартный','Классический вид игры',0,1,'{"primary": "#667eea", "secondary": "#764ba2", "button": "linear-gradient(135deg, #f093fb 0%, #f5576c 100%)", "character": "#FFD700"}','2026-10-18 20:17:22',2);
+INSERT INTO "skins" VALUES(7,'Океан','Морская тематика',1000,0,'{"primary": "#00c6ff", "secondary": "#0072ff", "button": "linear-gradient(135deg, #667eea 0%, #764ba2 100%)", "character": "#4FC3F7"}',NULL,2);
+INSERT INTO "skins" VALUES(8,'Лес','Природная свежесть',2000,0,'{"primary": "#56ab2f", "secondary": "#a8e063", "button": "linear-gradient(135deg, #11998e 0%, #38ef7d 100%)", "character": "#8BC34A"}',NULL,2);
+INSERT INTO "skins" VALUES(9,'Закат','Теплые вечерние цвета',3000,0,'{"primary": "#ff6a00", "secondary": "#ee0979", "button": "linear-gradient(135deg, #f093fb 0%, #f5576c 100%)", "character": "#FF7043"}',NULL,2);
+INSERT INTO "skins" VALUES(10,'Космос','Звездное небо',5000,0,'{"primary": "#0f2027", "secondary": "#2c5364", "button": "linear-gradient(135deg, #667eea 0%, #764ba2 100%)", "character": "#9C27B0"}',NULL,2);
+CREATE TABLE upgrades (
+	upgrade_id INTEGER NOT NULL, 
+	name VARCHAR(100) NOT NULL, 
+	description VARCHAR(255), 
+	base_cost INTEGER NOT NULL, 
+	base_production INTEGER NOT NULL, 
+	level INTEGER, 
+	cost_multiplier FLOAT, 
+	purchased_at DATETIME, 
+	user_id INTEGER NOT NULL, 
+	PRIMARY KEY (upgrade_id), 
+	FOREIGN KEY(user_id) REFERENCES users (user_id)
+);
+INSERT INTO "upgrades" VALUES(1,'Курсор','Автоматически кликает 1 раз в секунду',15,1,2,1.15,'2026-10-18 20:17:22.073612',1);
+CREATE TABLE users (
+	user_id INTEGER NOT NULL, 
+	username VARCHAR(36) NOT NULL, 
+	score INTEGER, 
+	last_update DATETIME, 
+	created_at DATETIME DEFAULT CURRENT_TIMESTAMP, 
+	PRIMARY KEY (user_id), 
+	UNIQUE (username)
+);
+INSERT INTO "users" VALUES(1,'75881a0a-f556-4345-9a31-68d816aa73a6',1068,'2026-10-18 20:17:22.101662','2026-10-18 20:17:22');
+INSERT INTO "users" VALUES(2,'55bfb923-66e1-4ffe-a16d-4a9de9ffb914',5,'2026-10-18 20:17:22.124562','2026-10-18 20:17:22');
+COMMIT;
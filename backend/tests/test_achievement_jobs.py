@@ -0,0 +1,135 @@
+"""
+Асинхронная проверка достижений (ACHIEVEMENT_EVALUATION = 'async')
+"""
+import pytest
+
+from conftest import user_id_of
+from models import db, Achievement, User
+from services import achievement_jobs as achievement_jobs_module
+from services.achievement_jobs import achievement_jobs
+from services.catalog import catalog
+from services.metrics import metrics
+
+NAMES = {template['id']: template['name'] for template in catalog.achievements}
+
+# Счет 1500 пересекает пороги 1, 100 и 1000 очков
+UNLOCKED_AT_1500 = ['Первый клик', 'Сотня кликов', 'Тысяча очков']
+
+
+@pytest.fixture
+def async_jobs(app, monkeypatch):
+    """Очередь в асинхронном режиме; после теста - снова синхронный"""
+    monkeypatch.setitem(app.config, 'ACHIEVEMENT_EVALUATION', 'async')
+    monkeypatch.setattr(metrics, 'add_collector', lambda collect: None)
+    monkeypatch.setattr(achievement_jobs_module.atexit, 'register', lambda func: None)
+    achievement_jobs.init_app(app)
+    assert achievement_jobs.asynchronous
+    yield achievement_jobs
+    achievement_jobs.drain(timeout=5)
+    achievement_jobs.stop()
+    achievement_jobs.asynchronous = False
+    with achievement_jobs._cond:
+        achievement_jobs._delivered.clear()
+
+
+def names(achievements):
+    return sorted(NAMES[a['achievement_id']] for a in achievements)
+
+
+def saved_names(app, user_id):
+    """Строки достижений игрока в базе (с повторами, если они есть)"""
+    with app.app_context():
+        return sorted(a.name for a in db.session.query(Achievement).filter_by(user_id=user_id))
+
+
+def click(client, power):
+    return client.post('/api/user/click', json={'clickPower': power}).get_json()
+
+
+def test_jobs_of_one_player_are_coalesced(app, client, async_jobs):
+    user_id = user_id_of(client)
+    coalesced = async_jobs.coalesced
+
+    # Пока очередь заблокирована, потоки не забирают задание
+    with async_jobs._cond:
+        assert async_jobs.submit(user_id, 150)
+        assert async_jobs.submit(user_id, 1500)
+        assert async_jobs.submit(user_id, 500)
+        assert async_jobs.depth() == 1
+        assert async_jobs._pending[user_id][0] == 1500
+    assert async_jobs.coalesced == coalesced + 2
+
+    assert async_jobs.drain(timeout=5)
+    assert names(async_jobs.take_delivered(user_id)) == sorted(UNLOCKED_AT_1500)
+    assert saved_names(app, user_id) == sorted(UNLOCKED_AT_1500)
+
+
+def test_unlocks_are_delivered_once_with_the_next_response(app, client, async_jobs):
+    user_id = user_id_of(client)
+
+    # Сам запрос только ставит проверку в очередь
+    assert click(client, 1500)['unlocked_achievements'] == []
+    assert async_jobs.drain(timeout=5)
+
+    assert names(click(client, 1)['unlocked_achievements']) == sorted(UNLOCKED_AT_1500)
+    assert async_jobs.drain(timeout=5)
+    assert click(client, 1)['unlocked_achievements'] == []
+    assert async_jobs.drain(timeout=5)
+    assert saved_names(app, user_id) == sorted(UNLOCKED_AT_1500)
+
+
+def test_full_queue_falls_back_to_the_request(client, async_jobs, monkeypatch):
+    monkeypatch.setattr(async_jobs, 'queue_size', 0)
+    overflow = async_jobs.overflow
+
+    data = click(client, 1500)
+
+    assert names(data['unlocked_achievements']) == sorted(UNLOCKED_AT_1500)
+    assert async_jobs.overflow == overflow + 1
+    assert async_jobs.depth() == 0
+
+
+def test_request_transaction_jobs_wait_for_commit(app, client, async_jobs):
+    user_id = user_id_of(client)
+
+    with app.test_request_context(), async_jobs._cond:
+        user = db.session.get(User, user_id)
+        assert async_jobs.evaluate(user, score=1500, commit=False) == []
+        assert user_id not in async_jobs._pending
+        db.session.commit()
+        assert async_jobs._pending[user_id][0] == 1500
+
+    assert async_jobs.drain(timeout=5)
+    assert names(async_jobs.take_delivered(user_id)) == sorted(UNLOCKED_AT_1500)
+    assert saved_names(app, user_id) == sorted(UNLOCKED_AT_1500)
+
+
+def test_rolled_back_request_unlocks_nothing(app, client, async_jobs):
+    user_id = user_id_of(client)
+    enqueued = async_jobs.enqueued
+
+    with app.test_request_context():
+        user = db.session.get(User, user_id)
+        async_jobs.evaluate(user, score=1500, commit=False)
+        db.session.rollback()
+
+    assert async_jobs.drain(timeout=5)
+    assert async_jobs.enqueued == enqueued
+    assert async_jobs.take_delivered(user_id) == []
+    assert saved_names(app, user_id) == []
+
+
+def test_rolled_back_response_returns_delivered_unlocks(app, client, async_jobs):
+    user_id = user_id_of(client)
+    thousand = catalog.achievements.by_name['Тысяча очков']['id']
+    delivered = [{'achievement_id': thousand, 'achieved_at': None}]
+    async_jobs._deliver(user_id, delivered)
+
+    with app.test_request_context():
+        user = db.session.get(User, user_id)
+        assert async_jobs.evaluate(user, score=1500, commit=False) == delivered
+        assert async_jobs.take_delivered(user_id) == []
+        db.session.rollback()
+
+    # Ответ не ушел: достижения достанутся следующему
+    assert async_jobs.take_delivered(user_id) == delivered
@@ -0,0 +1,109 @@
+"""
+Пакет действий /api/user/actions: одна транзакция на пакет
+"""
+import json
+
+import pytest
+from sqlalchemy.orm.exc import StaleDataError
+
+from services import actions
+from services.catalog import catalog
+from services.wallet import Wallet
+
+THOUSAND_POINTS = catalog.achievements.by_name['Тысяча очков']['id']
+
+
+def test_clicks_are_spent_in_the_same_batch(client):
+    response = client.post('/api/user/actions', json={'actions': [
+        {'type': 'click', 'clickPower': 100},
+        {'type': 'buy_upgrade', 'name': 'Курсор', 'quantity': 2},
+        {'type': 'buy_upgrade', 'name': 'Nope'},
+    ]})
+    data = response.get_json()
+
+    assert response.status_code == 200
+    assert [r['success'] for r in data['results']] == [True, True, False]
+    cost = data['results'][1]['total_cost']
+    assert data['state']['score'] == 100 - cost
+    assert data['state']['per_second'] == 2
+
+
+def test_threshold_crossed_before_purchases_is_unlocked(client):
+    # Клики поднимают счет выше 1000, покупки опускают его обратно
+    response = client.post('/api/user/actions', json={'actions': [
+        {'type': 'click', 'clickPower': 3000},
+        {'type': 'buy_upgrade', 'name': 'Курсор', 'quantity': 'max'},
+    ]})
+    data = response.get_json()
+
+    assert data['state']['score'] < 1000
+    assert THOUSAND_POINTS in [a['achievement_id'] for a in data['unlocked_achievements']]
+    assert THOUSAND_POINTS in [a['achievement_id'] for a in data['state']['achievements']]
+
+
+def test_conflict_retry_takes_click_tokens_once(client, monkeypatch):
+    taken = []
+    monkeypatch.setattr(
+        actions.admission, 'take_clicks', lambda user_id, clicks: taken.append(clicks) or 0.0
+    )
+    charge = Wallet.charge
+    calls = []
+
+    def charge_with_conflict(self, *args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            raise StaleDataError('concurrent update')
+        return charge(self, *args, **kwargs)
+
+    monkeypatch.setattr(Wallet, 'charge', charge_with_conflict)
+
+    response = client.post('/api/user/actions', json={'actions': [
+        {'type': 'click', 'clickPower': 30},
+        {'type': 'buy_upgrade', 'name': 'Курсор'},
+        {'type': 'click', 'clickPower': 20},
+    ]})
+
+    assert response.status_code == 200
+    assert len(calls) == 2
+    assert taken == [50]
+    assert response.get_json()['state']['score'] == 50 - 15
+
+
+@pytest.mark.parametrize('path', [
+    '/api/user/click', '/api/user/actions', '/api/upgrades/buy', '/api/skins/buy', '/api/skins/activate',
+])
+@pytest.mark.parametrize('body', [None, [], [1], 5, 'text'])
+def test_non_object_body_is_rejected(client, path, body):
+    response = client.post(path, data=json.dumps(body), content_type='application/json')
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+def test_malformed_ids_fail_only_their_action(client):
+    response = client.post('/api/user/actions', json={'actions': [
+        {'type': 'click', 'clickPower': 500},
+        {'type': 'buy_skin', 'skin_id': [1]},
+        {'type': 'buy_skin', 'skin_id': True},
+        {'type': 'buy_upgrade', 'name': ['x']},
+        {'type': 'buy_upgrade', 'name': {'n': 1}},
+        {'type': 'activate_skin', 'skin_id': '1'},
+        {'type': 'buy_upgrade', 'name': 'Курсор'},
+    ]})
+    data = response.get_json()
+
+    assert response.status_code == 200
+    assert [r['success'] for r in data['results']] == [True, False, False, False, False, False, True]
+    assert data['state']['upgrades'][0]['level'] == 1
+
+
+@pytest.mark.parametrize('path, body', [
+    ('/api/skins/buy', {'skin_id': [1]}),
+    ('/api/skins/buy', {'skin_id': {'id': 2}}),
+    ('/api/skins/activate', {'skin_id': [1]}),
+    ('/api/skins/activate', {'skin_id': 1.0}),
+    ('/api/upgrades/buy', {'name': ['x']}),
+    ('/api/upgrades/buy', {'name': None}),
+])
+def test_malformed_ids_are_rejected_by_endpoints(client, path, body):
+    client.post('/api/user/click', json={'clickPower': 5000})
+    assert client.post(path, json=body).status_code == 400
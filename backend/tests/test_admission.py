@@ -0,0 +1,124 @@
+"""
+Контроль допуска: ведра токенов игрока, общее ведро и ведро кликов
+"""
+import math
+
+import pytest
+from flask import Blueprint, Flask, jsonify
+
+from services import admission as admission_module
+from services.admission import AdmissionControl, BucketTable, TokenBucket
+from services.metrics import metrics
+
+
+def test_token_bucket_refills_at_rate_up_to_burst():
+    bucket = TokenBucket(rate=2, burst=4, now=0.0)
+
+    assert bucket.take(4, now=0.0) == 0
+    assert bucket.take(1, now=0.0) == pytest.approx(0.5)
+    assert bucket.take(1, now=0.5) == 0
+    # Простой дольше burst / rate не копит токены сверх burst
+    assert bucket.take(5, now=100.0) == math.inf
+    assert bucket.take(4, now=100.0) == 0
+
+
+def test_bucket_table_evicts_least_recent_key():
+    table = BucketTable(rate=1, burst=1, max_size=2)
+    table.take('a', 1, now=0.0)
+    table.take('b', 1, now=0.0)
+    table.take('a', 1, now=0.0)
+    table.take('c', 1, now=0.0)
+
+    assert len(table) == 2
+    # 'b' вытеснен: новое ведро снова полное
+    assert table.take('b', 1, now=0.0) == 0
+
+
+@pytest.fixture
+def limited_app(monkeypatch):
+    """Отдельное приложение с контролем допуска (метрики игры не трогает)"""
+    monkeypatch.setattr(metrics, 'add_collector', lambda collect: None)
+    return make_limited_app
+
+
+def make_limited_app(**config):
+    app = Flask(__name__)
+    app.config.update(SECRET_KEY='test', ADMISSION_CONTROL=True, **config)
+    bp = Blueprint('game', __name__)
+
+    @bp.route('/ping')
+    def ping():
+        return jsonify({'success': True})
+
+    app.register_blueprint(bp)
+    AdmissionControl(app)
+    return app
+
+
+def test_user_bucket_rejects_with_429_and_retry_after(limited_app):
+    app = limited_app(ADMISSION_USER_RATE=1, ADMISSION_USER_BURST=2, ADMISSION_MAX_IN_FLIGHT=0)
+    client = app.test_client()
+
+    statuses = [client.get('/ping').status_code for _ in range(3)]
+    assert statuses == [200, 200, 429]
+    response = client.get('/ping')
+    assert response.get_json() == {'success': False, 'error': 'Too many requests'}
+    assert int(response.headers['Retry-After']) >= 1
+
+    # У другого игрока (адреса) свое ведро
+    other = app.test_client()
+    assert other.get('/ping', environ_base={'REMOTE_ADDR': '10.0.0.2'}).status_code == 200
+
+
+def test_global_bucket_rejects_with_503(limited_app):
+    app = limited_app(ADMISSION_GLOBAL_RATE=1, ADMISSION_GLOBAL_BURST=1, ADMISSION_MAX_IN_FLIGHT=0)
+
+    first = app.test_client().get('/ping', environ_base={'REMOTE_ADDR': '10.0.0.1'})
+    second = app.test_client().get('/ping', environ_base={'REMOTE_ADDR': '10.0.0.2'})
+    assert (first.status_code, second.status_code) == (200, 503)
+    assert 'Retry-After' in second.headers
+
+
+@pytest.fixture
+def click_bucket(monkeypatch):
+    """Ведро кликов игрока: 10 кликов в секунду, не больше 100 за раз"""
+    monkeypatch.setattr(admission_module.admission, 'clicks', BucketTable(10, 100, 1000))
+
+
+def test_click_above_rate_is_rejected_with_429(client, click_bucket):
+    assert client.post('/api/user/click', json={'clickPower': 100}).status_code == 200
+
+    response = client.post('/api/user/click', json={'clickPower': 50})
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+
+    # Пачка больше burst не станет допустимой никогда: 400, не 429
+    assert client.post('/api/user/click', json={'clickPower': 101}).status_code == 400
+
+
+def test_rate_limited_batch_is_rejected_whole(client, click_bucket):
+    client.post('/api/user/click', json={'clickPower': 100})
+    before = client.get('/api/user/state').get_json()
+
+    response = client.post('/api/user/actions', json={'actions': [
+        {'type': 'click', 'clickPower': 50},
+        {'type': 'buy_upgrade', 'name': 'Курсор'},
+    ]})
+
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    after = client.get('/api/user/state').get_json()
+    assert after['score'] == before['score']
+    assert after['upgrades'] == before['upgrades']
+
+
+def test_impossible_click_in_batch_fails_only_that_action(client, click_bucket):
+    response = client.post('/api/user/actions', json={'actions': [
+        {'type': 'click', 'clickPower': 1000},
+        {'type': 'activate_skin', 'skin_id': 1},
+    ]})
+
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert results[0] == {'success': False, 'error': 'Too many clicks in one batch'}
+    assert results[1]['success']
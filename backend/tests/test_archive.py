@@ -0,0 +1,140 @@
+"""
+Архив неактивных игроков: перенос, возвращение и клики в буфере
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from conftest import user_id_of
+from models import db, ArchivedUser, User
+from services import archive as archive_module
+from services.archive import user_archive
+from services.click_buffer import click_buffer
+from services.shards import shards
+
+
+def make_inactive(app, user_id):
+    """Отодвинуть все отметки активности игрока на год назад"""
+    long_ago = datetime.now() - timedelta(days=365)
+    with app.app_context():
+        db.session.execute(
+            update(User).where(User.user_id == user_id)
+            .values(last_update=long_ago, created_at=long_ago, last_seen=long_ago)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+
+def archive_user(app, user_id, write_seen=False):
+    """
+        Сделать игрока неактивным и выполнить проход архивации по его шарду
+        Args:
+            write_seen: Перед проходом записать отметки last_seen (как run_pass)
+        Returns:
+            int: Перенесено игроков
+    """
+    make_inactive(app, user_id)
+    if write_seen:
+        user_archive.write_seen()
+    with app.app_context():
+        cutoff = datetime.now() - timedelta(days=user_archive.inactive_days)
+        archived, _ = user_archive.archive_batch(shards.shard_for(user_id), cutoff, user_id - 1)
+    return archived
+
+
+def stored_user(app, user_id):
+    with app.app_context():
+        return (db.session.get(User, user_id) is not None,
+                db.session.get(ArchivedUser, user_id) is not None)
+
+
+def last_seen_of(app, user_id):
+    with app.app_context():
+        return db.session.get(User, user_id).last_seen
+
+
+def test_requests_record_throttled_last_seen(app, client):
+    user_id = user_id_of(client)
+    make_inactive(app, user_id)
+    user_archive._seen.pop(user_id, None)
+
+    client.get('/api/user/state')
+    assert user_archive.write_seen() >= 1
+    seen = last_seen_of(app, user_id)
+    assert seen > datetime.now() - timedelta(minutes=1)
+
+    # Следующие запросы в пределах ARCHIVE_SEEN_INTERVAL ничего не пишут
+    client.get('/api/user/state')
+    client.post('/api/user/click', json={'clickPower': 1})
+    assert user_id not in user_archive._unwritten
+    user_archive.write_seen()
+    assert last_seen_of(app, user_id) == seen
+
+
+def test_recently_seen_player_is_not_archived(app, client):
+    user_id = user_id_of(client)
+    user_archive._seen.pop(user_id, None)
+    # Только чтение: last_update не меняется, активность видна по last_seen
+    client.get('/api/user/state')
+
+    assert archive_user(app, user_id, write_seen=True) == 0
+    assert stored_user(app, user_id) == (True, False)
+
+
+def test_archived_player_is_restored_with_progress(app, client, flush):
+    user_id = user_id_of(client)
+    client.post('/api/user/click', json={'clickPower': 2000})
+    client.post('/api/upgrades/buy', json={'name': 'Курсор', 'quantity': 3})
+    client.post('/api/skins/buy', json={'skin_id': 2})
+    client.post('/api/skins/activate', json={'skin_id': 2})
+    flush()
+    before = client.get('/api/user/state').get_json()
+
+    assert archive_user(app, user_id) == 1
+    assert stored_user(app, user_id) == (False, True)
+
+    after = client.get('/api/user/state').get_json()
+    assert stored_user(app, user_id) == (True, False)
+    for key in ('upgrades', 'skins', 'active_skin', 'per_second'):
+        assert after[key] == before[key], key
+    # Время получения достижений архив не хранит (как упакованный режим)
+    assert ([a['achievement_id'] for a in after['achievements']]
+            == [a['achievement_id'] for a in before['achievements']])
+    # Автопроизводство за время в архиве зачислено
+    assert after['score'] > before['score']
+
+
+def test_player_with_buffered_clicks_is_not_archived(app, client, flush):
+    user_id = user_id_of(client)
+    client.post('/api/user/click', json={'clickPower': 5})
+    flush()
+    client.post('/api/user/click', json={'clickPower': 7})
+
+    assert archive_user(app, user_id) == 0
+    assert stored_user(app, user_id) == (True, False)
+    flush()
+
+
+def test_clicks_of_player_archived_elsewhere_wait_for_restore(app, client, flush, monkeypatch):
+    user_id = user_id_of(client)
+    client.post('/api/user/click', json={'clickPower': 10})
+    flush()
+    client.post('/api/user/click', json={'clickPower': 40})
+
+    # Игрока архивирует другой процесс: он не видит этот буфер
+    class OtherProcessBuffer:
+        @staticmethod
+        def pending(user_id):
+            return 0
+
+    monkeypatch.setattr(archive_module, 'click_buffer', OtherProcessBuffer)
+    assert archive_user(app, user_id) == 1
+
+    flush()
+    assert click_buffer.pending(user_id) == 40
+
+    client.get('/api/user/state')
+    flush()
+    assert click_buffer.pending(user_id) == 0
+    with app.app_context():
+        assert db.session.get(User, user_id).score == 50
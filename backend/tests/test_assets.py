@@ -0,0 +1,53 @@
+"""
+Сборка статики: новая сборка подменяет старую только целиком
+"""
+import json
+import os
+
+import pytest
+
+from services.assets import MANIFEST, AssetPipeline
+
+
+@pytest.fixture
+def pipeline(tmp_path):
+    pipeline = AssetPipeline()
+    pipeline.directory = str(tmp_path / 'dist')
+    return pipeline
+
+
+def write_static(tmp_path, text):
+    static = tmp_path / 'static'
+    (static / 'js').mkdir(parents=True, exist_ok=True)
+    (static / 'js' / 'game.js').write_text(text)
+    return str(static)
+
+
+def test_rebuild_replaces_the_previous_build(tmp_path, pipeline):
+    pipeline.build(write_static(tmp_path, 'let version = 1;'))
+    old = pipeline.manifest['js/game.js']
+
+    pipeline.build(write_static(tmp_path, 'let version = 2;'))
+    new = pipeline.manifest['js/game.js']
+
+    assert new != old
+    assert os.path.isfile(os.path.join(pipeline.directory, new))
+    assert not os.path.exists(os.path.join(pipeline.directory, old))
+    with open(os.path.join(pipeline.directory, MANIFEST), encoding='utf-8') as f:
+        assert json.load(f)['files'] == {'js/game.js': new}
+    assert sorted(os.listdir(tmp_path)) == ['dist', 'static']
+
+
+def test_failed_build_keeps_the_previous_build(tmp_path, pipeline):
+    pipeline.build(write_static(tmp_path, 'let version = 1;'))
+    old = pipeline.manifest['js/game.js']
+
+    def broken_index():
+        raise RuntimeError('template error')
+
+    with pytest.raises(RuntimeError):
+        pipeline.build(write_static(tmp_path, 'let version = 2;'), broken_index)
+
+    assert pipeline.manifest == {'js/game.js': old}
+    assert os.path.isfile(os.path.join(pipeline.directory, old))
+    assert sorted(os.listdir(tmp_path)) == ['dist', 'static']
@@ -0,0 +1,101 @@
+"""
+Буфер кликов: клики подтверждаются сразу и записываются ровно один раз
+"""
+import threading
+
+from conftest import user_id_of
+from models import db, User
+from services.click_buffer import MAX_PENDING, click_buffer
+
+
+def stored_score(app, user_id):
+    with app.app_context():
+        return db.session.get(User, user_id).score
+
+
+def test_clicks_are_acknowledged_before_flush(app, client, flush):
+    user_id = user_id_of(client)
+    flush()
+
+    scores = [
+        client.post('/api/user/click', json={'clickPower': power}).get_json()['score']
+        for power in (3, 4, 5)
+    ]
+    # Ответ видит свои клики, база - еще нет
+    assert scores == [3, 7, 12]
+    assert stored_score(app, user_id) == 0
+    assert client.get('/api/user/state').get_json()['score'] == 12
+
+    flush()
+    assert click_buffer.pending(user_id) == 0
+    assert stored_score(app, user_id) == 12
+    flush()
+    assert stored_score(app, user_id) == 12
+
+
+def test_purchase_takes_buffered_clicks_once(app, client, flush):
+    user_id = user_id_of(client)
+    client.post('/api/user/click', json={'clickPower': 100})
+    cost = client.post('/api/upgrades/buy', json={'name': 'Курсор'}).get_json()['total_cost']
+
+    assert click_buffer.pending(user_id) == 0
+    flush()
+    assert stored_score(app, user_id) == 100 - cost
+
+
+def test_concurrent_clicks_and_flushes_lose_nothing(app, client, flush):
+    user_id = user_id_of(client)
+    flush()
+
+    def clicker():
+        for _ in range(200):
+            click_buffer.add(user_id, 1)
+
+    def flusher():
+        for _ in range(50):
+            flush()
+
+    threads = [threading.Thread(target=clicker) for _ in range(4)] + [threading.Thread(target=flusher)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    flush()
+
+    assert stored_score(app, user_id) == 800
+
+
+def test_click_power_is_capped_without_admission_control(app, client):
+    assert app.config['ADMISSION_CONTROL'] is False
+    for power in (10 ** 30, app.config['CLICK_MAX_POWER'] + 1):
+        response = client.post('/api/user/click', json={'clickPower': power})
+        assert response.status_code == 400
+    assert client.post('/api/user/click', json={'clickPower': app.config['CLICK_MAX_POWER']}).status_code == 200
+
+
+def test_pending_clicks_stay_in_int64(app, client, flush):
+    user_id = user_id_of(client)
+    flush()
+    click_buffer.add(user_id, 2 ** 62)
+    click_buffer.add(user_id, 2 ** 62)
+    assert click_buffer.pending(user_id) == MAX_PENDING
+    click_buffer.take(user_id)
+
+
+def test_bad_row_does_not_block_other_players(app, flush):
+    good, bad = app.test_client(), app.test_client()
+    good.get('/api/user/state')
+    bad.get('/api/user/state')
+    good_id, bad_id = user_id_of(good), user_id_of(bad)
+    flush()
+
+    good.post('/api/user/click', json={'clickPower': 9})
+    # Значение, которое SQLite не принимает (мимо проверок add)
+    with click_buffer._lock:
+        click_buffer._pending[bad_id] = 10 ** 30
+
+    flush()
+    assert stored_score(app, good_id) == 9
+    assert click_buffer.pending(bad_id) == 0
+    assert stored_score(app, bad_id) == 0
+    flush()  # Отброшенная строка больше не срывает запись
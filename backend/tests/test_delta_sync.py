@@ -0,0 +1,66 @@
+"""
+Дельта состояния: снимок версии since плюс дельта - это текущий снимок
+"""
+
+
+def state(client, since=None):
+    query = '' if since is None else f'?since={since}'
+    return client.get(f'/api/user/state{query}').get_json()
+
+
+def apply_delta(snapshot, delta):
+    """Применить дельту к снимку так же, как это делает клиент"""
+    merged = dict(snapshot)
+    for key in ('version', 'score', 'per_second', 'catalog_version', 'active_skin'):
+        if key in delta:
+            merged[key] = delta[key]
+    upgrades = {u['upgrade_id']: u for u in snapshot['upgrades']}
+    upgrades.update((u['upgrade_id'], u) for u in delta.get('upgrades', ()))
+    merged['upgrades'] = sorted(upgrades.values(), key=lambda u: u['upgrade_id'])
+    achievements = {a['achievement_id']: a for a in snapshot['achievements']}
+    achievements.update((a['achievement_id'], a) for a in delta.get('achievements', ()))
+    merged['achievements'] = sorted(achievements.values(), key=lambda a: a['achievement_id'])
+    merged['skins'] = sorted(set(snapshot['skins']) | set(delta.get('skins', ())))
+    return merged
+
+
+def without_score(data):
+    return {key: value for key, value in data.items() if key != 'score'}
+
+
+def test_delta_applied_to_old_snapshot_gives_current_state(app, client):
+    client.post('/api/user/click', json={'clickPower': 3000})
+    client.post('/api/upgrades/buy', json={'name': 'Курсор'})
+    old = state(client)
+
+    client.post('/api/upgrades/buy', json={'name': 'Курсор', 'quantity': 2})
+    client.post('/api/upgrades/buy', json={'name': 'Бабушка'})
+    client.post('/api/skins/buy', json={'skin_id': 2})
+    client.post('/api/skins/activate', json={'skin_id': 2})
+
+    delta = state(client, since=old['version'])
+    current = state(client)
+    assert delta['delta'] is True and delta['version'] == current['version']
+    # Неизмененные элементы в дельту не попадают
+    assert len(delta['upgrades']) == 2
+    assert without_score(apply_delta(old, delta)) == without_score(current)
+
+
+def test_delta_at_current_version_carries_only_score(app, client):
+    client.post('/api/user/click', json={'clickPower': 5})
+    current = state(client)
+
+    delta = state(client, since=current['version'])
+    assert delta['delta'] is True
+    assert not {'upgrades', 'achievements', 'skins', 'active_skin'} & set(delta)
+    assert delta['score'] == current['score']
+
+
+def test_unknown_or_distant_version_gets_full_snapshot(app, client, monkeypatch):
+    client.post('/api/user/click', json={'clickPower': 3000})
+    version = state(client)['version']
+    assert 'delta' not in state(client, since=version + 1)
+
+    client.post('/api/upgrades/buy', json={'name': 'Курсор'})
+    monkeypatch.setitem(app.config, 'STATE_DELTA_MAX_GAP', 0)
+    assert 'delta' not in state(client, since=version)
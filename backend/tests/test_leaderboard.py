@@ -0,0 +1,123 @@
+"""
+Рейтинг: записи своего процесса сразу, чужих - после перестройки из базы
+"""
+import time
+
+from sqlalchemy import update
+
+from conftest import capture_sql, user_id_of
+from models import db, User
+from services.leaderboard import Leaderboard, leaderboard, RankedSkipList
+from services.shards import shards
+
+
+def write_score_elsewhere(app, user_id, score):
+    """UPDATE мимо сигналов - как запись другого процесса"""
+    with app.app_context():
+        db.session.execute(
+            update(User).where(User.user_id == user_id).values(score=score)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+
+def test_skip_list_ranks_match_sorted_order():
+    keys = [(-score, user_id) for user_id, score in enumerate([5, 70, 5, 0, 33, 70, 12], 1)]
+    skip_list = RankedSkipList()
+    for key in keys:
+        skip_list.insert(key)
+    skip_list.remove(keys[2])
+    expected = sorted(keys[:2] + keys[3:])
+
+    assert len(skip_list) == len(expected)
+    assert skip_list.slice(0, 100) == expected
+    assert skip_list.slice(2, 3) == expected[2:5]
+    assert [skip_list.index(key) for key in expected] == list(range(len(expected)))
+    assert RankedSkipList.from_sorted(expected).slice(0, 100) == expected
+
+
+def test_own_commits_update_rank_immediately(app, client, flush):
+    user_id = user_id_of(client)
+    client.get('/api/leaderboard/top')
+    for _ in range(3):
+        client.post('/api/user/click', json={'clickPower': 100_000})
+    flush()
+
+    top = client.get('/api/leaderboard/top?n=100').get_json()['top']
+    me = client.get('/api/leaderboard/me').get_json()
+    assert me['score'] == 300_000
+    assert {'rank': me['rank'], 'user_id': user_id, 'score': 300_000} in top
+
+
+def test_writes_of_other_processes_appear_after_refresh(app, client):
+    user_id = user_id_of(client)
+    client.get('/api/leaderboard/top')
+    write_score_elsewhere(app, user_id, 2 * 10 ** 9)
+    assert client.get('/api/leaderboard/me').get_json()['score'] != 2 * 10 ** 9
+
+    leaderboard.rebuild()
+    me = client.get('/api/leaderboard/me').get_json()
+    assert (me['rank'], me['score']) == (1, 2 * 10 ** 9)
+
+
+def test_changes_during_rebuild_are_kept(app, client, monkeypatch):
+    user_id = user_id_of(client)
+    client.get('/api/leaderboard/top')
+    write_score_elsewhere(app, user_id, 3)
+
+    # Коммит своего процесса приходит, пока читается база
+    scatter = shards.scatter
+
+    def scatter_with_commit(func):
+        parts = scatter(func)
+        leaderboard.update(user_id, 3 * 10 ** 9)
+        return parts
+
+    monkeypatch.setattr(shards, 'scatter', scatter_with_commit)
+    leaderboard.rebuild()
+    assert leaderboard.rank(user_id) == (1, 3 * 10 ** 9)
+
+
+def test_background_refresh_picks_up_other_processes(app, client, monkeypatch):
+    user_id = user_id_of(client)
+    client.get('/api/leaderboard/top')
+    write_score_elsewhere(app, user_id, 4 * 10 ** 9)
+
+    leaderboard.stop()
+    monkeypatch.setattr(leaderboard, 'refresh_interval', 0.01)
+    leaderboard.start()
+    try:
+        deadline = time.monotonic() + 5
+        while leaderboard.rank(user_id) != (1, 4 * 10 ** 9) and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        leaderboard.stop()
+    assert leaderboard.rank(user_id) == (1, 4 * 10 ** 9)
+
+
+def test_index_is_built_by_the_worker_once(app, client):
+    board = Leaderboard()
+    board.app = app
+
+    # Запрос до постройки не читает базу сам
+    with capture_sql() as statements:
+        assert board.top(10) == [] and not board.wait_ready(0)
+    assert statements == []
+
+    board.start()
+    assert board.wait_ready(5)
+    board._thread.join(5)
+    assert not board._thread.is_alive()  # Без интервала перестройки поток завершается
+    assert board.rank(user_id_of(client)) is not None
+
+    board.start()
+    assert board.refreshes == 1
+
+
+def test_requests_get_503_until_the_index_is_built(client, monkeypatch):
+    monkeypatch.setattr(leaderboard, 'wait_ready', lambda timeout=None: False)
+
+    for path in ('/api/leaderboard/top', '/api/leaderboard/me'):
+        response = client.get(path)
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
@@ -0,0 +1,108 @@
+"""
+Миграции: база, созданная базовой версией игры (db.create_all()),
+доводится до последней ревизии при запуске приложения
+
+fixtures/baseline.sql - дамп такой базы: игрок 1 накликал 1068 очков,
+купил два уровня "Курсора", купил и выбрал скин "Океан"; игрок 2
+сделал один клик. Приложение запускается в отдельном процессе, потому
+что app создается при импорте.
+"""
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+from alembic.script import ScriptDirectory
+
+from conftest import BACKEND_DIR, FIXTURES_DIR
+from services.schema import MIGRATIONS_DIR
+
+
+def baseline_database(tmp_path):
+    path = tmp_path / 'baseline.db'
+    with open(os.path.join(FIXTURES_DIR, 'baseline.sql'), encoding='utf-8') as f:
+        script = f.read()
+    con = sqlite3.connect(path)
+    con.executescript(script)
+    con.close()
+    return path
+
+
+def run_app(path, code='pass'):
+    """Импортировать app на базе path (обновляет схему) и выполнить code"""
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{path}', ADMISSION_CONTROL='0')
+    result = subprocess.run(
+        [sys.executable, '-c', f'from app import app\n{code}'],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=120,
+    )
+    assert result.returncode == 0, result.stderr
+    return result.stdout
+
+
+def columns(con, table):
+    return {row[1] for row in con.execute(f'PRAGMA table_info({table})')}
+
+
+def test_baseline_database_is_upgraded_to_head(tmp_path):
+    path = baseline_database(tmp_path)
+    run_app(path)
+
+    con = sqlite3.connect(path)
+    head = ScriptDirectory(MIGRATIONS_DIR).get_current_head()
+    assert con.execute('SELECT version_num FROM alembic_version').fetchall() == [(head,)]
+
+    assert {'per_second', 'state_version', 'active_skin', 'progress'} <= columns(con, 'users')
+    assert not {'description', 'base_cost', 'base_production'} & columns(con, 'upgrades')
+
+    # Доход - по уровням улучшений, счет не меняется
+    users = con.execute(
+        'SELECT user_id, score, per_second, state_version FROM users ORDER BY user_id'
+    ).fetchall()
+    assert users == [(1, 1068, 2, 0), (2, 5, 0, 0)]
+    assert con.execute('SELECT user_id, name, level FROM upgrades').fetchall() == [(1, 'Курсор', 2)]
+
+    indexes = {row[1] for row in con.execute("SELECT type, name FROM sqlite_master WHERE type = 'index'")}
+    assert {'ix_achievements_user_id_name', 'ix_upgrades_user_id_name', 'ix_skins_user_id_name'} <= indexes
+
+
+def test_baseline_progress_rows_become_sparse(tmp_path):
+    path = baseline_database(tmp_path)
+    run_app(path)
+
+    con = sqlite3.connect(path)
+    assert not {'description', 'icon', 'is_unlocked'} & columns(con, 'achievements')
+    assert not {'description', 'base_cost', 'is_active', 'colors'} & columns(con, 'skins')
+
+    # Остаются только полученные достижения и купленные платные скины
+    achievements = con.execute(
+        'SELECT user_id, name FROM achievements ORDER BY user_id, achievement_id'
+    ).fetchall()
+    assert achievements == [
+        (1, 'Первый клик'), (1, 'Сотня кликов'), (1, 'Первое улучшение'),
+        (1, 'Тысяча очков'), (2, 'Первый клик'),
+    ]
+    assert con.execute('SELECT user_id, name FROM skins').fetchall() == [(1, 'Океан')]
+    assert con.execute('SELECT active_skin FROM users ORDER BY user_id').fetchall() == [
+        ('Океан',), ('Стандартный',),
+    ]
+
+
+def test_upgraded_baseline_player_keeps_progress(tmp_path):
+    path = baseline_database(tmp_path)
+    output = run_app(path, '''
+import json
+client = app.test_client()
+with client.session_transaction() as session:
+    session['user_id'] = 1
+print(json.dumps(client.get('/api/user/state').get_json()))
+''')
+    state = json.loads(output.strip().splitlines()[-1])
+
+    assert state['user_id'] == 1
+    assert state['score'] >= 1068
+    assert state['per_second'] == 2
+    assert state['upgrades'][0]['level'] == 2
+    assert sorted(a['achievement_id'] for a in state['achievements']) == [1, 2, 3, 4]
+    assert state['skins'] == [1, 2]
+    assert state['active_skin'] == 2
@@ -0,0 +1,75 @@
+"""
+Покупка пачкой стоит ровно столько же, сколько покупка по одному уровню
+"""
+import pytest
+
+from services.catalog import catalog
+from services.pricing import MAX_QUANTITY, bulk_cost, level_cost, max_affordable
+
+TEMPLATES = [(t['baseCost'], t['costMultiplier']) for t in catalog.upgrades]
+
+
+@pytest.mark.parametrize('base_cost, multiplier', TEMPLATES + [(7, 1.01)])
+def test_max_affordable_is_exact(base_cost, multiplier):
+    for level in (0, 1, 7, 40):
+        for budget in (0, 1, 99, 1234, 10 ** 6, 10 ** 12):
+            quantity, total = max_affordable(base_cost, multiplier, level, budget)
+            assert total == bulk_cost(base_cost, multiplier, level, quantity)
+            assert total == sum(level_cost(base_cost, multiplier, level + k) for k in range(quantity))
+            assert total <= budget
+            # Следующий уровень уже не по карману
+            assert total + level_cost(base_cost, multiplier, level + quantity) > budget
+
+
+@pytest.mark.parametrize('base_cost, multiplier', [(7, 1), (7.5, 1), (15, 1.15)])
+def test_bulk_cost_is_the_sum_of_level_costs(base_cost, multiplier):
+    for level in (0, 3, 50):
+        for quantity in (1, 2, 17, 300):
+            expected = sum(level_cost(base_cost, multiplier, level + k) for k in range(quantity))
+            assert bulk_cost(base_cost, multiplier, level, quantity) == expected
+
+
+def test_purchase_size_is_capped():
+    # Без роста цены (и при почти единичном множителе) счет не ограничивает покупку
+    assert max_affordable(7, 1, 0, 10 ** 18) == (MAX_QUANTITY, 7 * MAX_QUANTITY)
+    assert max_affordable(7, 1, 0, 100) == (14, 98)
+    assert max_affordable(1, 1.000001, 0, 10 ** 18)[0] == MAX_QUANTITY
+    with pytest.raises(ValueError):
+        bulk_cost(1, 1.000001, 0, MAX_QUANTITY + 1)
+
+
+def buy(client, quantity):
+    response = client.post('/api/upgrades/buy', json={'name': 'Курсор', 'quantity': quantity})
+    return response.status_code, response.get_json()
+
+
+def test_bulk_purchase_costs_the_same_as_single_levels(app, flush):
+    single, bulk = app.test_client(), app.test_client()
+    for client in (single, bulk):
+        client.get('/api/user/state')
+        client.post('/api/user/click', json={'clickPower': 3000})
+
+    spent = sum(buy(single, 1)[1]['total_cost'] for _ in range(12))
+    status, data = buy(bulk, 12)
+
+    assert status == 200 and data['quantity'] == 12
+    assert data['total_cost'] == spent
+    assert data['score'] == 3000 - spent
+    assert data['upgrade']['level'] == 12
+
+
+def test_buy_max_spends_up_to_the_next_level(app, client):
+    client.post('/api/user/click', json={'clickPower': 2500})
+    status, data = buy(client, 'max')
+
+    assert status == 200
+    template = catalog.upgrades.by_name['Курсор']
+    next_cost = level_cost(template['baseCost'], template['costMultiplier'], data['quantity'])
+    assert 0 <= data['score'] < next_cost
+    assert data['upgrade']['current_cost'] == next_cost
+
+
+@pytest.mark.parametrize('quantity', [0, -3, 1.5, True, 'all', None, MAX_QUANTITY + 1])
+def test_invalid_quantity_is_rejected(app, client, quantity):
+    client.post('/api/user/click', json={'clickPower': 2500})
+    assert buy(client, quantity)[0] == 400
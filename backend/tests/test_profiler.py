@@ -0,0 +1,27 @@
+"""
+Профилировщик: запрос по токену в заголовке X-Profile
+"""
+import pytest
+
+from services.profiler import HEADER, profiler
+
+
+@pytest.mark.parametrize('header, requested', [
+    ('secret-token', True),
+    ('other-token', False),
+    ('', False),
+    ('токен', False),
+    ('secret-tokén', False),
+])
+def test_profile_header_is_compared_safely(app, monkeypatch, header, requested):
+    monkeypatch.setattr(profiler, 'token', 'secret-token')
+    # Werkzeug отдает заголовки как latin-1: не-ASCII байты - не-ASCII символы
+    raw = header.encode('utf-8').decode('latin-1')
+    with app.test_request_context('/', headers={HEADER: raw}):
+        assert profiler._requested() is requested
+
+
+def test_profile_header_without_token(app, monkeypatch):
+    monkeypatch.setattr(profiler, 'token', None)
+    with app.test_request_context('/', headers={HEADER: 'anything'}):
+        assert profiler._requested() is False
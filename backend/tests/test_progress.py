@@ -0,0 +1,60 @@
+"""
+Упакованный прогресс: тот же прогресс, что и в строках таблиц
+"""
+import pytest
+
+from services.progress import PACKED, RELATIONAL, Progress, progress_store
+
+
+def test_progress_roundtrip():
+    progress = Progress()
+    progress.set_level(1, 12)
+    progress.set_level(3, 70000)
+    progress.set_level(5, 0)
+    progress.add_achievement(1)
+    progress.add_achievement(40)
+    progress.add_skin(2)
+
+    decoded = Progress.decode(progress.encode())
+    assert decoded.levels == [12, 0, 70000]  # Нули в конце не хранятся
+    assert [decoded.level(i) for i in range(1, 7)] == [12, 0, 70000, 0, 0, 0]
+    assert decoded.has_achievement(40) and not decoded.has_achievement(2)
+    assert decoded.owns_skin(2) and not decoded.owns_skin(1)
+    assert Progress.decode(None).levels == []
+
+
+def test_unknown_format_version_is_rejected():
+    blob = bytearray(Progress().encode())
+    blob[0] += 1
+    with pytest.raises(ValueError):
+        Progress.decode(bytes(blob))
+
+
+def progress_of(state):
+    """Прогресс в ответе /state без времени получения (упакованный режим его не хранит)"""
+    return (
+        [(u['upgrade_id'], u['level'], u['current_cost']) for u in state['upgrades']],
+        [a['achievement_id'] for a in state['achievements']],
+        state['skins'], state['active_skin'], state['per_second'], state['score'],
+    )
+
+
+def test_player_keeps_progress_across_storage_modes(app, client, flush, monkeypatch):
+    client.post('/api/user/click', json={'clickPower': 5000})
+    client.post('/api/upgrades/buy', json={'name': 'Курсор', 'quantity': 4})
+    client.post('/api/upgrades/buy', json={'name': 'Бабушка'})
+    client.post('/api/skins/buy', json={'skin_id': 2})
+    client.post('/api/skins/activate', json={'skin_id': 2})
+    flush()
+    relational = progress_of(client.get('/api/user/state').get_json())
+
+    # Первый запрос в упакованном режиме переводит игрока, дальше он играет там
+    monkeypatch.setattr(progress_store, 'mode', PACKED)
+    assert progress_of(client.get('/api/user/state').get_json()) == relational
+    bought = client.post('/api/upgrades/buy', json={'name': 'Курсор'}).get_json()
+    assert bought['upgrade']['level'] == 5
+    flush()
+    packed = progress_of(client.get('/api/user/state').get_json())
+
+    monkeypatch.setattr(progress_store, 'mode', RELATIONAL)
+    assert progress_of(client.get('/api/user/state').get_json()) == packed
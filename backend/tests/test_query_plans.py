@@ -0,0 +1,85 @@
+"""
+Планы запросов горячего пути: SQL, который выполняют маршруты,
+использует индексы (user_id, name), а не просматривает таблицы целиком
+"""
+import re
+
+import pytest
+
+from conftest import capture_sql, selects, user_id_of
+from models import db
+from services.user_cache import user_cache
+
+TABLES = ('upgrades', 'achievements', 'skins')
+
+
+def explain(app, statement, parameters):
+    """Шаги EXPLAIN QUERY PLAN выполненного запроса"""
+    with app.app_context(), db.engine.connect() as conn:
+        rows = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).all()
+    return [row[-1] for row in rows]
+
+
+def table_of(statement):
+    match = re.search(r'\bFROM (\w+)', statement)
+    return match.group(1) if match else None
+
+
+def assert_indexed(app, statements):
+    """
+        Каждый SELECT по таблицам прогресса идет по индексу (user_id, name)
+        или по первичному ключу
+        Returns:
+            int: Сколько запросов использовали индекс (user_id, name)
+    """
+    by_index = 0
+    for statement, parameters in selects(statements):
+        table = table_of(statement)
+        if table not in TABLES:
+            continue
+        plan = explain(app, statement, parameters)
+        assert not any(step.startswith('SCAN') for step in plan), (statement, plan)
+        if any(f'ix_{table}_user_id_name' in step for step in plan):
+            by_index += 1
+        else:
+            assert any('USING INTEGER PRIMARY KEY' in step for step in plan), (statement, plan)
+    return by_index
+
+
+def test_user_lookup_uses_primary_key(app, client):
+    user_cache.forget(user_id_of(client))
+    with capture_sql() as statements:
+        client.get('/api/user/state')
+
+    lookups = [s for s in selects(statements) if table_of(s[0]) == 'users']
+    assert lookups
+    for statement, parameters in lookups:
+        plan = explain(app, statement, parameters)
+        assert any('USING INTEGER PRIMARY KEY' in step for step in plan), (statement, plan)
+
+
+def test_state_snapshot_uses_user_name_indexes(app, client):
+    client.post('/api/user/click', json={'clickPower': 200})
+    client.post('/api/upgrades/buy', json={'name': 'Курсор'})
+    user_cache.forget(user_id_of(client))
+
+    with capture_sql() as statements:
+        client.get('/api/user/state')
+    assert assert_indexed(app, statements) > 0
+
+
+@pytest.mark.parametrize('setup, path, body', [
+    ([], '/api/upgrades/buy', {'name': 'Курсор'}),
+    ([], '/api/skins/buy', {'skin_id': 2}),
+    ([('/api/skins/buy', {'skin_id': 2})], '/api/skins/activate', {'skin_id': 2}),
+])
+def test_purchases_use_user_name_indexes(app, client, setup, path, body):
+    client.post('/api/user/click', json={'clickPower': 2000})
+    for setup_path, setup_body in setup:
+        client.post(setup_path, json=setup_body)
+    user_cache.forget(user_id_of(client))
+
+    with capture_sql() as statements:
+        response = client.post(path, json=body)
+    assert response.status_code == 200, response.get_json()
+    assert assert_indexed(app, statements) > 0
@@ -0,0 +1,49 @@
+"""
+Нет потерянных обновлений счета: малая версия benchmarks.score_stress
+
+Шестнадцать процессов приложения играют за одного игрока на общей базе,
+затем журнал подтвержденных операций сверяется с базой. Запуск - в
+отдельном процессе: benchmarks.score_stress создает приложение для своей
+базы при импорте app.
+"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import BACKEND_DIR
+
+RUN = '''
+import json
+from benchmarks.score_stress import run
+checks, total, elapsed = run({workers}, {operations}, seed={seed}, progress_storage={storage!r})
+print(json.dumps({{
+    name: [sorted(value) if isinstance(value, set) else value for value in pair]
+    for name, pair in checks.items()
+}}, sort_keys=True))
+print(json.dumps({{'conflicts': total['conflicts'], 'errors': total['errors']}}))
+'''
+
+
+def score_stress(workers, operations, seed, storage):
+    env = {key: value for key, value in os.environ.items() if key != 'DATABASE_URL'}
+    code = RUN.format(workers=workers, operations=operations, seed=seed, storage=storage)
+    result = subprocess.run(
+        [sys.executable, '-c', code],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=300,
+    )
+    assert result.returncode == 0, result.stderr
+    checks, total = result.stdout.strip().splitlines()[-2:]
+    return json.loads(checks), json.loads(total)
+
+
+@pytest.mark.parametrize('storage', ['relational', 'packed'])
+def test_concurrent_workers_lose_no_updates(storage):
+    checks, total = score_stress(workers=16, operations=20, seed=7, storage=storage)
+
+    assert total['errors'] == 0
+    for name in ('score', 'levels', 'per_second', 'skins', 'skins bought once'):
+        actual, expected = checks[name]
+        assert actual == expected, name
@@ -0,0 +1,139 @@
+"""
+Шардирование: игрок со всем прогрессом живет в файле своего шарда
+
+Приложение с SHARD_COUNT = 3 запускается в отдельном процессе (настройки
+читаются при импорте app), результат возвращается JSON'ом.
+"""
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+from conftest import BACKEND_DIR
+
+PLAY = '''
+import json
+from app import app
+from services.click_buffer import click_buffer
+from services.shards import shards
+
+clients = {}
+for _ in range(6):
+    client = app.test_client()
+    user_id = client.get('/api/user/state').get_json()['user_id']
+    client.post('/api/user/click', json={'clickPower': 300})
+    client.post('/api/upgrades/buy', json={'name': 'Курсор', 'quantity': 2})
+    clients[user_id] = client
+click_buffer.flush()
+
+def state(client):
+    data = client.get('/api/user/state').get_json()
+    return [data['score'], [(u['upgrade_id'], u['level']) for u in data['upgrades']],
+            sorted(a['achievement_id'] for a in data['achievements'])]
+
+with app.app_context():
+    home = {user_id: shards.shard_for(user_id) for user_id in clients}
+    total = shards.count_users()
+    moved_id = min(clients)
+    before = state(clients[moved_id])
+    target = (home[moved_id] + 1) % shards.count
+    moved = shards.move_bucket(shards.bucket(moved_id), target)
+    after = state(clients[moved_id])
+    print(json.dumps({'home': home, 'total': total, 'moved_id': moved_id, 'target': target,
+                      'moved': moved, 'before': before, 'after': after}))
+'''
+
+
+# Сбой после смены карты, до удаления строк из старого шарда, и повтор
+RERUN = '''
+import json
+from app import app
+from services.click_buffer import click_buffer
+from services.shards import shards
+
+client = app.test_client()
+user_id = client.get('/api/user/state').get_json()['user_id']
+client.post('/api/user/click', json={'clickPower': 300})
+client.post('/api/upgrades/buy', json={'name': 'Курсор', 'quantity': 2})
+click_buffer.flush()
+
+with app.app_context():
+    source = shards.shard_for(user_id)
+    target = (source + 1) % shards.count
+    bucket = shards.bucket(user_id)
+    delete_bucket = shards._delete_bucket
+
+    def crash(*args, **kwargs):
+        raise RuntimeError('crashed before cleanup')
+
+    shards._delete_bucket = crash
+    try:
+        shards.move_bucket(bucket, target)
+    except RuntimeError:
+        pass
+    shards._delete_bucket = delete_bucket
+    moved = shards.move_bucket(bucket, target)
+print(json.dumps({'user_id': user_id, 'source': source, 'target': target, 'moved': moved}))
+'''
+
+
+def shard_path(tmp_path, shard):
+    return tmp_path / ('game.db' if shard == 0 else f'game-shard{shard}.db')
+
+
+def user_rows(tmp_path, shard, table, user_id):
+    con = sqlite3.connect(shard_path(tmp_path, shard))
+    try:
+        return con.execute(f'SELECT COUNT(*) FROM {table} WHERE user_id = ?', (user_id,)).fetchone()[0]
+    finally:
+        con.close()
+
+
+def test_players_live_in_their_shard_and_move_with_progress(tmp_path):
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{shard_path(tmp_path, 0)}",
+               SHARD_COUNT='3', ADMISSION_CONTROL='0')
+    result = subprocess.run(
+        [sys.executable, '-c', PLAY],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=120,
+    )
+    assert result.returncode == 0, result.stderr
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    home = {int(user_id): shard for user_id, shard in report['home'].items()}
+    moved_id = report['moved_id']
+
+    # Новые игроки раскладываются по всем шардам, сумма - по scatter
+    assert set(home.values()) == {0, 1, 2}
+    assert report['total'] == 6
+    for user_id, shard in home.items():
+        if user_id == moved_id:
+            continue
+        for other in range(3):
+            expected = 1 if other == shard else 0
+            assert user_rows(tmp_path, other, 'users', user_id) == expected
+            assert user_rows(tmp_path, other, 'upgrades', user_id) == expected
+
+    # Перенос корзины: строки в новом шарде, прогресс у игрока тот же
+    assert report['moved'] >= 1
+    assert user_rows(tmp_path, report['target'], 'users', moved_id) == 1
+    assert user_rows(tmp_path, home[moved_id], 'users', moved_id) == 0
+    assert user_rows(tmp_path, report['target'], 'upgrades', moved_id) == 1
+    assert report['after'][1:] == report['before'][1:]
+    assert report['after'][0] >= report['before'][0]
+
+
+def test_rerun_after_crash_removes_rows_left_in_the_old_shard(tmp_path):
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{shard_path(tmp_path, 0)}",
+               SHARD_COUNT='3', ADMISSION_CONTROL='0')
+    result = subprocess.run(
+        [sys.executable, '-c', RERUN],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=120,
+    )
+    assert result.returncode == 0, result.stderr
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    user_id, source, target = report['user_id'], report['source'], report['target']
+
+    assert report['moved'] == 0  # Карта уже указывала на target
+    for table in ('users', 'upgrades'):
+        assert user_rows(tmp_path, source, table, user_id) == 0
+        assert user_rows(tmp_path, target, table, user_id) == 1
@@ -0,0 +1,45 @@
+"""
+Снимок состояния игрока: /api/user/state за фиксированное число запросов
+"""
+from conftest import capture_sql, selects, user_id_of
+from services.user_cache import user_cache
+
+
+def buy_progress(client):
+    client.post('/api/user/click', json={'clickPower': 2000})
+    client.post('/api/upgrades/buy', json={'name': 'Курсор', 'quantity': 2})
+    client.post('/api/skins/buy', json={'skin_id': 2})
+
+
+def test_state_loads_progress_in_one_statement(app, client):
+    buy_progress(client)
+    client.get('/api/user/state')  # Пользователь в кэше горячих
+
+    with capture_sql() as statements:
+        state = client.get('/api/user/state').get_json()
+    assert len(selects(statements)) == 1, statements
+    assert 'UNION ALL' in selects(statements)[0][0]
+
+    assert [(u['upgrade_id'], u['level']) for u in state['upgrades']] == [(1, 2)]
+    assert state['skins'] == [1, 2]
+    assert state['achievements']
+
+
+def test_state_without_cached_user_adds_one_lookup(app, client):
+    buy_progress(client)
+    user_cache.forget(user_id_of(client))
+
+    with capture_sql() as statements:
+        client.get('/api/user/state')
+    assert len(selects(statements)) == 2, statements
+
+
+def test_state_of_new_player_has_no_progress_rows(app):
+    client = app.test_client()
+    client.get('/api/user/state')
+    client.get('/api/user/state')
+
+    with capture_sql() as statements:
+        state = client.get('/api/user/state').get_json()
+    assert len(selects(statements)) == 1, statements
+    assert state['upgrades'] == [] and state['skins'] == [1]
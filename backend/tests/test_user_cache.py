@@ -0,0 +1,21 @@
+"""
+Кэш горячих пользователей: снимок не переживает запись пользователя
+"""
+from conftest import capture_sql, user_id_of
+from models import db, User
+
+
+def test_version_only_change_invalidates_snapshot(app, client):
+    user_id = user_id_of(client)
+
+    # Клик разблокирует достижения: меняется только state_version
+    client.post('/api/user/click', json={'clickPower': 2000})
+    with app.app_context():
+        assert db.session.get(User, user_id).state_version > 0
+
+    # Списание сверяет версию снимка с базой: без конфликта и повтора
+    with capture_sql() as statements:
+        response = client.post('/api/skins/buy', json={'skin_id': 2})
+    assert response.status_code == 200
+    charges = [s for s, _ in statements if s.startswith('UPDATE users')]
+    assert len(charges) == 1